@@ -46,13 +46,27 @@ ASSETS_LOAD_URL = '/'
 SKYLINES_FILES_PATH = os.path.join(base, 'htdocs', 'files')
 SKYLINES_ELEVATION_PATH = os.path.join(base, 'htdocs', 'srtm')
 
+# number of raster cells in the elevation cache of the live tracking
+SKYLINES_ELEVATION_CACHE_SIZE = 100000
+
+# sample the SRTM files in SKYLINES_ELEVATION_PATH instead of querying
+# the elevations table (requires GDAL)
+SKYLINES_ELEVATION_FROM_FILES = False
+
 SKYLINES_TEMPORARY_DIR = '/tmp'
 
+# the daily partitions of the live tracking fixes are written to this
+# directory before "tracking drop-partitions" drops them (None disables it)
+SKYLINES_TRACKING_ARCHIVE_PATH = os.path.join(base, 'htdocs', 'tracking')
+
 # how many entries should a list have?
 SKYLINES_LISTS_DISPLAY_LENGTH = 50
 
 SKYLINES_MAP_TILE_URL = 'https://www.skylines-project.org/mapproxy'
 
+# Redis instance used to notify the tracking daemon and the web processes
+SKYLINES_PUBSUB_URL = 'redis://localhost:6379/0'
+
 BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERYD_LOG_LEVEL = 'INFO'
@@ -5,3 +5,5 @@ TESTING = True
 SQLALCHEMY_DATABASE_URI = 'postgresql:///skylines_test'
 SQLALCHEMY_ECHO = True
 SKYLINES_FILES_PATH = '/tmp/skylines-uploads'
+SKYLINES_TRACKING_ARCHIVE_PATH = '/tmp/skylines-tracking'
+SKYLINES_PUBSUB_URL = None
@@ -0,0 +1,29 @@
+# revision identifiers, used by Alembic.
+revision = '3a1ab5f8c2d4'
+down_revision = '1d8eda758ba6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('tracking_latest',
+                    sa.Column('pilot_id', sa.Integer(), nullable=False),
+                    sa.Column('fix_id', sa.Integer(), nullable=False),
+                    sa.Column('time', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['pilot_id'], ['users.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('pilot_id')
+                    )
+
+    # fill the table with the latest fix with location of every pilot
+    op.execute('''
+        INSERT INTO tracking_latest (pilot_id, fix_id, time)
+        SELECT DISTINCT ON (pilot_id) pilot_id, id, time
+        FROM tracking_fixes
+        WHERE location IS NOT NULL
+        ORDER BY pilot_id, time DESC
+    ''')
+
+
+def downgrade():
+    op.drop_table('tracking_latest')
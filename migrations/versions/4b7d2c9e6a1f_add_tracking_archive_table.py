@@ -0,0 +1,26 @@
+# revision identifiers, used by Alembic.
+revision = '4b7d2c9e6a1f'
+down_revision = '3a1ab5f8c2d4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('tracking_archive',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('pilot_id', sa.Integer(), nullable=False),
+                    sa.Column('start_time', sa.DateTime(), nullable=False),
+                    sa.Column('end_time', sa.DateTime(), nullable=False),
+                    sa.Column('num_fixes', sa.Integer(), nullable=False),
+                    sa.Column('data', sa.LargeBinary(), nullable=False),
+                    sa.ForeignKeyConstraint(['pilot_id'], ['users.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+    op.create_index('tracking_archive_pilot_time', 'tracking_archive', ['pilot_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('tracking_archive_pilot_time', table_name='tracking_archive')
+    op.drop_table('tracking_archive')
@@ -0,0 +1,34 @@
+# revision identifiers, used by Alembic.
+revision = '5c3e8f1a9b7d'
+down_revision = '4b7d2c9e6a1f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('tracking_sessions', sa.Column('time_first_fix', sa.DateTime(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('time_last_fix', sa.DateTime(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('num_fixes', sa.Integer(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('min_latitude', sa.Float(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('max_latitude', sa.Float(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('min_longitude', sa.Float(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('max_longitude', sa.Float(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('min_altitude', sa.SmallInteger(), nullable=True))
+    op.add_column('tracking_sessions', sa.Column('max_altitude', sa.SmallInteger(), nullable=True))
+
+    op.create_index('tracking_sessions_pilot_first_fix', 'tracking_sessions', ['pilot_id', 'time_first_fix'])
+
+
+def downgrade():
+    op.drop_index('tracking_sessions_pilot_first_fix', table_name='tracking_sessions')
+
+    op.drop_column('tracking_sessions', 'max_altitude')
+    op.drop_column('tracking_sessions', 'min_altitude')
+    op.drop_column('tracking_sessions', 'max_longitude')
+    op.drop_column('tracking_sessions', 'min_longitude')
+    op.drop_column('tracking_sessions', 'max_latitude')
+    op.drop_column('tracking_sessions', 'min_latitude')
+    op.drop_column('tracking_sessions', 'num_fixes')
+    op.drop_column('tracking_sessions', 'time_last_fix')
+    op.drop_column('tracking_sessions', 'time_first_fix')
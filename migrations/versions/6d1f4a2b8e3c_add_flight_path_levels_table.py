@@ -0,0 +1,31 @@
+# revision identifiers, used by Alembic.
+revision = '6d1f4a2b8e3c'
+down_revision = '5c3e8f1a9b7d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('flight_path_levels',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('flight_id', sa.Integer(), nullable=False),
+                    sa.Column('threshold', sa.Float(), nullable=False),
+                    sa.Column('max_points', sa.Integer(), nullable=False),
+                    sa.Column('start_time', sa.DateTime(), nullable=False),
+                    sa.Column('end_time', sa.DateTime(), nullable=False),
+                    sa.Column('locations', sa.String(), nullable=False),
+                    sa.Column('levels', sa.String(), nullable=False),
+                    sa.Column('times', sa.String(), nullable=False),
+                    sa.Column('altitude', sa.String(), nullable=False),
+                    sa.Column('enl', sa.String(), nullable=False),
+                    sa.ForeignKeyConstraint(['flight_id'], ['flights.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+    op.create_index('flight_path_levels_flight', 'flight_path_levels', ['flight_id', 'threshold', 'max_points'])
+
+
+def downgrade():
+    op.drop_index('flight_path_levels_flight', table_name='flight_path_levels')
+    op.drop_table('flight_path_levels')
@@ -0,0 +1,139 @@
+from flask.ext.script import Command, Option
+
+import traceback
+from datetime import timedelta
+from time import time
+
+from skylines.commands.pool import create_pool
+from skylines.model import db
+
+
+def _process_batch(args):
+    """Processes a batch of records in a worker process."""
+
+    command_class, ids = args
+    command = command_class()
+
+    try:
+        return command.apply_and_commit(command.do, command.get_batch(ids))
+    except Exception:
+        traceback.print_exc()
+        db.session.rollback()
+        return 0, len(ids)
+    finally:
+        db.session.expunge_all()
+
+
+class BatchCommand(Command):
+    """
+    Base class of the maintenance commands that process many records of
+    ``model`` with ``do()``.
+
+    The records are read in batches of increasing primary keys, so that
+    every batch is an index lookup and records that change while the
+    command is running are neither skipped nor processed twice. Every
+    batch is committed separately.
+    """
+
+    model = None
+
+    batch_options = (
+        Option('--batch-size', type=int, default=10,
+               help='number of records that are committed together'),
+        Option('--jobs', '-j', type=int, default=1,
+               help='number of worker processes'),
+        Option('--dry-run', action='store_true',
+               help='only count the records that would be processed'),
+    )
+
+    def do(self, record):
+        """Processes a record and returns True if it was successful."""
+
+        raise NotImplementedError
+
+    def options(self, q):
+        """Adds loader options to the queries of the records."""
+
+        return q
+
+    def get_batch(self, ids):
+        q = self.options(self.model.query()) \
+            .filter(self.model.id.in_(ids)) \
+            .order_by(self.model.id)
+
+        return q.all()
+
+    def apply_and_commit(self, func, q):
+        n_success, n_failed = 0, 0
+        for record in q:
+            if func(record):
+                n_success += 1
+            else:
+                n_failed += 1
+
+        if n_success > 0:
+            db.session.commit()
+
+        return n_success, n_failed
+
+    def iter_batches(self, q, batch_size):
+        """Yields the primary keys of the records of ``q`` in batches."""
+
+        id_column = self.model.id
+        q = q.with_entities(id_column).order_by(id_column)
+
+        last_id = None
+        while True:
+            batch_q = q if last_id is None else q.filter(id_column > last_id)
+            ids = [id for id, in batch_q.limit(batch_size)]
+            if not ids:
+                break
+
+            yield ids
+            last_id = ids[-1]
+
+    def run_batches(self, q, batch_size=10, jobs=1, dry_run=False):
+        """
+        Processes the records of the query ``q`` in batches of
+        ``batch_size`` records, using ``jobs`` worker processes.
+        """
+
+        total = q.order_by(None).count()
+        if dry_run:
+            print '{} records would be processed'.format(total)
+            return
+
+        batches = self.iter_batches(q, batch_size)
+
+        if jobs > 1:
+            # the batches are handed to the workers by a thread of the
+            # pool, which can't use the database session
+            batches = list(batches)
+
+            pool = create_pool(jobs)
+            results = pool.imap_unordered(
+                _process_batch, ((self.__class__, ids) for ids in batches))
+        else:
+            pool = None
+            results = (self.apply_and_commit(self.do, self.get_batch(ids))
+                       for ids in batches)
+
+        start = time()
+        n_success, n_failed = 0, 0
+        for success, failed in results:
+            n_success += success
+            n_failed += failed
+
+            self.print_progress(n_success + n_failed, n_failed, total,
+                                time() - start)
+
+        if pool:
+            pool.close()
+            pool.join()
+
+    def print_progress(self, n, n_failed, total, duration):
+        rate = n / duration if duration > 0 else 0
+        eta = timedelta(seconds=int((total - n) / rate)) if rate else '?'
+
+        print '{}/{} records ({} failed), {:.1f} records/s, ETA {}'.format(
+            n, total, n_failed, rate, eta)
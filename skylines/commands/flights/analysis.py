@@ -2,66 +2,51 @@ from flask.ext.script import Command, Option
 
 from flask import current_app
 from sqlalchemy.orm import joinedload
+from skylines.commands.batch import BatchCommand
 from skylines.model import db, Flight
 from skylines.lib.xcsoar_ import analyse_flight
 from skylines.worker import tasks
 from datetime import datetime
 
 
-class Analyze(Command):
+class Analyze(BatchCommand):
     """ (Re)analyze flights """
 
+    model = Flight
+
     option_list = (
         Option('--force', action='store_true',
-               help='re-analyse all flights, not just the scheduled ones'),
+               help='re-analyse all flights, not just the scheduled ones; '
+                    'an interrupted run can be resumed by running the '
+                    'command again without --force'),
+    ) + BatchCommand.batch_options + (
         Option('ids', metavar='ID', nargs='*', type=int,
                help='Any number of flight IDs.'),
     )
 
-    def run(self, force, ids):
-        if force:
+    def run(self, force, ids, **kw):
+        if force and not kw.get('dry_run'):
             # invalidate all results
             db.session.query(Flight).update({'needs_analysis': True})
 
-        q = db.session.query(Flight)
-        q = q.options(joinedload(Flight.igc_file))
-        q = q.order_by(Flight.id)
+            # the flights are analyzed in other transactions
+            db.session.commit()
 
+        q = db.session.query(Flight)
         if ids:
-            self.apply_and_commit(self.do, q.filter(Flight.id.in_(ids)))
-        else:
-            self.incremental(self.do, q.filter(Flight.needs_analysis == True))
+            q = q.filter(Flight.id.in_(ids))
+        elif not force:
+            q = q.filter(Flight.needs_analysis == True)
+
+        self.run_batches(q, **kw)
+
+    def options(self, q):
+        return q.options(joinedload(Flight.igc_file))
 
     def do(self, flight):
         print flight.id
         return analyse_flight(flight)
 
-    def apply_and_commit(self, func, q):
-        n_success, n_failed = 0, 0
-        for record in q:
-            if func(record):
-                n_success += 1
-            else:
-                n_failed += 1
-
-        if n_success > 0:
-            print "commit"
-            db.session.commit()
-
-        return n_success, n_failed
-
-    def incremental(self, func, q):
-        """Repeatedly query 10 records and invoke the callback, commit
-        after each chunk."""
-        n = 10
-        offset = 0
-        while True:
-            n_success, n_failed = self.apply_and_commit(
-                func, q.offset(offset).limit(n))
-            if n_success == 0 and n_failed == 0:
-                break
-            offset += n_failed
-
 
 class AnalyzeDelayed(Command):
     """ Schedule flight reanalysis via celery worker """
@@ -0,0 +1,24 @@
+from multiprocessing import Pool
+
+from flask import current_app
+
+from skylines.model import db
+
+
+def _init_worker(app):
+    app.app_context().push()
+
+    # the database connections of the parent process must not be shared
+    db.engine.dispose()
+
+
+def create_pool(processes):
+    """
+    Returns a multiprocessing.Pool whose workers run inside the context of
+    the current application and use their own database connections.
+    """
+
+    db.session.close()
+    db.engine.dispose()
+
+    return Pool(processes, _init_worker, (current_app._get_current_object(),))
@@ -0,0 +1,70 @@
+from flask.ext.script import Command, Option
+
+from datetime import datetime, timedelta
+from sqlalchemy import distinct
+from skylines.model import db, TrackingFix, TrackingLatest, TrackingArchive
+from skylines.model.tracking import SESSION_GAP, split_sessions
+
+
+class Archive(Command):
+    """ Move finished live tracking sessions into the compact archive """
+
+    option_list = (
+        Option('--user', type=int,
+               help='only archive the sessions of this user ID'),
+        Option('--min-age', type=float, default=24,
+               help='minimum age of the archived fixes in hours'),
+    )
+
+    def run(self, user, min_age):
+        cutoff = datetime.utcnow() - max(timedelta(hours=min_age), SESSION_GAP)
+
+        if user is not None:
+            pilot_ids = [user]
+        else:
+            pilot_ids = [id for id, in db.session
+                         .query(distinct(TrackingFix.pilot_id))
+                         .filter(TrackingFix.time < cutoff)]
+
+        for pilot_id in pilot_ids:
+            num_sessions, num_fixes = self.archive(pilot_id, cutoff)
+            if num_sessions:
+                print 'Archived {} sessions with {} fixes of user {}' \
+                    .format(num_sessions, num_fixes, pilot_id)
+
+    def archive(self, pilot_id, cutoff):
+        query = TrackingFix.query(pilot_id=pilot_id) \
+            .filter(TrackingFix.time < cutoff) \
+            .order_by(TrackingFix.time)
+
+        sessions = list(split_sessions(query))
+
+        # the last session is not finished if it continues after the cutoff
+        if sessions:
+            end = sessions[-1][-1].time
+            continued = TrackingFix.query(pilot_id=pilot_id) \
+                .filter(TrackingFix.time > end) \
+                .filter(TrackingFix.time <= end + SESSION_GAP).first()
+
+            if continued:
+                sessions.pop()
+
+        num_fixes = 0
+        for fixes in sessions:
+            db.session.add(TrackingArchive.from_fixes(pilot_id, fixes))
+
+            TrackingFix.query(pilot_id=pilot_id) \
+                .filter(TrackingFix.time >= fixes[0].time) \
+                .filter(TrackingFix.time <= fixes[-1].time) \
+                .delete(synchronize_session=False)
+
+            TrackingLatest.query(pilot_id=pilot_id) \
+                .filter(TrackingLatest.time <= fixes[-1].time) \
+                .delete(synchronize_session=False)
+
+            num_fixes += len(fixes)
+
+        db.session.commit()
+        db.session.expunge_all()
+
+        return len(sessions), num_fixes
@@ -1,5 +1,5 @@
 from flask.ext.script import Command, Option
-from skylines.model import db, TrackingFix
+from skylines.model import db, TrackingFix, TrackingLatest
 
 
 class Clear(Command):
@@ -10,6 +10,7 @@ class Clear(Command):
     )
 
     def run(self, user):
+        TrackingLatest.query(pilot_id=user).delete()
         result = TrackingFix.query(pilot_id=user).delete()
         db.session.commit()
 
@@ -2,111 +2,206 @@ from flask.ext.script import Command, Option
 
 import hashlib
 import aerofiles.igc
-from datetime import timedelta
-from itertools import chain
-from collections import Counter
+from itertools import chain, groupby
+from collections import Counter, defaultdict
+from sqlalchemy import func
 
 from skylines.lib import base36
-from skylines.model import db, TrackingFix, User
+from skylines.commands.pool import create_pool
+from skylines.model import db, TrackingFix, TrackingArchive, User
+
+
+def _export_users(user_ids):
+    export = Export()
+    export.users = {}
+    export.logger_ids = {}
+
+    for user_id in user_ids:
+        export.export_sessions(user_id)
 
 
 class Export(Command):
     """ Export live tracks as IGC files """
 
     option_list = (
-        Option('user', type=int, help='a user ID'),
+        Option('user', type=int, nargs='?', help='a user ID'),
+        Option('--all-users', action='store_true',
+               help='export the live tracks of all users'),
+        Option('--jobs', '-j', type=int, default=1,
+               help='number of processes that export the users of '
+                    '--all-users in parallel'),
     )
 
     MANUFACTURER_CODE = 'SKY'
 
     flights = Counter()
 
-    def run(self, user):
-        self.user = User.get(user)
+    def run(self, user, all_users, jobs):
+        if user is None and not all_users:
+            print 'Please specify a user ID or --all-users.'
+            return
+
+        self.users = {}
+        self.logger_ids = {}
+
+        if all_users and jobs > 1:
+            self.export_parallel(jobs)
+        else:
+            self.export_sessions(None if all_users else user)
+
+    def export_parallel(self, jobs):
+        groups = self.group_by_logger_id(self.get_user_ids())
+
+        # the users of a logger id are exported by a single process, so
+        # that the flight numbers of their file names stay unique
+        pool = create_pool(jobs)
+        for _ in pool.imap_unordered(_export_users, groups):
+            pass
+
+        pool.close()
+        pool.join()
+
+    def get_user_ids(self):
+        """Returns the ids of the users with live fixes or archives."""
 
-        print 'Generating logger id...',
+        # Query.union() wraps the UNION in an aliased subquery, which
+        # PostgreSQL requires in the FROM clause
+        query = db.session.query(TrackingFix.pilot_id) \
+            .union(db.session.query(TrackingArchive.pilot_id))
+
+        return sorted(id for id, in query)
+
+    def group_by_logger_id(self, user_ids):
+        """
+        Returns the user ids in groups of users with the same logger id.
+        """
+
+        groups = defaultdict(list)
+        for user_id in user_ids:
+            groups[self.get_logger_id(user_id)].append(user_id)
+
+        return sorted(groups.values())
+
+    def get_logger_id(self, user_id):
         m = hashlib.md5()
-        m.update(str(user))
-        self.logger_id = base36.encode(int(m.hexdigest(), 16))[0:3]
-        print self.logger_id
-
-        self.export_sessions(user)
-
-    def get_base_query(self, user_id):
-        return db.session.query(TrackingFix) \
-            .filter_by(pilot_id=user_id) \
-            .order_by(TrackingFix.time)
-
-    def export_sessions(self, user_id):
-        fp = None
-        writer = None
-        last_fix = None
-        for fix in chain(self.get_base_query(user_id), [None]):
-            is_start = (last_fix is None)
-            is_end = (fix is None)
-
-            # check if this is a new live tracking session (dt > 3 hours)
-            dt = (fix.time - last_fix.time) if (fix and last_fix) else None
-            is_new_session = dt and dt > timedelta(hours=3)
-
-            # update current session
-            if not (is_start or is_new_session or is_end):
-                self.write_fix(writer, fix)
-
-            # save last_fix in session and append it to the session list
-            if last_fix and (is_end or is_new_session):
-                if fp:
-                    fp.close()
-
-            # start a new session
-            if fix and (is_start or is_new_session):
-                filename = self.get_filename(fix)
-                print 'Writing %s...' % filename
-
-                fp = open(filename, 'w')
-                writer = aerofiles.igc.Writer(fp)
-
-                headers = {
-                    'manufacturer_code': self.MANUFACTURER_CODE,
-                    'logger_id': self.logger_id,
-                    'date': fix.time,
-                    'pilot': self.user.name,
-                    'logger_type': 'SkyLines Live Tracking',
-                    'gps_receiver': 'Unknown',
-                }
-
-                if self.user.club_id:
-                    headers['club'] = self.user.club.name
-
-                writer.write_headers(headers)
-                self.write_fix(writer, fix)
-
-            last_fix = fix
-
-    def get_flight_number(self, date):
-        key = date.strftime('%Y-%m-%d')
+        m.update(str(user_id))
+        return base36.encode(int(m.hexdigest(), 16))[0:3]
+
+    def get_user(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = User.get(user_id)
+
+            print 'Generating logger id...',
+            self.logger_ids[user_id] = self.get_logger_id(user_id)
+            print self.logger_ids[user_id]
+
+        return user
+
+    def get_archives(self, user_id=None):
+        query = TrackingArchive.query() \
+            .order_by(TrackingArchive.pilot_id, TrackingArchive.start_time)
+
+        if user_id is not None:
+            query = query.filter_by(pilot_id=user_id)
+
+        return query.execution_options(stream_results=True).yield_per(100)
+
+    def get_fixes(self, user_id=None):
+        """
+        Returns the pilot and time ordered fixes with the columns needed
+        for the export and their session number, streamed from a
+        server-side cursor.
+        """
+
+        fixes = TrackingFix.get_numbered_fixes(user_id, columns=[
+            func.ST_Y(TrackingFix.location_wkt).label('latitude'),
+            func.ST_X(TrackingFix.location_wkt).label('longitude'),
+            TrackingFix.altitude,
+        ])
+
+        query = db.session.query(
+            fixes.c.pilot_id, fixes.c.session, fixes.c.time,
+            fixes.c.latitude, fixes.c.longitude, fixes.c.altitude) \
+            .order_by(fixes.c.pilot_id, fixes.c.time)
+
+        return query.execution_options(stream_results=True).yield_per(1000)
+
+    def export_sessions(self, user_id=None):
+        # archived sessions are always older than the remaining fixes
+        for archive in self.get_archives(user_id):
+            self.write_session(archive.pilot_id, archive.fixes)
+
+        # the sessions are numbered by the database in the same statement
+        # that streams the fixes, so that both see the same fixes
+        sessions = groupby(self.get_fixes(user_id),
+                           lambda fix: (fix.pilot_id, fix.session))
+
+        for (pilot_id, _), fixes in sessions:
+            self.write_session(pilot_id, fixes)
+
+    def write_session(self, user_id, fixes):
+        user = self.get_user(user_id)
+
+        fixes = iter(fixes)
+        first_fix = next(fixes, None)
+        if first_fix is None:
+            return
+
+        filename = self.get_filename(user_id, first_fix)
+        print 'Writing %s...' % filename
+
+        with open(filename, 'w') as fp:
+            writer = aerofiles.igc.Writer(fp)
+
+            headers = {
+                'manufacturer_code': self.MANUFACTURER_CODE,
+                'logger_id': self.logger_ids[user_id],
+                'date': first_fix.time,
+                'pilot': user.name,
+                'logger_type': 'SkyLines Live Tracking',
+                'gps_receiver': 'Unknown',
+            }
+
+            if user.club_id:
+                headers['club'] = user.club.name
+
+            writer.write_headers(headers)
+
+            # the B records are formatted here, which is a lot faster
+            # than aerofiles.igc.Writer.write_fix()
+            fp.writelines(self.format_fix(fix)
+                          for fix in chain([first_fix], fixes))
+
+    def get_flight_number(self, logger_id, date):
+        key = (logger_id, date.strftime('%Y-%m-%d'))
         self.flights[key] += 1
         return self.flights[key]
 
-    def get_filename(self, fix):
-        flight_number = self.get_flight_number(fix.time)
+    def get_filename(self, user_id, fix):
+        logger_id = self.logger_ids[user_id]
+        flight_number = self.get_flight_number(logger_id, fix.time)
         date = fix.time.strftime('%Y-%m-%d')
         filename = '%s-%s-%s-%02d.igc' % (
-            date, self.MANUFACTURER_CODE, self.logger_id, flight_number,
+            date, self.MANUFACTURER_CODE, logger_id, flight_number,
         )
 
         return filename
 
-    def write_fix(self, writer, fix):
-        location = fix.location
+    def format_fix(self, fix):
+        record = fix.time.strftime('B%H%M%S')
 
-        f = dict(time=fix.time)
-        if location:
-            f['latitude'] = location.latitude
-            f['longitude'] = location.longitude
-            f['valid'] = True
+        if fix.latitude is not None and fix.longitude is not None:
+            record += self.format_coordinate(fix.latitude, 'NS', 2) + \
+                self.format_coordinate(fix.longitude, 'EW', 3) + 'A'
+        else:
+            record += '0000000N00000000EV'
 
-        if fix.altitude is not None:
-            f['pressure_alt'] = f['gps_alt'] = fix.altitude
+        altitude = fix.altitude or 0
+        return record + '%05d%05d\r\n' % (altitude, altitude)
 
-        writer.write_fix(**f)
+    def format_coordinate(self, value, hemispheres, digits):
+        milliminutes = int(round(abs(value) * 60000))
+        degrees, milliminutes = divmod(milliminutes, 60000)
+        hemisphere = hemispheres[value < 0]
+        return '%0*d%05d%s' % (digits, degrees, milliminutes, hemisphere)
@@ -0,0 +1,179 @@
+from flask.ext.script import Command, Option
+
+import os
+import sys
+import urllib2
+from skylines.model import db, User
+from skylines.tracking.loadtest import LoadStatistics, LoadClient, LoadGenerator
+
+
+class LoadTest(Command):
+    """ Simulate many live tracking clients against a running daemon """
+
+    option_list = (
+        Option('--host', default='127.0.0.1', help='address of the daemon'),
+        Option('--port', type=int, default=5597, help='port of the daemon'),
+        Option('--pilots', type=int, default=1000,
+               help='number of simulated pilots'),
+        Option('--interval', type=float, default=1.,
+               help='seconds between the fixes of each pilot'),
+        Option('--duration', type=float, default=60.,
+               help='duration of the test in seconds'),
+        Option('--sockets', type=int, default=64,
+               help='number of client sockets'),
+        Option('--traffic-ratio', type=float, default=0.1,
+               help='fraction of packets that are traffic requests'),
+        Option('--ping-ratio', type=float, default=0.05,
+               help='fraction of packets that are pings'),
+        Option('--bad-crc-ratio', type=float, default=0.,
+               help='fraction of fixes sent with a broken CRC'),
+        Option('--bad-key-ratio', type=float, default=0.,
+               help='fraction of packets sent with an unknown tracking key'),
+        Option('--create-users', action='store_true',
+               help='create users for the pilots if there are not enough'),
+        Option('--stats-port', type=int,
+               help='metrics port of the daemon (see "tracking server '
+                    '--stats-port") to report what happened to the fixes'),
+        Option('--workers', type=int, default=1,
+               help='number of worker processes of the daemon'),
+        Option('--json', action='store_true', help='enable JSON output'),
+    )
+
+    def run(self, host, port, pilots, interval, duration, sockets,
+            traffic_ratio, ping_ratio, bad_crc_ratio, bad_key_ratio,
+            create_users, stats_port, workers, json):
+
+        # every pilot needs its own key, otherwise the rate limits and the
+        # duplicate filter of the daemon would drop most of the fixes
+        keys = self.get_keys(pilots)
+        if len(keys) < pilots:
+            if not create_users:
+                print 'Only {} users with tracking keys found, use ' \
+                      '--create-users to create the missing ones.' \
+                      .format(len(keys))
+                sys.exit(1)
+
+            self.create_users(pilots - len(keys))
+            keys = self.get_keys(pilots)
+
+        # don't keep a transaction open during the test
+        db.session.rollback()
+
+        # all pilots send from the address of the load test, so the daemon
+        # should run with --ip-rate 0
+        metrics = None
+        if stats_port:
+            metrics = self.get_metrics(host, stats_port, workers)
+
+        from twisted.internet import reactor, task
+
+        stats = LoadStatistics()
+
+        clients = []
+        for i in range(min(sockets, pilots)):
+            client = LoadClient(stats, (host, port))
+            reactor.listenUDP(0, client)
+            clients.append(client)
+
+        generator = LoadGenerator(
+            clients, keys, interval=interval,
+            traffic_ratio=traffic_ratio, ping_ratio=ping_ratio,
+            bad_crc_ratio=bad_crc_ratio, bad_key_ratio=bad_key_ratio)
+
+        sender = task.LoopingCall(generator.tick)
+        sender.start(0.005)
+
+        if not json:
+            task.LoopingCall(self.print_progress, stats).start(5, now=False)
+
+        def stop():
+            sender.stop()
+
+            # wait a moment for the last replies
+            reactor.callLater(1, reactor.stop)
+
+        reactor.callLater(duration, stop)
+        reactor.run()
+
+        if metrics:
+            for before, after in zip(
+                    metrics, self.get_metrics(host, stats_port, workers)):
+                stats.add_daemon_metrics(before, after)
+
+        summary = stats.summary()
+        if json:
+            from flask import json
+            print json.dumps(summary)
+        else:
+            self.print_summary(summary)
+
+    def get_keys(self, limit):
+        query = db.session.query(User.tracking_key) \
+            .group_by(User.tracking_key) \
+            .order_by(db.func.min(User.id)) \
+            .limit(limit)
+
+        return [key for key, in query]
+
+    def get_metrics(self, host, stats_port, workers):
+        """Returns the metrics snapshots of the daemon workers."""
+
+        from flask import json
+
+        return [json.load(urllib2.urlopen(
+                'http://{}:{}/'.format(host, stats_port + index)))
+                for index in range(workers)]
+
+    def create_users(self, count):
+        print 'Creating {} users for the load test ...'.format(count)
+
+        for i in range(count):
+            user = User()
+            user.first_name = u'Load test'
+            user.last_name = u'Pilot {}'.format(i + 1)
+            user.password = os.urandom(16).encode('hex').decode('ascii')
+            db.session.add(user)
+
+        db.session.commit()
+
+    def print_progress(self, stats):
+        summary = stats.summary()
+        print '{sent} packets sent ({packets_per_second:.0f}/s), {replies} of {expected_replies} replies received'.format(**summary)
+        sys.stdout.flush()
+
+    def print_summary(self, summary):
+        print
+        print 'Duration: {:.1f} s'.format(summary['duration'])
+        print 'Packets sent: {} ({:.0f} packets/s)'.format(
+            summary['sent'], summary['packets_per_second'])
+
+        for type, count in sorted(summary['sent_by_type'].items()):
+            print '  {}: {}'.format(type, count)
+
+        print 'Replies: {} of {}'.format(
+            summary['replies'], summary['expected_replies'])
+
+        if summary['drop_rate'] is not None:
+            print 'Drop rate: {:.2%}'.format(summary['drop_rate'])
+
+        self.print_latency('ACK latency', summary['ack_latency'])
+        self.print_latency('Traffic response latency',
+                           summary['traffic_latency'])
+
+        daemon = summary['daemon']
+        if daemon is not None:
+            print 'Daemon: {received} fixes queued, {written} written, ' \
+                  '{dropped} dropped, {failed} failed'.format(**daemon)
+            print '  rate limited: {rate_limited}, duplicates: ' \
+                  '{duplicate}'.format(**daemon)
+
+            if daemon['rate_limited']:
+                print 'Warning: the daemon rate limited fixes, run it ' \
+                      'with --ip-rate 0 for load tests.'
+
+    def print_latency(self, title, latency):
+        if latency[50] is None:
+            return
+
+        print '{}: p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms'.format(
+            title, latency[50] * 1000, latency[90] * 1000, latency[99] * 1000)
@@ -0,0 +1,128 @@
+from flask import current_app
+from flask.ext.script import Command, Option
+
+import os
+import gzip
+from datetime import datetime, timedelta
+from skylines.model import db, TrackingFix, TrackingLatest
+
+
+class CreatePartitions(Command):
+    """ Create the daily partitions of the live tracking fixes """
+
+    option_list = (
+        Option('--days', type=int, default=7,
+               help='number of days to create partitions for, '
+                    'starting today'),
+        Option('--migrate', action='store_true',
+               help='move the fixes stored in the tracking_fixes table '
+                    'itself into partitions, e.g. after upgrading an '
+                    'unpartitioned database'),
+    )
+
+    def run(self, days, migrate):
+        existing = TrackingFix.partitions()
+
+        today = datetime.utcnow().date()
+        for i in range(days):
+            day = today + timedelta(days=i)
+            if day in existing:
+                continue
+
+            existing[day] = TrackingFix.create_partition(day)
+            print 'Creating ' + existing[day]
+            db.session.commit()
+
+        if migrate:
+            self.migrate(existing)
+
+    def migrate(self, existing):
+        for day in TrackingFix.unpartitioned_days():
+            if day not in existing:
+                existing[day] = TrackingFix.create_partition(day)
+                print 'Creating ' + existing[day]
+
+            num_fixes = TrackingFix.move_to_partition(day)
+            print 'Moved {} fixes into {}'.format(num_fixes, existing[day])
+            db.session.commit()
+
+
+class DropPartitions(Command):
+    """ Drop the daily partitions of old live tracking fixes """
+
+    option_list = (
+        Option('--keep-days', type=int, default=30,
+               help='number of days to keep, including today'),
+        Option('--archive',
+               help='directory to write compressed CSV files of the '
+                    'partitions to before dropping them (default: '
+                    'SKYLINES_TRACKING_ARCHIVE_PATH)'),
+        Option('--force', action='store_true',
+               help='drop partitions without an archive directory even '
+                    'if their fixes have not been moved into the archive '
+                    'by "tracking archive" yet'),
+        Option('--dry-run', action='store_true',
+               help='only list the partitions that would be dropped'),
+    )
+
+    def run(self, keep_days, archive, force, dry_run):
+        cutoff = datetime.utcnow().date() - timedelta(days=keep_days - 1)
+
+        if archive is None:
+            archive = current_app.config.get('SKYLINES_TRACKING_ARCHIVE_PATH')
+
+        if archive and not dry_run and not os.path.isdir(archive):
+            os.makedirs(archive)
+
+        partitions = TrackingFix.partitions()
+        for day in sorted(partitions):
+            if day >= cutoff:
+                continue
+
+            name = partitions[day]
+
+            # without an archive directory, only the partitions that were
+            # emptied by "tracking archive" are dropped
+            if not archive and not force and TrackingFix.has_fixes(day):
+                print 'Skipping {}, its fixes have not been archived yet ' \
+                      '(use --archive or --force to drop it anyway)' \
+                      .format(name)
+                continue
+
+            if dry_run:
+                print 'Would drop ' + name
+                continue
+
+            # fixes that were written to the tracking_fixes table itself
+            TrackingFix.move_to_partition(day)
+
+            if archive:
+                path = os.path.join(archive, name + '.csv.gz')
+                print 'Archiving {} to {}'.format(name, path)
+                self.archive(name, path)
+
+            print 'Dropping ' + name
+            TrackingFix.drop_partition(day)
+            db.session.commit()
+
+        days = [day for day in TrackingFix.unpartitioned_days(before=cutoff)
+                if day not in partitions]
+        if days:
+            print 'The tracking_fixes table itself contains fixes of {} ' \
+                  'days without partitions, use "tracking ' \
+                  'create-partitions --migrate" to move them into ' \
+                  'partitions'.format(len(days))
+
+        if not dry_run:
+            TrackingLatest.query() \
+                .filter(TrackingLatest.time < cutoff) \
+                .delete(synchronize_session=False)
+
+            db.session.commit()
+
+    def archive(self, name, path):
+        cursor = db.session.connection().connection.cursor()
+
+        with gzip.open(path, 'wb') as f:
+            cursor.copy_expert(
+                'COPY {} TO STDOUT WITH CSV HEADER'.format(name), f)
@@ -1,17 +1,194 @@
-from flask.ext.script import Command
+from flask.ext.script import Command, Option
 
 import sys
+import socket
+from flask import current_app
+from skylines.model import db
+from skylines.model.elevation import get_elevation_cache
+from skylines.lib.pubsub import Subscriber
 from skylines.tracking.server import TrackingServer
+from skylines.tracking.cache import (
+    TrackingKeyCache, RelationCache, INVALIDATION_CHANNEL, handle_invalidation,
+)
+from skylines.tracking.ingest import FixIngestBuffer
+from skylines.tracking.limits import RateLimiter
+from skylines.tracking.metrics import Metrics, MetricsResource, SampledLog
+from skylines.tracking.positions import LivePositions, PositionLoader
+from skylines.tracking.sessions import SessionTracker
+from skylines.tracking.stream import FixPublisher
+from skylines.tracking.supervisor import Supervisor, bind_udp
 
 
 class Server(Command):
     """ Runs the live tracking UDP server """
 
-    def run(self):
+    option_list = (
+        Option('--port', type=int, default=5597,
+               help='UDP port to listen on'),
+        Option('--workers', type=int, default=1,
+               help='number of worker processes sharing the port'),
+        Option('--queue-size', type=int, default=10000,
+               help='maximum number of fixes waiting to be written'),
+        Option('--batch-size', type=int, default=500,
+               help='maximum number of fixes written in one transaction'),
+        Option('--flush-interval', type=float, default=1.0,
+               help='maximum number of seconds between database writes'),
+        Option('--key-ttl', type=int, default=300,
+               help='number of seconds that tracking keys and followees are cached'),
+        Option('--stats-port', type=int,
+               help='local HTTP port for the metrics (one port per worker, '
+                    'starting at this one)'),
+        Option('--pilot-rate', type=float, default=2.,
+               help='maximum number of fixes per second and pilot '
+                    '(0 disables the limit)'),
+        Option('--pilot-burst', type=int, default=40,
+               help='number of fixes a pilot may send at once, e.g. the '
+                    'buffered fixes of a TYPE_FIXES packet'),
+        Option('--ip-rate', type=float, default=50.,
+               help='maximum number of fixes per second and IP address '
+                    '(0 disables the limit, e.g. for load tests)'),
+        Option('--ip-burst', type=int, default=200,
+               help='number of fixes an IP address may send at once'),
+        Option('--log-rate', type=float,
+               help='maximum number of per packet log messages per second '
+                    '(0 disables them)'),
+        Option('--session-interval', type=float, default=10.,
+               help='number of seconds between the updates of the tracking '
+                    'sessions in the database'),
+    )
+
+    def run(self, port, workers, **kw):
         from twisted.python import log
         log.startLogging(sys.stdout)
 
+        if workers <= 1:
+            self.serve(port, **kw)
+            return
+
+        def worker(index):
+            # every worker needs its own database connections
+            db.get_engine(current_app).dispose()
+            self.serve(port, shared=True, index=index, **kw)
+
+        Supervisor(workers, worker).run()
+
+    def serve(self, port, shared=False, **kw):
+        """
+        Runs a TrackingServer in the current process. If ``shared`` is set,
+        the port is shared with other worker processes.
+        """
+
         from twisted.internet import reactor
 
-        reactor.listenUDP(5597, TrackingServer())
+        protocol = self.create_server(shared=shared, **kw)
+
+        sock = bind_udp(port, reuse_port=shared)
+        reactor.adoptDatagramPort(sock.fileno(), socket.AF_INET, protocol)
+        sock.close()
+
         reactor.run()
+
+    def create_server(self, queue_size, batch_size, flush_interval, key_ttl,
+                      stats_port, log_rate, pilot_rate, pilot_burst, ip_rate,
+                      ip_burst, session_interval, shared=False, index=0):
+        """
+        Creates the TrackingServer and its collaborators, and schedules
+        their periodic tasks on the reactor.
+        """
+
+        from twisted.internet import reactor, task
+
+        ingest = FixIngestBuffer(current_app._get_current_object(),
+                                 max_size=queue_size,
+                                 batch_size=batch_size,
+                                 flush_interval=flush_interval)
+        ingest.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', ingest.stop)
+
+        keys = TrackingKeyCache(ttl=key_ttl)
+        relations = RelationCache(ttl=key_ttl)
+        self.subscribe(keys, relations)
+
+        positions = LivePositions()
+        task.LoopingCall(positions.expire).start(60, now=False)
+
+        # the positions received by other processes are read from the
+        # database: the LiveTrack24 fixes of the web frontend, and in shared
+        # mode the fixes of the other workers, because the kernel
+        # distributes the clients between them
+        loader = PositionLoader(current_app._get_current_object(), positions)
+        loader.load()
+        task.LoopingCall(loader).start(max(flush_interval, 1.) * 2, now=False)
+
+        # the sessions are written in the thread pool of the reactor
+        sessions = SessionTracker(app=current_app._get_current_object())
+        sessions.load()
+        task.LoopingCall(sessions.flush_in_thread).start(session_interval,
+                                                         now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', sessions.stop)
+
+        publisher = None
+        url = current_app.config.get('SKYLINES_PUBSUB_URL')
+        if url:
+            publisher = FixPublisher(url)
+            task.LoopingCall(publisher.flush).start(1, now=False)
+
+        metrics = Metrics()
+        self.add_gauges(metrics, ingest, keys, relations, positions)
+        metrics.gauge('sessions', lambda: dict(
+            open=len(sessions), opened=sessions.opened, closed=sessions.closed))
+        if publisher:
+            metrics.gauge('published_fixes', lambda: publisher.published)
+
+        if stats_port:
+            from twisted.web.server import Site
+            reactor.listenTCP(stats_port + index,
+                              Site(MetricsResource(metrics)),
+                              interface='127.0.0.1')
+
+        protocol = TrackingServer(ingest, keys=keys, positions=positions,
+                                  relations=relations, metrics=metrics,
+                                  log=SampledLog(log_rate),
+                                  pilot_limiter=RateLimiter(pilot_rate,
+                                                            pilot_burst),
+                                  ip_limiter=RateLimiter(ip_rate, ip_burst),
+                                  publisher=publisher, sessions=sessions)
+
+        return protocol
+
+    def add_gauges(self, metrics, ingest, keys, relations, positions):
+        elevations = get_elevation_cache()
+
+        metrics.gauge('ingest', lambda: dict(
+            queue_depth=ingest.queue_depth,
+            received=ingest.received,
+            dropped=ingest.dropped,
+            written=ingest.written,
+            failed=ingest.failed,
+            flushes=ingest.flushes,
+            flush_latency=ingest.flush_latency.snapshot(),
+        ))
+
+        metrics.gauge('caches', lambda: dict(
+            keys=dict(hits=keys.hits, misses=keys.misses),
+            relations=dict(hits=relations.hits, misses=relations.misses),
+            elevations=dict(hits=elevations.hits, misses=elevations.misses,
+                            size=len(elevations)),
+        ))
+
+        metrics.gauge('live_positions', lambda: len(positions))
+
+    def subscribe(self, keys, relations):
+        """Drops cached pilot information when it is changed elsewhere."""
+
+        url = current_app.config.get('SKYLINES_PUBSUB_URL')
+        if not url:
+            return
+
+        from twisted.internet import reactor
+
+        def invalidate(channel, message):
+            reactor.callFromThread(handle_invalidation, message, keys,
+                                   relations)
+
+        Subscriber(url, [INVALIDATION_CHANNEL], invalidate).start()
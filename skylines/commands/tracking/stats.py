@@ -1,83 +1,115 @@
 from flask.ext.script import Command, Option
 
 from datetime import timedelta
-from itertools import chain
-from skylines.model import db, TrackingFix, User
+from itertools import groupby
+from operator import attrgetter
+from skylines.model import db, TrackingFix, TrackingSession, User
 
 
 class Stats(Command):
     """ Analyse live tracks and output statistics """
 
     option_list = (
-        Option('user', type=int, help='a user ID'),
+        Option('user', type=int, nargs='?', help='a user ID'),
+        Option('--all-users', action='store_true',
+               help='analyse the live tracks of all users'),
+        Option('--recorded', action='store_true',
+               help='read the sessions recorded by the tracking daemon '
+                    'instead of finding them in the live tracking fixes. '
+                    'This is faster, but misses the time between the '
+                    'fixes, the LiveTrack24 sessions and the sessions '
+                    'from before the daemon recorded them'),
         Option('--json', action='store_true', help='enable JSON output'),
     )
 
-    def run(self, user, json):
-        stats = self.gather_statistics(user)
+    def run(self, user, all_users, recorded, json):
+        if user is None and not all_users:
+            print 'Please specify a user ID or --all-users.'
+            return
+
+        if all_users:
+            stats = self.gather_statistics(recorded=recorded)
+        else:
+            stats = self.gather_statistics(user, recorded) or \
+                [dict(pilot=self.get_pilots([user])[user],
+                      num_fixes=0, sessions=[])]
 
         if json:
             from flask import json
-            print json.dumps(stats)
+            print json.dumps(stats if all_users else stats[0])
         else:
-            self.print_statistics(stats)
+            for pilot_stats in stats:
+                self.print_statistics(pilot_stats)
 
-    def get_pilot(self, user_id):
-        pilot = User.get(user_id)
-        return dict(name=pilot.name, id=pilot.id)
+    def get_pilots(self, user_ids):
+        query = db.session.query(User.id, User.name) \
+            .filter(User.id.in_(user_ids))
 
-    def get_base_query(self, user_id):
-        return db.session.query(TrackingFix) \
-            .filter_by(pilot_id=user_id) \
-            .order_by(TrackingFix.time)
+        return dict((id, dict(name=name, id=id)) for id, name in query)
 
-    def gather_sessions_statistics(self, user_id):
-        sessions = []
+    def get_sessions(self, user_id=None):
+        """
+        Returns the sessions recorded by the tracking daemon, ordered by
+        pilot and start time, with the columns of
+        ``TrackingFix.get_sessions()`` except the times between the fixes.
+        """
 
-        session = None
-        last_fix = None
-        for fix in chain(self.get_base_query(user_id), [None]):
-            is_start = (last_fix is None)
-            is_end = (fix is None)
+        query = db.session.query(
+            TrackingSession.pilot_id,
+            TrackingSession.time_first_fix.label('start'),
+            TrackingSession.time_last_fix.label('end'),
+            TrackingSession.num_fixes) \
+            .filter(TrackingSession.time_first_fix != None) \
+            .order_by(TrackingSession.pilot_id,
+                      TrackingSession.time_first_fix)
 
-            # check if this is a new live tracking session (dt > 3 hours)
-            dt = (fix.time - last_fix.time) if (fix and last_fix) else None
-            is_new_session = dt and dt > timedelta(hours=3)
+        if user_id is not None:
+            query = query.filter(TrackingSession.pilot_id == user_id)
 
-            # update current session
-            if not (is_start or is_new_session or is_end):
-                session['num_fixes'] += 1
+        return query
 
-                dt_secs = dt.total_seconds()
-                session['min_dt'] = min(dt_secs, session.get('min_dt', 999999))
-                session['max_dt'] = max(dt_secs, session.get('max_dt', 0))
+    def get_session_statistics(self, row):
+        session = dict(start=row.start, end=row.end, num_fixes=row.num_fixes)
 
-            # save last_fix in session and append it to the session list
-            if last_fix and (is_end or is_new_session):
-                session['end'] = last_fix.time
+        min_dt = getattr(row, 'min_dt', None)
+        if min_dt is not None:
+            session['min_dt'] = min_dt
+            session['max_dt'] = row.max_dt
 
-                duration = (session.get('end') - session.get('start')).total_seconds()
-                if session.get('num_fixes') > 1 and duration > 0:
-                    session['avg_dt'] = duration / (session.get('num_fixes') - 1)
-                    session['quality'] = session.get('min_dt') / session.get('avg_dt')
+        duration = (row.end - row.start).total_seconds()
+        if row.num_fixes > 1 and duration > 0:
+            session['avg_dt'] = duration / (row.num_fixes - 1)
 
-                sessions.append(session)
+            if min_dt is not None:
+                session['quality'] = min_dt / session['avg_dt']
 
-            # start a new session
-            if fix and (is_start or is_new_session):
-                session = dict()
-                session['start'] = fix.time
-                session['num_fixes'] = 1
+        return session
 
-            last_fix = fix
+    def gather_statistics(self, user_id=None, recorded=False):
+        """
+        Returns the statistics of the given user, or of all users, that
+        have live tracking sessions.
+        """
+
+        if recorded:
+            query = self.get_sessions(user_id)
+        else:
+            query = TrackingFix.get_sessions(user_id)
 
-        return sessions
+        sessions = groupby(query, key=attrgetter('pilot_id'))
+
+        stats = []
+        for pilot_id, rows in sessions:
+            rows = list(rows)
+            stats.append(dict(
+                pilot=pilot_id,
+                num_fixes=sum(row.num_fixes for row in rows),
+                sessions=map(self.get_session_statistics, rows)))
+
+        pilots = self.get_pilots([pilot_stats['pilot'] for pilot_stats in stats])
+        for pilot_stats in stats:
+            pilot_stats['pilot'] = pilots[pilot_stats['pilot']]
 
-    def gather_statistics(self, user):
-        stats = dict()
-        stats['pilot'] = self.get_pilot(user)
-        stats['num_fixes'] = self.get_base_query(user).count()
-        stats['sessions'] = self.gather_sessions_statistics(user)
         return stats
 
     def print_statistics(self, stats):
@@ -101,6 +133,16 @@ class Stats(Command):
         duration = end - start
         duration -= timedelta(microseconds=duration.microseconds)
 
+        if 'min_dt' not in session:
+            print '{date} - {start}-{end} - {duration} - {num_fixes} fixes (avg dt: {avg_dt:.1f})'.format(
+                date=start.strftime('%d.%m.%Y'),
+                start=start.strftime('%H:%M'),
+                end=end.strftime('%H:%M'),
+                duration=duration,
+                num_fixes=session.get('num_fixes'),
+                avg_dt=session.get('avg_dt', 0))
+            return
+
         print '{date} - {start}-{end} - {duration} - Q {quality:04.2%} - {num_fixes} fixes (dt: {min_dt:.1f}, avg {avg_dt:.1f})'.format(
             date=start.strftime('%d.%m.%Y'),
             start=start.strftime('%H:%M'),
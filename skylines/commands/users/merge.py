@@ -2,6 +2,9 @@ from flask.ext.script import Command, Option
 
 import sys
 from skylines.model import db, User, Club, IGCFile, Flight, TrackingFix
+from skylines.tracking.cache import (
+    invalidate_tracking_key, invalidate_followees, invalidate_club,
+)
 
 
 class Merge(Command):
@@ -48,7 +51,16 @@ class Merge(Command):
 
         # TODO: merge display name or not?
 
+        old_keys = [old.tracking_key, new.tracking_key]
+
         if old.tracking_key is not None:
             new.tracking_key = old.tracking_key
 
         db.session.commit()
+
+        for key in old_keys:
+            invalidate_tracking_key(key)
+
+        invalidate_followees(old_id)
+        invalidate_followees(new_id)
+        invalidate_club(new.club_id)
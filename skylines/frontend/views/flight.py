@@ -7,19 +7,18 @@ from flask.ext.babel import lazy_gettext as l_, _
 from sqlalchemy.orm import undefer_group, contains_eager
 from sqlalchemy.sql.expression import func
 from geoalchemy2.shape import to_shape
-from datetime import timedelta
 
 from skylines.frontend.forms import ChangePilotsForm, ChangeAircraftForm
 from skylines.lib import files
 from skylines.lib.dbutil import get_requested_record_list
-from skylines.lib.xcsoar_ import analyse_flight
+from skylines.lib.xcsoar_ import analyse_flight, encode_flight_path
 from skylines.lib.helpers import format_time, format_number
 from skylines.lib.formatter import units
 from skylines.lib.datetime import from_seconds_of_day
 from skylines.lib.geo import METERS_PER_DEGREE
 from skylines.model import (
     db, User, Flight, FlightPhase, Location, FlightComment,
-    Notification, Event, FlightMeetings
+    Notification, Event, FlightMeetings, FlightPathLevel
 )
 from skylines.model.event import create_flight_comment_notifications
 from skylines.model.flight import get_elevations_for_flight
@@ -74,29 +73,47 @@ def _add_flight_id(endpoint, values):
         values.setdefault('flight_id', g.flight_id)
 
 
+# version of the cached flight paths, to be increased when
+# _encode_flight_path() returns something else
+FLIGHT_PATH_CACHE_VERSION = 1
+
+# seconds until the cached flight paths expire
+FLIGHT_PATH_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+
 def _get_flight_path(flight, threshold=0.001, max_points=3000):
-    num_levels = 4
-    zoom_factor = 4
-    zoom_levels = [0]
-    zoom_levels.extend([round(-math.log(32.0 / 45.0 * (threshold * pow(zoom_factor, num_levels - i - 1)), 2)) for i in range(1, num_levels)])
+    """
+    Returns the encoded flight path from the cache. The cached paths are
+    replaced when the flight is modified or analysed again.
+    """
+
+    key = 'flight_path/{}/{}/{}/{}/{}'.format(
+        FLIGHT_PATH_CACHE_VERSION, flight.id,
+        flight.time_modified.isoformat(), threshold, max_points)
 
-    xcsoar_flight = xcsoar.Flight(files.filename_to_path(flight.igc_file.filename))
+    trace = current_app.cache.get(key)
+    if trace is None:
+        trace = _encode_flight_path(flight, threshold, max_points)
+        current_app.cache.set(key, trace, timeout=FLIGHT_PATH_CACHE_TIMEOUT)
 
-    begin = flight.takeoff_time - timedelta(seconds=2 * 60)
-    end = flight.landing_time + timedelta(seconds=2 * 60)
+    return trace
 
-    if begin > end:
-        begin = datetime.min
-        end = datetime.max
 
-    xcsoar_flight.reduce(begin=begin,
-                         end=end,
-                         num_levels=num_levels,
-                         zoom_factor=zoom_factor,
-                         threshold=threshold,
-                         max_points=max_points)
+def _encode_flight_path(flight, threshold, max_points):
+    num_levels = 4
+    zoom_factor = 4
+    zoom_levels = [0]
+    zoom_levels.extend([round(-math.log(32.0 / 45.0 * (threshold * pow(zoom_factor, num_levels - i - 1)), 2)) for i in range(1, num_levels)])
 
-    encoded_flight = xcsoar_flight.encode()
+    # the paths of the default levels are created at upload time
+    level = FlightPathLevel.get(flight, threshold, max_points)
+    if level is not None:
+        encoded_flight = level.encode()
+    else:
+        begin, end = flight.get_path_window()
+        encoded_flight = encode_flight_path(
+            flight.igc_file, begin, end, threshold, max_points,
+            num_levels=num_levels, zoom_factor=zoom_factor)
 
     encoded = dict(points=encoded_flight['locations'],
                    levels=encoded_flight['levels'],
@@ -1,12 +1,80 @@
+import atexit
+import threading
 from datetime import datetime
 
-from flask import Blueprint, request
-from werkzeug.exceptions import BadRequest, NotFound, NotImplemented
+from flask import Blueprint, current_app, request
+from werkzeug.exceptions import (
+    BadRequest, NotFound, NotImplemented, ServiceUnavailable
+)
 
-from skylines.model import db, User, TrackingFix, TrackingSession, Elevation
+from skylines.lib.pubsub import Subscriber
+from skylines.model import db, TrackingFix, TrackingSession
+from skylines.tracking.cache import (
+    TrackingKeyCache, SessionCache, INVALIDATION_CHANNEL, handle_invalidation,
+    invalidate_lt24_session,
+)
+from skylines.tracking.ingest import FixIngestBuffer
 
 lt24_blueprint = Blueprint('lt24', 'skylines')
 
+# the caches and the ingest buffer are shared by all requests of a process
+# (the caches lock their entries themselves)
+_keys = TrackingKeyCache(ttl=60)
+_sessions = SessionCache(ttl=60)
+
+_subscriber = None
+_ingest = None
+_init_lock = threading.Lock()
+
+
+def _get_ingest():
+    """Returns the FixIngestBuffer of this process and starts it if needed."""
+
+    global _ingest
+
+    with _init_lock:
+        if _ingest is None:
+            _ingest = FixIngestBuffer(current_app._get_current_object())
+            _ingest.start()
+
+            # write the queued fixes before the process exits
+            atexit.register(_ingest.stop)
+
+        return _ingest
+
+
+def _subscribe():
+    """
+    Starts the subscription of this process to the invalidation channel,
+    which drops changed tracking keys and finished sessions of all web
+    processes from the caches.
+    """
+
+    global _subscriber
+
+    with _init_lock:
+        url = current_app.config.get('SKYLINES_PUBSUB_URL')
+        if _subscriber is None and url:
+            _subscriber = Subscriber(
+                url, [INVALIDATION_CHANNEL],
+                lambda channel, message: handle_invalidation(
+                    message, _keys, sessions=_sessions))
+            _subscriber.start()
+
+
+def _get_keys():
+    """Returns the TrackingKeyCache of this process."""
+
+    _subscribe()
+    return _keys
+
+
+def _get_sessions():
+    """Returns the SessionCache of this process."""
+
+    _subscribe()
+    return _sessions
+
 
 def _parse_user():
     """Read and check the tracking key (supplied via 'user' field)"""
@@ -19,7 +87,7 @@ def _parse_user():
     except ValueError:
         raise BadRequest('`user` must be the hexadecimal tracking key.')
 
-    return key, User.by_tracking_key(key)
+    return key, _get_keys().get(key)
 
 
 def _parse_session_id():
@@ -90,31 +158,37 @@ def _parse_fix(pilot_id):
         if not 0 <= fix.track < 360:
             raise BadRequest('`cog` (course over ground) has to be a valid angle between 0 and 360 degrees.')
 
-    fix.elevation = Elevation.get(fix.location_wkt)
-
     return fix
 
 
+def _store_fix(fix):
+    # the elevation is looked up by the ingest buffer. The fix is only
+    # written when the buffer is flushed, so queued fixes are lost if the
+    # process is killed without running its exit handlers.
+    if not _get_ingest().put(fix):
+        raise ServiceUnavailable('Too many fixes, please try again later.')
+
+
 def _sessionless_fix():
     key, pilot = _parse_user()
     if not pilot:
         raise NotFound('No pilot found with tracking key `{:X}`.'.format(key))
 
     fix = _parse_fix(pilot.id)
-    db.session.add(fix)
-    db.session.commit()
+    _store_fix(fix)
     return 'OK'
 
 
 def _session_fix():
     session_id = _parse_session_id()
-    session = TrackingSession.by_lt24_id(session_id)
-    if session is None:
+
+    pilot_id = _get_sessions().get(session_id)
+
+    if pilot_id is None:
         raise NotFound('No open tracking session found with id `{:d}`.'.format(session_id))
 
-    fix = _parse_fix(session.pilot_id)
-    db.session.add(fix)
-    db.session.commit()
+    fix = _parse_fix(pilot_id)
+    _store_fix(fix)
     return 'OK'
 
 
@@ -129,7 +203,7 @@ def _create_session():
         raise BadRequest('The right three bytes must match the userid (tracking key).')
 
     session = TrackingSession()
-    session.pilot = pilot
+    session.pilot_id = pilot.id
     session.lt24_id = session_id
     session.ip_created = request.remote_addr
 
@@ -156,6 +230,9 @@ def _create_session():
 
     db.session.add(session)
     db.session.commit()
+
+    _get_sessions().add(session_id, pilot.id)
+
     return 'OK'
 
 
@@ -181,6 +258,12 @@ def _finish_session():
             raise BadRequest('`prid` must be an integer between 0 and 4.')
 
     db.session.commit()
+
+    # the other web processes drop the session when they receive the
+    # message, until then they accept its fixes
+    _get_sessions().invalidate(session_id)
+    invalidate_lt24_session(session_id)
+
     return 'OK'
 
 
@@ -13,6 +13,7 @@ from skylines.frontend.views.users import send_recover_mail
 from skylines.model.event import (
     create_club_join_event
 )
+from skylines.tracking.cache import invalidate_tracking_key, invalidate_club
 
 settings_blueprint = Blueprint('settings', 'skylines')
 
@@ -68,6 +69,8 @@ def profile():
 
     db.session.commit()
 
+    invalidate_tracking_key(g.user.tracking_key)
+
     flash(_('Profile was saved.'), 'success')
 
     return redirect(url_for('.profile', user=g.user_id))
@@ -122,6 +125,8 @@ def tracking():
     g.user.tracking_delay = request.form.get('tracking_delay', 0)
     db.session.commit()
 
+    invalidate_tracking_key(g.user.tracking_key)
+
     flash(_('Live Tracking settings were saved.'), 'success')
 
     return redirect(url_for('.tracking', user=g.user_id))
@@ -129,9 +134,13 @@ def tracking():
 
 @settings_blueprint.route('/tracking/generate-key')
 def tracking_generate_key():
+    old_key = g.user.tracking_key
+
     g.user.generate_tracking_key()
     db.session.commit()
 
+    invalidate_tracking_key(old_key)
+
     return redirect(url_for('.tracking', user=g.user_id))
 
 
@@ -185,6 +194,10 @@ def club_change_post(form):
 
     db.session.commit()
 
+    invalidate_tracking_key(g.user.tracking_key)
+    invalidate_club(old_club_id)
+    invalidate_club(new_club_id)
+
     flash(_('New club was saved.'), 'success')
 
     return redirect(url_for('.club', user=g.user_id))
@@ -197,10 +210,15 @@ def club_create_post(form):
 
     db.session.flush()
 
+    old_club_id = g.user.club_id
     g.user.club = club
 
     create_club_join_event(club.id, g.user)
 
     db.session.commit()
 
+    invalidate_tracking_key(g.user.tracking_key)
+    invalidate_club(old_club_id)
+    invalidate_club(club.id)
+
     return redirect(url_for('.club', user=g.user_id))
@@ -1,13 +1,12 @@
-from datetime import timedelta
 from math import log
 
 from flask import Blueprint, request, render_template, abort, jsonify, g
-from sqlalchemy.sql.expression import and_
 
 from skylines.lib.dbutil import get_requested_record_list
 from skylines.lib.helpers import color
+from skylines.lib.trails import TrailCache
 from skylines.lib.xcsoar_ import FlightPathFix
-from skylines.model import User, TrackingFix
+from skylines.model import User
 import xcsoar
 
 track_blueprint = Blueprint('track', 'skylines')
@@ -33,58 +32,19 @@ def _add_user_id(endpoint, values):
 
 UNKNOWN_ELEVATION = -1000
 
+# live trails of the recently watched pilots of this process
+_trails = TrailCache()
 
-def _get_flight_path2(pilot, last_update=None):
-    query = TrackingFix.query() \
-        .filter(and_(TrackingFix.pilot == pilot,
-                     TrackingFix.location != None,
-                     TrackingFix.altitude != None,
-                     TrackingFix.max_age_filter(12)))
 
-    if pilot.tracking_delay > 0 and not pilot.is_readable(g.current_user):
-        query = query.filter(TrackingFix.delay_filter(pilot.tracking_delay))
-
-    query = query.order_by(TrackingFix.time)
-
-    start_fix = query.first()
-
-    if not start_fix:
-        return None
-
-    start_time = start_fix.time.hour * 3600 + start_fix.time.minute * 60 + start_fix.time.second
-
-    if last_update:
-        query = query.filter(TrackingFix.time >= start_fix.time +
-                             timedelta(seconds=(last_update - start_time)))
-
-    result = []
-    for fix in query:
-        location = fix.location
-        if location is None:
-            continue
-
-        time_delta = fix.time - start_fix.time
-        time = start_time + time_delta.days * 86400 + time_delta.seconds
-
-        result.append(FlightPathFix(datetime=fix.time,
-                                    seconds_of_day=time,
-                                    location={'latitude': location.latitude,
-                                              'longitude': location.longitude},
-                                    altitude=fix.altitude,
-                                    enl=fix.engine_noise_level,
-                                    track=fix.track,
-                                    groundspeed=fix.ground_speed,
-                                    tas=fix.airspeed,
-                                    elevation=fix.elevation))
-
-    return result
+def _get_flight_path(pilot, threshold=0.001, last_update=None):
+    delayed = pilot.tracking_delay > 0 and \
+        not pilot.is_readable(g.current_user)
 
+    return _trails.get(pilot, delayed, last_update,
+                       _encode_flight_path, threshold)
 
-def _get_flight_path(pilot, threshold=0.001, last_update=None):
-    fp = _get_flight_path2(pilot, last_update=last_update)
-    if not fp:
-        return None
 
+def _encode_flight_path(fp, threshold):
     num_levels = 4
     zoom_factor = 4
     zoom_levels = [0]
@@ -1,31 +1,98 @@
-from flask import Blueprint, current_app, render_template, jsonify, g
+import threading
 
+from flask import (
+    Blueprint, Response, current_app, render_template, jsonify, g, request,
+    abort, json,
+)
+
+from skylines.lib.geo import geographic_distance
 from skylines.lib.helpers import isoformat_utc
 from skylines.lib.decorators import jsonp
-from skylines.model import TrackingFix, Airport, Follower
+from skylines.model import TrackingFix, Airport, Follower, Bounds, Location
+from skylines.tracking.stream import FixStream, FixListener
 
 tracking_blueprint = Blueprint('tracking', 'skylines')
 
+# seconds between keep-alive comments on idle streams
+STREAM_KEEPALIVE = 15
 
-@tracking_blueprint.route('/')
-def index():
-    tracks = TrackingFix.get_latest()
+# maximum number of pilots per stream
+STREAM_MAX_PILOTS = 100
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def _get_stream():
+    """Returns the FixStream of this process or None without Redis."""
+
+    global _stream
+
+    url = current_app.config.get('SKYLINES_PUBSUB_URL')
+    if not url:
+        return None
+
+    with _stream_lock:
+        if _stream is None:
+            _stream = FixStream(url)
+
+        return _stream
+
+
+def _get_nearest_airports(locations):
+    """
+    Returns the name, country and distance of the nearest airport for
+    each location. The airports are cached by rounded location.
+    """
 
-    @current_app.cache.memoize(timeout=(60 * 60))
-    def get_nearest_airport(track):
-        airport = Airport.by_location(track.location, None)
+    keys = ['nearest_airport/{:.2f}/{:.2f}'.format(
+            location.latitude, location.longitude) for location in locations]
+
+    airports = dict(zip(keys, current_app.cache.get_many(*keys)))
+
+    missing = [(key, location) for key, location in zip(keys, locations)
+               if airports[key] is None]
+
+    if missing:
+        found = Airport.by_locations([location for key, location in missing])
+
+        new = {}
+        for (key, location), airport in zip(missing, found):
+            # False marks locations without any airport
+            new[key] = False
+            if airport:
+                new[key] = dict(name=airport.name,
+                                country_code=airport.country_code,
+                                latitude=airport.location.latitude,
+                                longitude=airport.location.longitude)
+
+        current_app.cache.set_many(new, timeout=(60 * 60))
+        airports.update(new)
+
+    result = []
+    for key, location in zip(keys, locations):
+        airport = airports[key]
         if not airport:
-            return None
+            result.append(None)
+            continue
 
-        distance = airport.distance(track.location)
+        result.append({
+            'name': airport['name'],
+            'country_code': airport['country_code'],
+            'distance': geographic_distance(Location(
+                latitude=airport['latitude'],
+                longitude=airport['longitude']), location),
+        })
 
-        return {
-            'name': airport.name,
-            'country_code': airport.country_code,
-            'distance': distance,
-        }
+    return result
 
-    tracks = [(track, get_nearest_airport(track)) for track in tracks]
+
+@tracking_blueprint.route('/')
+def index():
+    tracks = TrackingFix.get_latest().all()
+
+    airports = _get_nearest_airports([track.location for track in tracks])
+    tracks = zip(tracks, airports)
 
     if g.current_user:
         followers = [f.destination_id for f in Follower.query(source=g.current_user)]
@@ -70,3 +137,49 @@ def latest():
         fixes.append(json)
 
     return jsonify(fixes=fixes)
+
+
+@tracking_blueprint.route('/stream')
+def stream():
+    """
+    Streams the new fixes of the pilots in ``pilots`` (comma separated
+    user ids) or inside of ``bbox`` as Server-Sent Events.
+    """
+
+    fixes = _get_stream()
+    if fixes is None:
+        abort(503)
+
+    try:
+        pilot_ids = [int(id) for id in
+                     request.values.get('pilots', '').split(',') if id]
+
+        bounds = None
+        if 'bbox' in request.values:
+            bounds = Bounds.from_bbox_string(request.values['bbox'])
+    except ValueError:
+        abort(400)
+
+    if not (pilot_ids or bounds) or len(pilot_ids) > STREAM_MAX_PILOTS:
+        abort(400)
+
+    listener = FixListener(pilot_ids=pilot_ids, bounds=bounds)
+    fixes.add(listener)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+
+            while True:
+                fix = listener.get(timeout=STREAM_KEEPALIVE)
+                if fix is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield 'data: ' + json.dumps(fix) + '\n\n'
+        finally:
+            fixes.remove(listener)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -11,6 +11,7 @@ from skylines.model import (
     db, User, Flight, Follower, Location, Notification, Event
 )
 from skylines.model.event import create_follower_notification
+from skylines.tracking.cache import invalidate_followees
 
 user_blueprint = Blueprint('user', 'skylines')
 
@@ -170,6 +171,7 @@ def follow():
     Follower.follow(g.current_user, g.user)
     create_follower_notification(g.user, g.current_user)
     db.session.commit()
+    invalidate_followees(g.current_user.id)
     return redirect(request.referrer or url_for('.index'))
 
 
@@ -178,4 +180,5 @@ def follow():
 def unfollow():
     Follower.unfollow(g.current_user, g.user)
     db.session.commit()
+    invalidate_followees(g.current_user.id)
     return redirect(request.referrer or url_for('.index'))
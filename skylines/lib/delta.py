@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact binary encoding of integer columns.
+
+Every column is delta encoded and written as zigzag varints. Missing
+values (None) are encoded as a single zero byte and don't affect the
+deltas of the other values. The result is compressed with zlib.
+"""
+
+import zlib
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append(chr((value & 0x7f) | 0x80))
+        value >>= 7
+
+    out.append(chr(value))
+
+
+def encode(columns):
+    """
+    Encodes a list of equally long lists of integers (or None) into a
+    byte string.
+    """
+
+    length = len(columns[0]) if columns else 0
+
+    out = []
+    _write_varint(out, len(columns))
+    _write_varint(out, length)
+
+    for values in columns:
+        if len(values) != length:
+            raise ValueError('All columns need to have the same length')
+
+        last = 0
+        for value in values:
+            if value is None:
+                out.append('\0')
+                continue
+
+            value = int(value)
+            delta = value - last
+            last = value
+
+            # zigzag encoding, shifted by one to reserve zero for None
+            _write_varint(out, ((delta << 1) ^ (delta >> 63)) + 1)
+
+    return zlib.compress(''.join(out))
+
+
+def decode(data):
+    """Decodes a byte string created by encode() into a list of columns."""
+
+    data = bytearray(zlib.decompress(data))
+    pos = [0]
+
+    def read_varint():
+        value = shift = 0
+        while True:
+            byte = data[pos[0]]
+            pos[0] += 1
+
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+
+            shift += 7
+
+    num_columns = read_varint()
+    length = read_varint()
+
+    columns = []
+    for i in range(num_columns):
+        values = []
+
+        last = 0
+        for j in range(length):
+            value = read_varint()
+            if value == 0:
+                values.append(None)
+                continue
+
+            value -= 1
+            last += (value >> 1) ^ -(value & 1)
+            values.append(last)
+
+        columns.append(values)
+
+    return columns
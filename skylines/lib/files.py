@@ -83,7 +83,11 @@ def delete_file(name):
     assert isinstance(name, str) or isinstance(name, unicode)
 
     path = filename_to_path(name)
-    try:
-        os.unlink(path)
-    except OSError:
-        pass
+
+    # the cached data of the file (see skylines.lib.xcsoar_.fixes) is
+    # deleted too
+    for path in [path, path + '.fixes']:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
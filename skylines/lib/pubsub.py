@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight Redis based publish/subscribe helpers.
+
+Messages are JSON encoded. If no ``SKYLINES_PUBSUB_URL`` is configured
+or Redis is unreachable, publishing is a silent no-op.
+"""
+
+import threading
+import traceback
+from time import sleep
+
+from flask import current_app, json
+
+
+def _connect(url):
+    import redis
+    return redis.StrictRedis.from_url(url)
+
+
+def publish(channel, message):
+    """Publishes a JSON serializable message on the given channel."""
+
+    url = current_app.config.get('SKYLINES_PUBSUB_URL')
+    if not url:
+        return
+
+    import redis
+
+    try:
+        _connect(url).publish(channel, json.dumps(message))
+    except redis.RedisError, e:
+        current_app.logger.warning('Could not publish on %s: %s', channel, e)
+
+
+class Publisher(object):
+    """
+    Publishes messages through a persistent Redis connection, for
+    processes that publish frequently.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.redis = _connect(url)
+
+    def publish(self, channel, message):
+        import redis
+
+        try:
+            self.redis.publish(channel, json.dumps(message))
+        except redis.RedisError, e:
+            current_app.logger.warning('Could not publish on %s: %s', channel, e)
+
+
+class Subscriber(threading.Thread):
+    """
+    Background thread that calls ``callback(channel, message)`` for every
+    message that is published on one of the given channels.
+
+    The callback is called from the subscriber thread.
+    """
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self, url, channels, callback):
+        super(Subscriber, self).__init__(name='pubsub-subscriber')
+        self.daemon = True
+
+        self.url = url
+        self.channels = channels
+        self.callback = callback
+
+    def run(self):
+        import redis
+
+        while True:
+            try:
+                pubsub = _connect(self.url).pubsub()
+                pubsub.subscribe(*self.channels)
+
+                for item in pubsub.listen():
+                    if item['type'] != 'message':
+                        continue
+
+                    self.handle(item['channel'], item['data'])
+
+            except redis.RedisError:
+                sleep(self.RECONNECT_DELAY)
+
+    def handle(self, channel, data):
+        """Decodes a message and passes it to the callback."""
+
+        # a broken message or a failing callback must not end the thread
+        try:
+            self.callback(channel, json.loads(data))
+        except Exception:
+            traceback.print_exc()
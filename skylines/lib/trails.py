@@ -0,0 +1,203 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import time
+
+from sqlalchemy.sql.expression import and_, or_
+
+from skylines.lib.xcsoar_ import FlightPathFix
+from skylines.model import TrackingFix, TrackingArchive
+
+
+class Trail(object):
+    """
+    The fixes of the last ``max_age`` of a pilot as FlightPathFix tuples.
+
+    ``update()`` only loads the fixes that were received since the last
+    update, and the encoded results are cached until the trail changes.
+    """
+
+    # maximum number of cached results
+    MAX_RESULTS = 16
+
+    def __init__(self, pilot_id, delay=0, max_age=timedelta(hours=12)):
+        self.pilot_id = pilot_id
+        self.delay = delay
+        self.max_age = max_age
+
+        self.fixes = []
+        self.times = []
+        self.start = None
+        self.updated = None
+
+        # highest id of the loaded live fixes
+        self.last_id = None
+
+        self.results = OrderedDict()
+
+        # serializes the updates of this trail
+        self.lock = threading.Lock()
+
+    def update(self):
+        now = datetime.utcnow()
+        min_time = now - self.max_age
+        max_time = now - timedelta(minutes=self.delay) if self.delay else None
+
+        # drop the fixes that are too old now
+        index = 0
+        while index < len(self.fixes) and self.fixes[index].datetime < min_time:
+            index += 1
+
+        if index:
+            del self.fixes[:index]
+            del self.times[:index]
+            self.results.clear()
+
+        # the times are relative to the day of the first fix
+        if not self.fixes or self.fixes[0].datetime.date() != self.start.date():
+            self.fixes = []
+            self.times = []
+            self.start = None
+            self.last_id = None
+            self.results.clear()
+
+        query = TrackingFix.query() \
+            .filter(and_(TrackingFix.pilot_id == self.pilot_id,
+                         TrackingFix.location != None,
+                         TrackingFix.altitude != None,
+                         TrackingFix.time >= min_time))
+
+        if max_time:
+            query = query.filter(TrackingFix.time <= max_time)
+
+        if self.fixes:
+            # fixes may be written late, e.g. if they were buffered by the
+            # client, so they are also found by their (increasing) id
+            query = query.filter(or_(
+                TrackingFix.time > self.fixes[-1].datetime,
+                TrackingFix.id > self.last_id))
+        else:
+            # finished sessions may have been moved into the archive already
+            archived = TrackingArchive.get_fixes(
+                self.pilot_id, min_time=min_time, max_time=max_time)
+
+            for fix in archived:
+                if fix.location is not None and fix.altitude is not None:
+                    self.add(fix)
+
+        for fix in query.order_by(TrackingFix.time):
+            self.add(fix)
+
+            if self.last_id is None or fix.id > self.last_id:
+                self.last_id = fix.id
+
+        if self.last_id is None:
+            self.last_id = 0
+
+        self.updated = time()
+
+    def add(self, fix):
+        """Inserts a fix at the position of its time."""
+
+        if self.start is None:
+            self.start = fix.time
+
+        location = fix.location
+        if location is None:
+            return
+
+        start_time = self.start.hour * 3600 + self.start.minute * 60 + \
+            self.start.second
+
+        time_delta = fix.time - self.start
+        seconds = start_time + time_delta.days * 86400 + time_delta.seconds
+
+        index = bisect_right(self.times, seconds)
+        self.fixes.insert(index, FlightPathFix(
+            datetime=fix.time,
+            seconds_of_day=seconds,
+            location={'latitude': location.latitude,
+                      'longitude': location.longitude},
+            altitude=fix.altitude,
+            enl=fix.engine_noise_level,
+            track=fix.track,
+            groundspeed=fix.ground_speed,
+            tas=fix.airspeed,
+            elevation=fix.elevation))
+
+        self.times.insert(index, seconds)
+        self.results.clear()
+
+    def since(self, last_update=None):
+        """Returns the fixes since the ``seconds_of_day`` ``last_update``."""
+
+        if not last_update:
+            return self.fixes
+
+        return self.fixes[bisect_left(self.times, last_update):]
+
+    def get(self, last_update, func, *args):
+        """
+        Returns ``func(fixes, *args)`` for the fixes since ``last_update``,
+        or None if there are no fixes. The results are cached until the
+        trail changes.
+        """
+
+        key = (last_update or 0, func) + args
+        if key in self.results:
+            return self.results[key]
+
+        fixes = self.since(last_update)
+        result = func(fixes, *args) if fixes else None
+
+        self.results[key] = result
+        while len(self.results) > self.MAX_RESULTS:
+            self.results.popitem(last=False)
+
+        return result
+
+
+class TrailCache(object):
+    """
+    Keeps the Trail objects of the recently watched pilots, so that the
+    live tracking pages only need to load the new fixes when polling.
+    """
+
+    def __init__(self, max_size=1000, update_interval=5):
+        self.max_size = max_size
+        self.update_interval = update_interval
+
+        self.trails = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.trails)
+
+    def get(self, pilot, delayed, last_update, func, *args):
+        """
+        Returns ``func(fixes, *args)`` for the fixes of the pilot since
+        ``last_update`` (see ``Trail.get()``). ``delayed`` selects the trail
+        without the fixes of the last ``pilot.tracking_delay`` minutes.
+        """
+
+        delay = pilot.tracking_delay if delayed else 0
+        key = (pilot.id, delay)
+
+        # the lock of the cache only protects the dictionary, the trails
+        # are updated and encoded under their own locks
+        with self.lock:
+            trail = self.trails.pop(key, None)
+            if trail is None:
+                trail = Trail(pilot.id, delay)
+
+            self.trails[key] = trail
+            while len(self.trails) > self.max_size:
+                self.trails.popitem(last=False)
+
+        with trail.lock:
+            if trail.updated is None or \
+                    time() - trail.updated >= self.update_interval:
+                trail.update()
+
+            return trail.get(last_update, func, *args)
@@ -1,4 +1,4 @@
 # flake8: noqa
 
 from .analysis import analyse_flight
-from .flightpath import flight_path, FlightPathFix
+from .flightpath import flight_path, encode_flight_path, FlightPathFix
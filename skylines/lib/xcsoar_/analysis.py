@@ -7,7 +7,7 @@ from skylines.lib import files
 from skylines.lib.datetime import from_seconds_of_day
 from skylines.lib.xcsoar_.flightpath import flight_path
 from skylines.model import (
-    Airport, Trace, FlightPhase, TimeZone, Location
+    Airport, Trace, FlightPhase, TimeZone, Location, FlightPathLevel
 )
 
 
@@ -317,8 +317,7 @@ def get_analysis_times(times):
 def run_analyse_flight(flight, full=None, triangle=None, sprint=None):
     limits = get_limits()
 
-    filename = files.filename_to_path(flight.igc_file.filename)
-    xcsoar_flight = xcsoar.Flight(flight_path(filename, add_elevation=True, max_points=None))
+    xcsoar_flight = xcsoar.Flight(flight_path(flight.igc_file, add_elevation=True, max_points=None))
 
     analysis_times = get_analysis_times(xcsoar_flight.times())
 
@@ -400,4 +399,12 @@ def analyse_flight(flight, full=512, triangle=1024, sprint=64):
     save_phases(root, flight)
 
     flight.needs_analysis = False
+
+    # the stored flight paths of the flight views are limited to the
+    # takeoff and landing time, which may have changed
+    if FlightPathLevel.is_outdated(flight):
+        flight.update_path_levels()
+
+    # invalidates the cached flight paths of the flight views
+    flight.time_modified = datetime.datetime.utcnow()
     return True
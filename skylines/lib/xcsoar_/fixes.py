@@ -0,0 +1,151 @@
+"""
+Cache of the parsed fixes of the IGC files.
+
+The fixes of an IGC file are parsed by XCSoar only once and then stored
+in a binary file next to the IGC file (``<filename>.fixes``). The file
+starts with a header containing the MD5 hash of the IGC file, followed
+by one fixed size record per fix. Missing values are stored as NaN.
+"""
+
+import os
+import mmap
+import struct
+from calendar import timegm
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+
+from xcsoar import Flight
+
+from skylines.lib import files
+from .flightpath import FlightPathFix
+
+SUFFIX = '.fixes'
+
+MAGIC = 'SKYF'
+VERSION = 1
+
+# magic, version, md5 hash and number of fixes
+HEADER = struct.Struct('<4sH32sI')
+
+# time (microseconds since the epoch), seconds of day, latitude and
+# longitude (1e-7 degrees), altitude, pressure altitude, enl, track,
+# ground speed, tas, ias, siu and elevation
+RECORD = struct.Struct('<qiii9f')
+
+NAN = float('nan')
+NO_LOCATION = -0x80000000
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _encode(value):
+    return NAN if value is None else value
+
+
+def _decode(value):
+    return None if value != value else value
+
+
+def _decode_int(value):
+    return None if value != value else int(value)
+
+
+def write_fixes(path, md5, fixes):
+    """Writes the fixes of the IGC file with the given MD5 hash to ``path``."""
+
+    # write to a temporary file first, so that readers never see
+    # incomplete files
+    f = NamedTemporaryFile(dir=os.path.dirname(path), delete=False)
+    try:
+        f.write(HEADER.pack(MAGIC, VERSION, str(md5), len(fixes)))
+
+        for fix in fixes:
+            fix = list(fix) + [None] * (12 - len(fix))
+
+            time = fix[0]
+            time = (timegm(time.timetuple()) * 1000000 + time.microsecond)
+
+            location = fix[2]
+            if location is None:
+                latitude = longitude = NO_LOCATION
+            else:
+                latitude = int(round(location['latitude'] * 1e7))
+                longitude = int(round(location['longitude'] * 1e7))
+
+            f.write(RECORD.pack(time, fix[1], latitude, longitude,
+                                *map(_encode, fix[3:12])))
+
+        f.close()
+        os.rename(f.name, path)
+    except:
+        f.close()
+        os.unlink(f.name)
+        raise
+
+
+def read_fixes(path, md5):
+    """
+    Returns the fixes stored in ``path``, or None if the file does not
+    exist or was created for a different version of the IGC file.
+    """
+
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            return None
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, file_md5, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or file_md5 != str(md5) or \
+                size != HEADER.size + count * RECORD.size:
+            return None
+
+        return [_to_fix(RECORD.unpack_from(data, offset))
+                for offset in xrange(HEADER.size, size, RECORD.size)]
+    finally:
+        data.close()
+
+
+def _to_fix(record):
+    location = None
+    if record[2] != NO_LOCATION:
+        location = dict(latitude=record[2] / 1e7,
+                        longitude=record[3] / 1e7)
+
+    return FlightPathFix(
+        EPOCH + timedelta(microseconds=record[0]), record[1], location,
+        _decode_int(record[4]), _decode_int(record[5]),
+        _decode_int(record[6]), _decode(record[7]), _decode(record[8]),
+        _decode(record[9]), _decode(record[10]), _decode_int(record[11]),
+        _decode_int(record[12]))
+
+
+def get_fixes(igc_file):
+    """
+    Returns all fixes of an IGCFile as FlightPathFix tuples, parsing the
+    file only if it is not cached yet.
+    """
+
+    path = files.filename_to_path(igc_file.filename)
+    cache_path = path + SUFFIX
+
+    fixes = read_fixes(cache_path, igc_file.md5)
+    if fixes is not None:
+        return fixes
+
+    fixes = [FlightPathFix(*fix) for fix in Flight(path).path()]
+
+    try:
+        write_fixes(cache_path, igc_file.md5, fixes)
+    except (IOError, OSError):
+        # the cache is optional
+        pass
+
+    return fixes
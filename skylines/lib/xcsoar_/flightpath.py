@@ -3,7 +3,6 @@ from sqlalchemy.sql.expression import and_, literal_column
 from shapely.geometry import MultiPoint
 from geoalchemy2.shape import from_shape
 
-from skylines.lib import files
 from skylines.model import db, Elevation, IGCFile
 from xcsoar import Flight
 
@@ -38,20 +37,44 @@ def run_flight_path(path, max_points=None):
 
 def flight_path(igc_file, max_points=1000, add_elevation=False):
     if isinstance(igc_file, IGCFile):
-        path = files.filename_to_path(igc_file.filename)
+        # the parsed fixes of IGCFiles are cached
+        from .fixes import get_fixes
+        path = get_fixes(igc_file)
+        if not max_points:
+            output = path
+        else:
+            output = run_flight_path(path, max_points=max_points)
     elif isinstance(igc_file, (str, unicode)):
-        path = igc_file
+        output = run_flight_path(igc_file, max_points=max_points)
     else:
         return None
 
-    output = run_flight_path(path, max_points=max_points)
-
     if add_elevation and len(output):
         output = get_elevation(output)
 
     return map(lambda line: FlightPathFix(*line), output)
 
 
+def encode_flight_path(igc_file, begin, end, threshold, max_points,
+                       num_levels=4, zoom_factor=4):
+    """
+    Returns the reduced flight path between ``begin`` and ``end`` as
+    encoded by xcsoar.Flight.encode().
+    """
+
+    from .fixes import get_fixes
+
+    flight = Flight(get_fixes(igc_file))
+    flight.reduce(begin=begin,
+                  end=end,
+                  num_levels=num_levels,
+                  zoom_factor=zoom_factor,
+                  threshold=threshold,
+                  max_points=max_points)
+
+    return flight.encode()
+
+
 def get_elevation(fixes):
     shortener = int(max(1, len(fixes) / 1000))
 
@@ -15,7 +15,7 @@ from .airspace import Airspace
 from .club import Club
 from .elevation import Elevation
 from .event import Event, Notification
-from .flight import Flight, FlightPathChunks
+from .flight import Flight, FlightPathChunks, FlightPathLevel
 from .flight_meetings import FlightMeetings
 from .flight_comment import FlightComment
 from .flight_phase import FlightPhase
@@ -25,5 +25,7 @@ from .igcfile import IGCFile
 from .mountain_wave_project import MountainWaveProject
 from .timezone import TimeZone
 from .trace import Trace
-from .tracking import TrackingFix, TrackingSession
+from .tracking import (
+    TrackingFix, TrackingLatest, TrackingSession, TrackingArchive
+)
 from .user import User
@@ -4,7 +4,7 @@ from datetime import datetime
 
 from sqlalchemy import Column, func
 from sqlalchemy.types import Integer, Float, String, DateTime
-from sqlalchemy.sql.expression import cast, or_
+from sqlalchemy.sql.expression import cast, or_, text
 from geoalchemy2.types import Geometry, Geography
 from geoalchemy2.shape import to_shape
 
@@ -72,6 +72,44 @@ class Airport(db.Model):
         else:
             return None
 
+    @classmethod
+    def by_locations(cls, locations, date=None):
+        """
+        Returns the nearest airport (or None) for each of the given
+        locations, using one query for all locations.
+        """
+
+        if not locations:
+            return []
+
+        if date is None:
+            date = datetime.utcnow()
+
+        values = []
+        params = dict(date=date)
+        for i, location in enumerate(locations):
+            values.append('({0}, :longitude_{0}, :latitude_{0})'.format(i))
+            params['longitude_{}'.format(i)] = location.longitude
+            params['latitude_{}'.format(i)] = location.latitude
+
+        # the KNN operator <-> uses the spatial index of the airports
+        query = text(
+            'SELECT v.i, ('
+            'SELECT a.id FROM airports a '
+            'WHERE a.valid_until IS NULL OR a.valid_until > :date '
+            'ORDER BY a.location_wkt <-> '
+            'ST_SetSRID(ST_MakePoint(v.longitude, v.latitude), 4326) '
+            'LIMIT 1) '
+            'FROM (VALUES ' + ', '.join(values) + ') '
+            'AS v (i, longitude, latitude)')
+
+        ids = dict(db.session.execute(query, params).fetchall())
+
+        airports = cls.query().filter(cls.id.in_(set(ids.values()) - set([None])))
+        airports = dict((airport.id, airport) for airport in airports)
+
+        return [airports.get(ids.get(i)) for i in range(len(locations))]
+
     @classmethod
     def by_bbox(cls, bbox, date=datetime.utcnow()):
         return cls.query() \
@@ -1,7 +1,21 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+from glob import glob
+from math import floor
+
+from flask import current_app
 from sqlalchemy.types import Integer
 from geoalchemy2.types import Raster
 
 from skylines.model import db
+from skylines.model.geo import Location
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
 
 
 class Elevation(db.Model):
@@ -25,3 +39,139 @@ class Elevation(db.Model):
             .filter(elevation != None)
 
         return query.scalar()
+
+    @classmethod
+    def get_cached(cls, latitude, longitude):
+        """
+        Returns the elevation at the given coordinates or None, using the
+        process wide ElevationCache.
+        """
+
+        return get_elevation_cache().get(latitude, longitude)
+
+
+class ElevationFiles(object):
+    """
+    Samples elevations directly from the SRTM GeoTIFF files that were
+    imported by the ``import srtm`` command. Requires GDAL.
+    """
+
+    def __init__(self, path):
+        if gdal is None:
+            raise RuntimeError('GDAL is required to read the elevation files')
+
+        self.tiles = []
+        self.lock = threading.Lock()
+
+        for filename in sorted(glob(os.path.join(path, '*.tif'))):
+            dataset = gdal.Open(filename)
+            if dataset is None:
+                continue
+
+            x0, dx, _, y0, _, dy = dataset.GetGeoTransform()
+            band = dataset.GetRasterBand(1)
+            self.tiles.append((x0, y0, dx, dy,
+                               dataset.RasterXSize, dataset.RasterYSize,
+                               dataset, band, band.GetNoDataValue()))
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get(self, latitude, longitude):
+        for x0, y0, dx, dy, width, height, _, band, nodata in self.tiles:
+            x = int(floor((longitude - x0) / dx))
+            y = int(floor((latitude - y0) / dy))
+            if not (0 <= x < width and 0 <= y < height):
+                continue
+
+            # GDAL datasets must not be used by several threads at once
+            with self.lock:
+                data = band.ReadRaster(x, y, 1, 1, 1, 1, gdal.GDT_Int16)
+
+            value = struct.unpack('h', data)[0]
+            if value == nodata:
+                return None
+
+            return value
+
+        return None
+
+
+class ElevationCache(object):
+    """
+    LRU cache of elevations keyed by raster cell.
+
+    Coordinates are quantized to the ``resolution`` of the elevation data
+    (3 arc seconds for SRTM3), so that consecutive fixes of a pilot mostly
+    hit the same cells. Missing elevations are cached too. Cache misses are
+    read from the ``files`` if given, or from the ``elevations`` table.
+    """
+
+    def __init__(self, max_size=100000, resolution=1 / 1200., files=None):
+        self.max_size = max_size
+        self.resolution = resolution
+        self.files = files
+
+        self.cells = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.cells)
+
+    def get(self, latitude, longitude):
+        key = (int(round(latitude / self.resolution)),
+               int(round(longitude / self.resolution)))
+
+        with self.lock:
+            if key in self.cells:
+                self.hits += 1
+                value = self.cells.pop(key)
+                self.cells[key] = value
+                return value
+
+        self.misses += 1
+        value = self.lookup(latitude, longitude)
+
+        with self.lock:
+            self.cells[key] = value
+            while len(self.cells) > self.max_size:
+                self.cells.popitem(last=False)
+
+        return value
+
+    def lookup(self, latitude, longitude):
+        if self.files is not None:
+            return self.files.get(latitude, longitude)
+
+        location = Location(latitude=latitude, longitude=longitude)
+        return Elevation.get(location.to_wkt_element())
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_elevation_cache():
+    """
+    Returns the ElevationCache of the current process, which is created on
+    first use from the ``SKYLINES_ELEVATION_*`` settings.
+    """
+
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            config = current_app.config
+
+            files = None
+            if config.get('SKYLINES_ELEVATION_FROM_FILES'):
+                files = ElevationFiles(config['SKYLINES_ELEVATION_PATH'])
+
+            _cache = ElevationCache(
+                max_size=config.get('SKYLINES_ELEVATION_CACHE_SIZE', 100000),
+                files=files)
+
+        return _cache
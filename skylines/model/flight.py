@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from bisect import bisect_left
 from flask import current_app
 
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import deferred
 from sqlalchemy.types import Unicode, Integer, Float, DateTime, Date, \
-    Boolean, SmallInteger
+    Boolean, SmallInteger, String
 from sqlalchemy import func
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.sql.expression import case, and_, or_, literal_column
@@ -273,6 +273,42 @@ class Flight(db.Model):
         return [p for p in self._phases
                 if p.aggregate and p.phase_type == FlightPhase.PT_CRUISE]
 
+    def get_path_window(self):
+        """
+        Returns the time range of the flight paths that are shown by the
+        flight views.
+        """
+
+        begin = self.takeoff_time - timedelta(seconds=2 * 60)
+        end = self.landing_time + timedelta(seconds=2 * 60)
+
+        if begin > end:
+            return datetime.min, datetime.max
+
+        return begin, end
+
+    def update_path_levels(self):
+        """
+        Creates the reduced and encoded flight paths of the flight views
+        (see FlightPathLevel).
+        """
+
+        from skylines.lib.xcsoar_ import encode_flight_path
+
+        FlightPathLevel.query().filter(FlightPathLevel.flight == self).delete()
+
+        begin, end = self.get_path_window()
+        for threshold, max_points in FlightPathLevel.LEVELS:
+            encoded = encode_flight_path(self.igc_file, begin, end,
+                                         threshold, max_points)
+
+            db.session.add(FlightPathLevel(
+                flight=self, threshold=threshold, max_points=max_points,
+                start_time=begin, end_time=end,
+                locations=encoded['locations'], levels=encoded['levels'],
+                times=encoded['times'], altitude=encoded['altitude'],
+                enl=encoded['enl']))
+
     def update_flight_path(self):
         from skylines.lib.xcsoar_ import flight_path
         from skylines.lib.datetime import from_seconds_of_day
@@ -344,9 +380,82 @@ class Flight(db.Model):
                 if j == len(path_detailed) - 2:
                     j = len(path_detailed) - 1
 
+        self.update_path_levels()
+
         return True
 
 
+class FlightPathLevel(db.Model):
+    """
+    The flight path of a flight, reduced and encoded for one level of
+    detail of the flight views. The levels are created together with the
+    other flight paths, so that the views don't need to read the IGC file.
+    """
+
+    __tablename__ = 'flight_path_levels'
+
+    # threshold and max_points of the levels
+    LEVELS = [(0.001, 3000), (0.0001, 10000)]
+
+    id = db.Column(Integer, autoincrement=True, primary_key=True)
+
+    flight_id = db.Column(
+        Integer, db.ForeignKey('flights.id', ondelete='CASCADE'), nullable=False)
+    flight = db.relationship('Flight')
+
+    threshold = db.Column(Float, nullable=False)
+    max_points = db.Column(Integer, nullable=False)
+
+    # the time range of the path (see Flight.get_path_window())
+    start_time = db.Column(DateTime, nullable=False)
+    end_time = db.Column(DateTime, nullable=False)
+
+    # the encoded path as returned by xcsoar.Flight.encode()
+    locations = db.Column(String, nullable=False)
+    levels = db.Column(String, nullable=False)
+    times = db.Column(String, nullable=False)
+    altitude = db.Column(String, nullable=False)
+    enl = db.Column(String, nullable=False)
+
+    @classmethod
+    def get(cls, flight, threshold, max_points):
+        """
+        Returns the level of the flight, or None if it does not exist or
+        does not match the current takeoff and landing time anymore.
+        """
+
+        begin, end = flight.get_path_window()
+
+        return cls.query(flight_id=flight.id, threshold=threshold,
+                         max_points=max_points,
+                         start_time=begin, end_time=end).first()
+
+    @classmethod
+    def is_outdated(cls, flight):
+        """
+        Returns True if the flight has levels that don't match the current
+        takeoff and landing time, e.g. after the flight was analysed again.
+        """
+
+        if flight.id is None:
+            return False
+
+        begin, end = flight.get_path_window()
+
+        query = cls.query(flight_id=flight.id) \
+            .filter(or_(cls.start_time != begin, cls.end_time != end))
+
+        return db.session.query(query.exists()).scalar()
+
+    def encode(self):
+        return dict(locations=self.locations, levels=self.levels,
+                    times=self.times, altitude=self.altitude, enl=self.enl)
+
+
+db.Index('flight_path_levels_flight', FlightPathLevel.flight_id,
+         FlightPathLevel.threshold, FlightPathLevel.max_points)
+
+
 class _ST_Contains(GenericFunction):
     '''
     ST_Contains without index search
@@ -1,18 +1,44 @@
 # -*- coding: utf-8 -*-
 
+from collections import namedtuple
 from datetime import datetime, timedelta
 
 from sqlalchemy.types import Integer, REAL, DateTime, SmallInteger, Unicode,\
-    BigInteger
+    BigInteger, LargeBinary, Float
 from sqlalchemy.dialects.postgresql import INET
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.expression import or_, text, case, cast, extract
 from geoalchemy2.types import Geometry
 from geoalchemy2.shape import to_shape, from_shape
 from shapely.geometry import Point
 
+from skylines.lib import delta
 from skylines.model import db
 from .user import User
 from .geo import Location
 
+# fixes of a pilot with a larger gap belong to different tracking sessions
+SESSION_GAP = timedelta(hours=3)
+
+
+def split_sessions(fixes, gap=SESSION_GAP):
+    """
+    Splits a time ordered iterable of fixes into lists of fixes that
+    belong to the same live tracking session.
+    """
+
+    session = []
+    for fix in fixes:
+        if session and fix.time - session[-1].time > gap:
+            yield session
+            session = []
+
+        session.append(fix)
+
+    if session:
+        yield session
+
 
 class TrackingFix(db.Model):
     __tablename__ = 'tracking_fixes'
@@ -70,10 +96,7 @@ class TrackingFix(db.Model):
         value that will be interpreted as hours.
         """
 
-        if isinstance(max_age, (int, long, float)):
-            max_age = timedelta(hours=max_age)
-
-        return cls.time >= datetime.utcnow() - max_age
+        return cls.time >= datetime.utcnow() - cls._to_timedelta(max_age)
 
     @classmethod
     def delay_filter(cls, delay):
@@ -92,35 +115,334 @@ class TrackingFix(db.Model):
 
     @classmethod
     def get_latest(cls, max_age=timedelta(hours=6)):
+        """
+        Returns a query for the latest fix of every pilot with a location.
+
+        The latest fixes are looked up in the small ``tracking_latest``
+        table. Only pilots with a tracking delay need a scan over their
+        recent fixes to find the latest fix that may already be shown.
+        """
+
+        # Latest fixes of pilots without tracking delay
+        latest = db.session \
+            .query(TrackingLatest.fix_id) \
+            .join(TrackingLatest.pilot) \
+            .filter(User.tracking_delay == 0) \
+            .filter(TrackingLatest.time >= datetime.utcnow() - cls._to_timedelta(max_age)) \
+            .subquery()
+
         # Add a db.Column to the inner query with
         # numbers ordered by time for each pilot
         row_number = db.over(db.func.row_number(),
                              partition_by=cls.pilot_id,
                              order_by=cls.time.desc())
 
-        # Create inner query
-        subq = db.session \
+        # Create inner query for the pilots with tracking delay
+        delayed = db.session \
             .query(cls.id, row_number.label('row_number')) \
             .join(cls.pilot) \
+            .filter(User.tracking_delay > 0) \
             .filter(cls.max_age_filter(max_age)) \
             .filter(cls.delay_filter(User.tracking_delay_interval())) \
             .filter(cls.location_wkt != None) \
             .subquery()
 
+        delayed = db.session \
+            .query(delayed.c.id) \
+            .filter(delayed.c.row_number == 1) \
+            .subquery()
+
         # Create outer query that orders by time and
         # only selects the latest fix
         query = cls.query() \
             .options(db.joinedload(cls.pilot)) \
-            .filter(cls.id == subq.c.id) \
-            .filter(subq.c.row_number == 1) \
+            .filter(or_(cls.id.in_(latest), cls.id.in_(delayed))) \
+            .filter(cls.max_age_filter(max_age)) \
             .order_by(cls.time.desc())
 
         return query
 
+    @classmethod
+    def get_numbered_fixes(cls, pilot_id=None, gap=SESSION_GAP, columns=()):
+        """
+        Returns a subquery of the fixes of a pilot, or of all pilots, with
+        the ``pilot_id``, ``time``, the ``dt`` to the previous fix in
+        seconds, the given additional ``columns`` and the ``session``
+        number of the fix, which is counted per pilot.
+
+        ``gap`` is a timedelta or a number of seconds.
+        """
+
+        if isinstance(gap, timedelta):
+            gap = gap.total_seconds()
+
+        dt = cast(extract('epoch', cls.time - func.lag(cls.time).over(
+            partition_by=cls.pilot_id, order_by=cls.time)), Float)
+
+        gaps = db.session.query(cls.pilot_id, cls.time, dt.label('dt'),
+                                *columns)
+        if pilot_id is not None:
+            gaps = gaps.filter(cls.pilot_id == pilot_id)
+
+        gaps = gaps.subquery()
+
+        # the running number of session starts is the session number
+        is_start = case([(or_(gaps.c.dt == None, gaps.c.dt > gap), 1)])
+        session = func.count(is_start).over(
+            partition_by=gaps.c.pilot_id, order_by=gaps.c.time)
+
+        return db.session.query(gaps, session.label('session')).subquery()
+
+    @classmethod
+    def get_sessions(cls, pilot_id=None, gap=SESSION_GAP):
+        """
+        Returns a query for the live tracking sessions of a pilot, or of
+        all pilots, ordered by pilot and start time.
+
+        The sessions are separated by gaps of more than ``gap`` between
+        the fixes and are found by the database using window functions.
+        Every row contains the ``pilot_id``, the ``start`` and ``end``
+        time, the ``num_fixes`` and the ``min_dt`` and ``max_dt`` between
+        the fixes in seconds.
+        """
+
+        gap = gap.total_seconds()
+        numbered = cls.get_numbered_fixes(pilot_id, gap)
+
+        # the gaps before the session starts don't belong to the session
+        dt = case([(numbered.c.dt <= gap, numbered.c.dt)])
+
+        start = func.min(numbered.c.time).label('start')
+
+        return db.session.query(
+            numbered.c.pilot_id, start,
+            func.max(numbered.c.time).label('end'),
+            func.count().label('num_fixes'),
+            func.min(dt).label('min_dt'),
+            func.max(dt).label('max_dt')) \
+            .group_by(numbered.c.pilot_id, numbered.c.session) \
+            .order_by(numbered.c.pilot_id, start)
+
+    @staticmethod
+    def _to_timedelta(max_age):
+        if isinstance(max_age, (int, long, float)):
+            max_age = timedelta(hours=max_age)
+
+        return max_age
+
+    @classmethod
+    def partition_name(cls, day):
+        """Returns the name of the partition table for the given date."""
+
+        return '{}_{:%Y%m%d}'.format(cls.__tablename__, day)
+
+    @classmethod
+    def partitions(cls):
+        """
+        Returns the names of the existing daily partitions of the
+        ``tracking_fixes`` table by date.
+        """
+
+        query = text(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent '
+            'WHERE p.relname = :parent')
+
+        prefix = cls.__tablename__ + '_'
+
+        partitions = {}
+        for name, in db.session.execute(query, dict(parent=cls.__tablename__)):
+            try:
+                day = datetime.strptime(name[len(prefix):], '%Y%m%d').date()
+            except ValueError:
+                continue
+
+            partitions[day] = name
+
+        return partitions
+
+    @classmethod
+    def create_partition(cls, day):
+        """
+        Creates the partition table for the fixes of the given date.
+
+        Partitions inherit from ``tracking_fixes``, so all queries on the
+        parent table include them. The CHECK constraint allows PostgreSQL
+        to skip the partitions that don't match the time range of a query.
+        """
+
+        name = cls.partition_name(day)
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        db.session.execute(
+            'CREATE TABLE {name} ('
+            "CHECK (time >= '{start:%Y-%m-%d}' AND time < '{end:%Y-%m-%d}')"
+            ') INHERITS ({parent})'.format(name=name, start=start, end=end,
+                                           parent=cls.__tablename__))
+
+        db.session.execute(
+            'ALTER TABLE {name} ADD PRIMARY KEY (id)'.format(name=name))
+
+        db.session.execute(
+            'ALTER TABLE {name} ADD FOREIGN KEY (pilot_id) '
+            'REFERENCES users (id) ON DELETE CASCADE'.format(name=name))
+
+        db.session.execute(
+            'CREATE INDEX {name}_pilot_time ON {name} (pilot_id, time)'
+            .format(name=name))
+
+        return name
+
+    @classmethod
+    def drop_partition(cls, day):
+        db.session.execute('DROP TABLE {}'.format(cls.partition_name(day)))
+
+    @classmethod
+    def has_fixes(cls, day):
+        """
+        Returns True if there are fixes of the given date, either in its
+        partition or in the ``tracking_fixes`` table itself.
+        """
+
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        return db.session.query(cls.id) \
+            .filter(cls.time >= start) \
+            .filter(cls.time < end) \
+            .first() is not None
+
+    @classmethod
+    def unpartitioned_days(cls, before=None):
+        """
+        Returns the dates of the fixes that are stored in the
+        ``tracking_fixes`` table itself instead of a partition, e.g. because
+        they were written before the partition was created, or not by the
+        ingest buffer.
+        """
+
+        sql = 'SELECT DISTINCT CAST(time AS date) FROM ONLY {}' \
+            .format(cls.__tablename__)
+
+        params = {}
+        if before is not None:
+            sql += ' WHERE time < :before'
+            params['before'] = before
+
+        return sorted(day for day, in db.session.execute(text(sql), params))
+
+    @classmethod
+    def move_to_partition(cls, day):
+        """
+        Moves the fixes of the given date from the ``tracking_fixes`` table
+        itself into their partition and returns their number.
+        """
+
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        result = db.session.execute(text(
+            'WITH moved AS ('
+            'DELETE FROM ONLY {parent} WHERE time >= :start AND time < :end '
+            'RETURNING *'
+            ') INSERT INTO {name} SELECT * FROM moved'.format(
+                parent=cls.__tablename__, name=cls.partition_name(day))),
+            dict(start=start, end=end))
+
+        return result.rowcount
+
 
 db.Index('tracking_fixes_pilot_time', TrackingFix.pilot_id, TrackingFix.time)
 
 
+class TrackingLatest(db.Model):
+    """
+    Reference to the latest fix with a location of every pilot.
+
+    This table is updated whenever new fixes are stored and allows finding
+    the latest fixes without scanning the ``tracking_fixes`` table.
+    """
+
+    __tablename__ = 'tracking_latest'
+
+    pilot_id = db.Column(
+        Integer, db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True)
+    pilot = db.relationship('User', innerjoin=True)
+
+    fix_id = db.Column(Integer, nullable=False)
+    time = db.Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<TrackingLatest: pilot_id={} fix_id={}>' \
+               .format(self.pilot_id, self.fix_id).encode('unicode_escape')
+
+    UPDATE_SQL = (
+        'UPDATE tracking_latest '
+        'SET fix_id = v.fix_id, time = v.time '
+        'FROM ({values}) AS v (pilot_id, fix_id, time) '
+        'WHERE tracking_latest.pilot_id = v.pilot_id '
+        'AND tracking_latest.time <= v.time')
+
+    INSERT_SQL = (
+        'INSERT INTO tracking_latest (pilot_id, fix_id, time) '
+        'SELECT v.pilot_id, v.fix_id, v.time '
+        'FROM ({values}) AS v (pilot_id, fix_id, time) '
+        'WHERE NOT EXISTS (SELECT 1 FROM tracking_latest l '
+        'WHERE l.pilot_id = v.pilot_id)')
+
+    @classmethod
+    def update(cls, fixes):
+        """
+        Stores the newest of the given ``(pilot_id, fix_id, time)`` tuples
+        for each pilot, unless a newer fix is already known.
+        """
+
+        latest = {}
+        for pilot_id, fix_id, time in fixes:
+            if pilot_id not in latest or latest[pilot_id][1] < time:
+                latest[pilot_id] = (fix_id, time)
+
+        if not latest:
+            return
+
+        rows = [(pilot_id, fix_id, time)
+                for pilot_id, (fix_id, time) in latest.iteritems()]
+
+        cls._execute(cls.UPDATE_SQL, rows)
+
+        try:
+            with db.session.begin_nested():
+                cls._execute(cls.INSERT_SQL, rows)
+        except IntegrityError:
+            # another writer (e.g. another worker of the tracking daemon)
+            # has inserted the first row of one of the pilots meanwhile,
+            # so the rows are inserted or updated one by one
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        cls._execute(cls.INSERT_SQL, [row])
+                except IntegrityError:
+                    cls._execute(cls.UPDATE_SQL, [row])
+
+    @staticmethod
+    def _execute(sql, rows):
+        """Executes ``sql`` with the ``(pilot_id, fix_id, time)`` rows."""
+
+        values = []
+        params = {}
+        for i, (pilot_id, fix_id, time) in enumerate(rows):
+            values.append('(:pilot_id_{0}, :fix_id_{0}, :time_{0})'.format(i))
+            params['pilot_id_{}'.format(i)] = pilot_id
+            params['fix_id_{}'.format(i)] = fix_id
+            params['time_{}'.format(i)] = time
+
+        values = 'VALUES ' + ', '.join(values)
+        db.session.execute(text(sql.format(values=values)), params)
+
+
 class TrackingSession(db.Model):
     __tablename__ = 'tracking_sessions'
 
@@ -159,6 +481,20 @@ class TrackingSession(db.Model):
     # 4-> "HELP, SERIOUS INJURY"
     finish_status = db.Column(SmallInteger)
 
+    # aggregates of the fixes, maintained by the tracking daemon
+    # (see skylines.tracking.sessions)
+    time_first_fix = db.Column(DateTime)
+    time_last_fix = db.Column(DateTime)
+    num_fixes = db.Column(Integer)
+
+    min_latitude = db.Column(Float)
+    max_latitude = db.Column(Float)
+    min_longitude = db.Column(Float)
+    max_longitude = db.Column(Float)
+
+    min_altitude = db.Column(SmallInteger)
+    max_altitude = db.Column(SmallInteger)
+
     def __repr__(self):
         return '<TrackingSession: id={}>'.format(self.id).encode('unicode_escape')
 
@@ -170,3 +506,134 @@ class TrackingSession(db.Model):
             query = query.filter_by(time_finished=None)
 
         return query.order_by(cls.time_created.desc()).first()
+
+
+db.Index('tracking_sessions_pilot_first_fix',
+         TrackingSession.pilot_id, TrackingSession.time_first_fix)
+
+
+class ArchivedFix(namedtuple('ArchivedFix', [
+        'time', 'latitude', 'longitude', 'altitude', 'elevation',
+        'ground_speed', 'airspeed', 'track', 'vario', 'engine_noise_level'])):
+    """
+    A fix read from the TrackingArchive, with the same attributes as a
+    TrackingFix.
+    """
+
+    @property
+    def location(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+
+        return Location(latitude=self.latitude, longitude=self.longitude)
+
+
+class TrackingArchive(db.Model):
+    """
+    A finished live tracking session, stored as one compressed record
+    instead of one ``tracking_fixes`` row per fix.
+    """
+
+    __tablename__ = 'tracking_archive'
+
+    id = db.Column(Integer, autoincrement=True, primary_key=True)
+
+    pilot_id = db.Column(
+        Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    pilot = db.relationship('User', innerjoin=True)
+
+    start_time = db.Column(DateTime, nullable=False)
+    end_time = db.Column(DateTime, nullable=False)
+    num_fixes = db.Column(Integer, nullable=False)
+
+    # see encode_fixes()
+    data = db.Column(LargeBinary, nullable=False)
+
+    # scale factors of the stored integers
+    SCALES = (1000, 1000000, 1000000, 1, 1, 100, 100, 1, 100, 1)
+
+    def __repr__(self):
+        return '<TrackingArchive: id={} pilot_id={} start_time=\'{}\'>' \
+               .format(self.id, self.pilot_id, self.start_time) \
+               .encode('unicode_escape')
+
+    @classmethod
+    def from_fixes(cls, pilot_id, fixes):
+        """Creates an archive record from a time ordered list of fixes."""
+
+        return cls(pilot_id=pilot_id,
+                   start_time=fixes[0].time,
+                   end_time=fixes[-1].time,
+                   num_fixes=len(fixes),
+                   data=cls.encode_fixes(fixes))
+
+    @classmethod
+    def encode_fixes(cls, fixes):
+        start_time = fixes[0].time
+
+        columns = [[] for scale in cls.SCALES]
+        for fix in fixes:
+            location = fix.location
+
+            dt = fix.time - start_time
+            values = (
+                (dt.days * 86400 + dt.seconds) + dt.microseconds / 1000000.,
+                location and location.latitude,
+                location and location.longitude,
+                fix.altitude, fix.elevation, fix.ground_speed, fix.airspeed,
+                fix.track, fix.vario, fix.engine_noise_level,
+            )
+
+            for column, value, scale in zip(columns, values, cls.SCALES):
+                column.append(None if value is None
+                              else int(round(value * scale)))
+
+        return delta.encode(columns)
+
+    @property
+    def fixes(self):
+        """Returns the list of ArchivedFix tuples of this session."""
+
+        columns = delta.decode(self.data)
+
+        for i, scale in enumerate(self.SCALES):
+            if scale != 1:
+                columns[i] = [None if value is None else float(value) / scale
+                              for value in columns[i]]
+
+        columns[0] = [self.start_time + timedelta(seconds=value)
+                      for value in columns[0]]
+
+        return [ArchivedFix(*values) for values in zip(*columns)]
+
+    @classmethod
+    def get_fixes(cls, pilot_id, min_time=None, max_time=None):
+        """
+        Returns the time ordered archived fixes of a pilot, optionally
+        limited to the given time range.
+        """
+
+        query = cls.query(pilot_id=pilot_id).order_by(cls.start_time)
+
+        if min_time is not None:
+            query = query.filter(cls.end_time >= min_time)
+
+        if max_time is not None:
+            query = query.filter(cls.start_time <= max_time)
+
+        fixes = []
+        for archive in query:
+            for fix in archive.fixes:
+                if min_time is not None and fix.time < min_time:
+                    continue
+
+                if max_time is not None and fix.time > max_time:
+                    break
+
+                fixes.append(fix)
+
+        return fixes
+
+
+db.Index('tracking_archive_pilot_time',
+         TrackingArchive.pilot_id, TrackingArchive.start_time)
@@ -0,0 +1,272 @@
+import threading
+from collections import OrderedDict, namedtuple
+from time import time
+
+from skylines.model import db, User, Follower, TrackingSession
+from skylines.lib import pubsub
+
+INVALIDATION_CHANNEL = 'skylines.tracking.invalidate'
+
+
+class TTLCache(object):
+    """
+    Size limited dictionary with per entry expiration.
+
+    If the cache is full, the least recently written entries are evicted.
+
+    The cache can be shared by several threads. Only the access to the
+    entries is locked, so values are loaded without holding the lock.
+    """
+
+    def __init__(self, ttl, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+
+            expires, value = entry
+            if expires < time():
+                self.entries.pop(key, None)
+                return default
+
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time() + ttl, value)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+
+PilotInfo = namedtuple('PilotInfo', ['id', 'club_id', 'tracking_delay', 'name'])
+
+
+class TrackingKeyCache(object):
+    """
+    Caches the pilot information for tracking keys so that the tracking
+    protocol handlers don't need a database query per packet.
+
+    Unknown keys are cached too, but for a shorter time.
+    """
+
+    MISSING = object()
+
+    def __init__(self, ttl=300, negative_ttl=30, max_size=100000):
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(ttl, max_size=max_size)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns a PilotInfo tuple for the tracking key or None."""
+
+        pilot = self.cache.get(key)
+        if pilot is not None:
+            self.hits += 1
+            return None if pilot is self.MISSING else pilot
+
+        self.misses += 1
+
+        pilot = self.load(key)
+        if pilot is None:
+            self.cache.set(key, self.MISSING, ttl=self.negative_ttl)
+        else:
+            self.cache.set(key, pilot)
+
+        return pilot
+
+    def load(self, key):
+        row = db.session.query(User.id, User.club_id, User.tracking_delay,
+                               User.name) \
+            .filter(User.tracking_key == key).first()
+
+        if row is None:
+            return None
+
+        return PilotInfo(*row)
+
+    def invalidate(self, key=None):
+        self.cache.invalidate(key)
+
+
+class SessionCache(object):
+    """
+    Caches the pilots of the open LiveTrack24 tracking sessions, so that
+    the fixes of a session don't need a database query each.
+
+    Unknown sessions are not cached, because they might have just been
+    opened by another process.
+    """
+
+    def __init__(self, ttl=60, max_size=100000):
+        self.cache = TTLCache(ttl, max_size=max_size)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lt24_id):
+        """Returns the pilot id of the open session or None."""
+
+        pilot_id = self.cache.get(lt24_id)
+        if pilot_id is not None:
+            self.hits += 1
+            return pilot_id
+
+        self.misses += 1
+
+        pilot_id = self.load(lt24_id)
+        if pilot_id is not None:
+            self.cache.set(lt24_id, pilot_id)
+
+        return pilot_id
+
+    def load(self, lt24_id):
+        return db.session.query(TrackingSession.pilot_id) \
+            .filter(TrackingSession.lt24_id == lt24_id) \
+            .filter(TrackingSession.time_finished == None) \
+            .order_by(TrackingSession.time_created.desc()) \
+            .limit(1).scalar()
+
+    def add(self, lt24_id, pilot_id):
+        self.cache.set(lt24_id, pilot_id)
+
+    def invalidate(self, lt24_id=None):
+        self.cache.invalidate(lt24_id)
+
+
+class RelationCache(object):
+    """
+    Caches the followees of the pilots and the members of the clubs, so
+    that traffic requests don't need a database query per packet.
+    """
+
+    def __init__(self, ttl=300, max_size=100000):
+        self.followees_cache = TTLCache(ttl, max_size=max_size)
+        self.club_members_cache = TTLCache(ttl, max_size=max_size)
+
+        self.hits = 0
+        self.misses = 0
+
+    def followees(self, pilot_id):
+        """Returns the ids of the users that the pilot follows."""
+
+        return self._get(self.followees_cache, pilot_id, self.load_followees)
+
+    def club_members(self, club_id):
+        """Returns the ids of the members of the club."""
+
+        if club_id is None:
+            return frozenset()
+
+        return self._get(self.club_members_cache, club_id,
+                         self.load_club_members)
+
+    def load_followees(self, pilot_id):
+        query = db.session.query(Follower.destination_id) \
+            .filter(Follower.source_id == pilot_id)
+
+        return frozenset(id for id, in query)
+
+    def load_club_members(self, club_id):
+        query = db.session.query(User.id) \
+            .filter(User.club_id == club_id)
+
+        return frozenset(id for id, in query)
+
+    def invalidate_followees(self, pilot_id=None):
+        self.followees_cache.invalidate(pilot_id)
+
+    def invalidate_club(self, club_id=None):
+        self.club_members_cache.invalidate(club_id)
+
+    def _get(self, cache, key, load):
+        value = cache.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+
+        value = load(key)
+        cache.set(key, value)
+        return value
+
+
+def handle_invalidation(message, keys, relations=None, sessions=None):
+    """Applies an invalidation message to the tracking caches."""
+
+    if 'tracking_key' in message:
+        keys.invalidate(message['tracking_key'])
+
+    if sessions is not None and 'lt24_session' in message:
+        sessions.invalidate(message['lt24_session'])
+
+    if relations is None:
+        return
+
+    if 'followees' in message:
+        relations.invalidate_followees(message['followees'])
+
+    if 'club' in message:
+        relations.invalidate_club(message['club'])
+
+
+def invalidate_tracking_key(key):
+    """
+    Notifies the tracking daemon that the pilot information behind a
+    tracking key has changed. This should be called after the change
+    has been committed.
+    """
+
+    if key is not None:
+        pubsub.publish(INVALIDATION_CHANNEL, dict(tracking_key=key))
+
+
+def invalidate_followees(pilot_id):
+    """
+    Notifies the tracking daemon that the pilot has followed or unfollowed
+    someone. This should be called after the change has been committed.
+    """
+
+    pubsub.publish(INVALIDATION_CHANNEL, dict(followees=pilot_id))
+
+
+def invalidate_club(club_id):
+    """
+    Notifies the tracking daemon that the members of a club have changed.
+    This should be called after the change has been committed.
+    """
+
+    if club_id is not None:
+        pubsub.publish(INVALIDATION_CHANNEL, dict(club=club_id))
+
+
+def invalidate_lt24_session(session_id):
+    """
+    Notifies the web processes that a LiveTrack24 session has been
+    finished. This should be called after the change has been committed.
+    """
+
+    pubsub.publish(INVALIDATION_CHANNEL, dict(lt24_session=session_id))
@@ -0,0 +1,242 @@
+import threading
+from Queue import Queue, Empty, Full
+from time import time
+
+from twisted.python import log
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import table as table_clause, column
+
+from skylines.model import db, TrackingFix, TrackingLatest, Elevation
+from skylines.tracking.metrics import Histogram
+
+
+class FixIngestBuffer(object):
+    """
+    Collects parsed tracking fixes and writes them to the ``tracking_fixes``
+    table in bulk from a background thread.
+
+    Fixes are flushed once ``batch_size`` fixes have been collected or
+    ``flush_interval`` seconds have passed. The queue is bounded by
+    ``max_size``; fixes that do not fit are dropped and counted.
+
+    Fixes are inserted directly into the daily partition of their date if
+    it exists (see ``TrackingFix.create_partition()``), and into the
+    ``tracking_fixes`` table otherwise.
+    """
+
+    # seconds until the list of partitions is reloaded for unknown dates
+    PARTITIONS_RELOAD_INTERVAL = 60
+
+    def __init__(self, app, max_size=10000, batch_size=500, flush_interval=1.0):
+        self.app = app
+        self.queue = Queue(max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # counters
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.
+        self.max_flush_latency = 0.
+        self.flush_latency = Histogram()
+
+        self._thread = None
+        self._stopping = threading.Event()
+        self._write_lock = threading.Lock()
+
+        self._partitions = {}
+        self._partitions_loaded = None
+        self._tables = {}
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def put(self, fix):
+        """
+        Enqueues a transient TrackingFix instance for writing.
+
+        Returns False if the queue is full and the fix was dropped.
+        """
+
+        try:
+            self.queue.put_nowait(fix)
+        except Full:
+            self.dropped += 1
+            return False
+
+        self.received += 1
+        return True
+
+    def put_many(self, fixes):
+        """
+        Enqueues several fixes as one entry of the queue, e.g. the fixes of
+        one packet. Either all or none of the fixes are enqueued.
+
+        Returns False if the queue is full and the fixes were dropped.
+        """
+
+        try:
+            self.queue.put_nowait(list(fixes))
+        except Full:
+            self.dropped += len(fixes)
+            return False
+
+        self.received += len(fixes)
+        return True
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='fix-ingest')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the worker thread and writes all remaining fixes."""
+
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        with self.app.app_context():
+            self.flush()
+
+    def flush(self):
+        """
+        Synchronously writes all queued fixes to the database.
+
+        This needs to be called inside of an application context.
+        """
+
+        while True:
+            batch = self._collect(block=False)
+            if not batch:
+                break
+
+            self._write(batch)
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                batch = self._collect(block=True)
+                if batch:
+                    self._write(batch)
+
+    def _collect(self, block):
+        batch = []
+        deadline = time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if block:
+                    timeout = deadline - time()
+                    if timeout <= 0:
+                        break
+
+                    item = self.queue.get(timeout=timeout)
+                else:
+                    item = self.queue.get_nowait()
+            except Empty:
+                break
+
+            # see put_many()
+            if isinstance(item, list):
+                batch.extend(item)
+            else:
+                batch.append(item)
+
+        return batch
+
+    def _write(self, fixes):
+        with self._write_lock:
+            start = time()
+
+            try:
+                result = []
+                for table, rows in self._group_by_table(fixes):
+                    insert = table.insert(inline=True).values(rows).returning(
+                        table.c.id, table.c.pilot_id, table.c.time,
+                        (table.c.location != None).label('has_location'))
+
+                    result.extend(db.session.execute(insert).fetchall())
+
+                db.session.commit()
+            except SQLAlchemyError, e:
+                log.err(e, 'database error')
+                db.session.rollback()
+                self.failed += len(fixes)
+            else:
+                self.written += len(fixes)
+                self._update_latest(result)
+
+            self.flushes += 1
+            self.last_flush_latency = time() - start
+            self.max_flush_latency = max(self.max_flush_latency,
+                                         self.last_flush_latency)
+            self.flush_latency.observe(self.last_flush_latency)
+
+    def _update_latest(self, result):
+        latest = [(row.pilot_id, row.id, row.time)
+                  for row in result if row.has_location]
+
+        try:
+            TrackingLatest.update(latest)
+            db.session.commit()
+        except SQLAlchemyError, e:
+            log.err(e, 'database error')
+            db.session.rollback()
+
+    def _group_by_table(self, fixes):
+        tables = {}
+        for fix in fixes:
+            table = self._table(fix.time.date())
+            tables.setdefault(table, []).append(self._to_row(fix))
+
+        return tables.items()
+
+    def _table(self, day):
+        """Returns the table that the fixes of the given date belong into."""
+
+        name = self._partitions.get(day)
+        if name is None and (
+                self._partitions_loaded is None or
+                time() - self._partitions_loaded > self.PARTITIONS_RELOAD_INTERVAL):
+            self._partitions = TrackingFix.partitions()
+            self._partitions_loaded = time()
+            name = self._partitions.get(day)
+
+        if name is None:
+            return TrackingFix.__table__
+
+        table = self._tables.get(name)
+        if table is None:
+            columns = [column(c.name, c.type)
+                       for c in TrackingFix.__table__.columns]
+            table = self._tables[name] = table_clause(name, *columns)
+
+        return table
+
+    def _to_row(self, fix):
+        # multi-row inserts need plain EWKT strings instead of WKBElements
+        location = fix.location
+        if location is not None:
+            if fix.elevation is None:
+                fix.elevation = Elevation.get_cached(location.latitude,
+                                                     location.longitude)
+
+            location = 'SRID=4326;' + location.to_wkt()
+
+        return dict(time=fix.time,
+                    location=location,
+                    track=fix.track,
+                    ground_speed=fix.ground_speed,
+                    airspeed=fix.airspeed,
+                    altitude=fix.altitude,
+                    elevation=fix.elevation,
+                    vario=fix.vario,
+                    engine_noise_level=fix.engine_noise_level,
+                    pilot_id=fix.pilot_id,
+                    ip=fix.ip)
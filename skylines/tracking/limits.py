@@ -0,0 +1,91 @@
+from collections import OrderedDict, deque
+from time import time
+
+
+class RateLimiter(object):
+    """
+    Token bucket per key. Every key may send ``burst`` packets at once and
+    then ``rate`` packets per second. A ``rate`` of 0 disables the limit.
+
+    The least recently used buckets are dropped if there are more than
+    ``max_size`` of them.
+    """
+
+    def __init__(self, rate, burst, max_size=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self.buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def allow(self, key):
+        """Takes a token from the bucket of ``key`` if there is one."""
+
+        return self.take(key) == 1
+
+    def take(self, key, count=1):
+        """
+        Takes up to ``count`` tokens from the bucket of ``key`` and returns
+        the number of tokens that were taken.
+        """
+
+        if not self.rate:
+            return count
+
+        now = time()
+        tokens, last = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        taken = min(count, int(tokens))
+        tokens -= taken
+
+        self.buckets[key] = (tokens, now)
+        while len(self.buckets) > self.max_size:
+            self.buckets.popitem(last=False)
+
+        return taken
+
+
+class DuplicateFilter(object):
+    """
+    Remembers the last ``window`` time stamps of every pilot to detect
+    retransmitted fixes. The window should cover at least one full
+    TYPE_FIXES packet, so that a retransmitted packet is detected as a
+    whole.
+    """
+
+    def __init__(self, window=80, max_size=100000):
+        self.window = window
+        self.max_size = max_size
+        self.recent = OrderedDict()
+
+    def __len__(self):
+        return len(self.recent)
+
+    def is_duplicate(self, pilot_id, time_of_day_ms):
+        """
+        Returns True if the pilot has already sent a fix with this time
+        stamp, and remembers the time stamp otherwise.
+        """
+
+        recent = self.recent.pop(pilot_id, None)
+        if recent is None:
+            recent = (deque(), set())
+
+        self.recent[pilot_id] = recent
+        while len(self.recent) > self.max_size:
+            self.recent.popitem(last=False)
+
+        # the set answers the lookups, the deque keeps the order
+        times, known = recent
+        if time_of_day_ms in known:
+            return True
+
+        if len(times) >= self.window:
+            known.discard(times.popleft())
+
+        times.append(time_of_day_ms)
+        known.add(time_of_day_ms)
+        return False
@@ -0,0 +1,286 @@
+import struct
+from datetime import datetime
+from math import sin, cos
+from random import random, randint
+from time import time
+
+from twisted.internet.protocol import DatagramProtocol
+
+from skylines.tracking.crc import set_crc
+from skylines.tracking.server import (
+    MAGIC, TYPE_PING, TYPE_ACK, TYPE_FIX, TYPE_TRAFFIC_REQUEST,
+    TYPE_TRAFFIC_RESPONSE, FLAG_LOCATION, FLAG_ALTITUDE, FLAG_GROUND_SPEED,
+    FLAG_TRACK, TRAFFIC_FLAG_FOLLOWEES, TRAFFIC_FLAG_CLUB, TRAFFIC_FLAG_NEARBY,
+)
+
+
+# seconds until a traffic request without response is considered lost
+TRAFFIC_TIMEOUT = 5.
+
+
+def time_of_day_ms(now=None):
+    now = now or datetime.utcnow()
+    return ((now.hour * 60 + now.minute) * 60 + now.second) * 1000 + \
+        now.microsecond / 1000
+
+
+def build_ping(key, ping_id):
+    data = struct.pack('!IHHQHHI', MAGIC, 0, TYPE_PING, key, ping_id, 0, 0)
+    return set_crc(data)
+
+
+def build_fix(key, time, latitude, longitude, altitude, track=0,
+              ground_speed=0):
+    flags = FLAG_LOCATION | FLAG_ALTITUDE | FLAG_TRACK | FLAG_GROUND_SPEED
+    data = struct.pack('!IHHQIIiiIHHHhhH', MAGIC, 0, TYPE_FIX, key,
+                       flags, time,
+                       int(latitude * 1000000), int(longitude * 1000000),
+                       0, track, int(ground_speed * 16), 0, altitude, 0, 0)
+    return set_crc(data)
+
+
+def build_traffic_request(key):
+    data = struct.pack('!IHHQII', MAGIC, 0, TYPE_TRAFFIC_REQUEST, key,
+                       TRAFFIC_FLAG_FOLLOWEES | TRAFFIC_FLAG_CLUB |
+                       TRAFFIC_FLAG_NEARBY, 0)
+    return set_crc(data)
+
+
+def corrupt(data):
+    """Returns the packet with a wrong CRC."""
+    return data[:4] + chr(ord(data[4]) ^ 0xff) + data[5:]
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    values = sorted(values)
+    if not values:
+        return dict((p, None) for p in ps)
+
+    return dict((p, values[min(len(values) - 1, len(values) * p / 100)])
+                for p in ps)
+
+
+class VirtualPilot(object):
+    """A simulated pilot flying circles around a random location."""
+
+    def __init__(self, key):
+        self.key = key
+        self.i = randint(0, 1000)
+        self.latitude = randint(45000, 55000) / 1000.
+        self.longitude = randint(5000, 15000) / 1000.
+        self.altitude = randint(500, 2500)
+
+    def next_fix(self, key=None):
+        self.i += 1
+        return build_fix(key or self.key, time_of_day_ms(),
+                         self.latitude + sin(self.i / 50.) * 0.01,
+                         self.longitude + cos(self.i / 50.) * 0.01,
+                         int(self.altitude + sin(self.i / 20.) * 300),
+                         track=(self.i * 7) % 360, ground_speed=25)
+
+
+def daemon_counters(snapshot):
+    """Returns the fix counters of a metrics snapshot of the daemon."""
+
+    counters = snapshot['counters']
+    ingest = snapshot['gauges'].get('ingest', {})
+
+    return dict(
+        received=ingest.get('received', 0),
+        written=ingest.get('written', 0),
+        dropped=ingest.get('dropped', 0),
+        failed=ingest.get('failed', 0),
+        duplicate=counters.get('fixes_duplicate', 0),
+        rate_limited=counters.get('fixes_rate_limited_pilot', 0) +
+        counters.get('fixes_rate_limited_ip', 0),
+    )
+
+
+class LoadStatistics(object):
+    def __init__(self):
+        self.start = time()
+
+        self.sent = 0
+        self.sent_by_type = dict(fix=0, ping=0, traffic=0, bad_crc=0)
+
+        self.expected_replies = 0
+        self.acks = 0
+        self.traffic_responses = 0
+
+        self.ack_latencies = []
+        self.traffic_latencies = []
+
+        # fix counters of the daemon during the test, if its metrics are
+        # available
+        self.daemon = None
+
+    @property
+    def replies(self):
+        return self.acks + self.traffic_responses
+
+    def add_daemon_metrics(self, before, after):
+        """
+        Adds the fix counters of a daemon worker from its metrics snapshots
+        before and after the test.
+        """
+
+        before = daemon_counters(before)
+        after = daemon_counters(after)
+
+        if self.daemon is None:
+            self.daemon = dict((name, 0) for name in after)
+
+        for name, value in after.items():
+            self.daemon[name] += value - before[name]
+
+    def summary(self):
+        duration = time() - self.start
+
+        drop_rate = None
+        if self.expected_replies:
+            drop_rate = 1 - float(self.replies) / self.expected_replies
+
+        return dict(
+            duration=duration,
+            sent=self.sent,
+            sent_by_type=self.sent_by_type,
+            packets_per_second=self.sent / duration if duration else 0,
+            expected_replies=self.expected_replies,
+            replies=self.replies,
+            drop_rate=drop_rate,
+            ack_latency=percentiles(self.ack_latencies),
+            traffic_latency=percentiles(self.traffic_latencies),
+            daemon=self.daemon,
+        )
+
+
+class LoadClient(DatagramProtocol):
+    """
+    One client socket of the load generator. Replies are matched to the
+    requests by ping id for ACKs. Traffic responses carry no request id, so
+    every socket waits for the response to its traffic request (or for
+    ``TRAFFIC_TIMEOUT``) before it sends the next one.
+    """
+
+    def __init__(self, stats, address):
+        self.stats = stats
+        self.address = address
+
+        self.pings = {}
+        self.traffic_request = None
+        self.ping_id = 0
+
+    def send(self, data):
+        self.transport.write(data, self.address)
+        self.stats.sent += 1
+
+    def send_ping(self, key):
+        self.ping_id = (self.ping_id + 1) % 0x10000
+        self.pings[self.ping_id] = time()
+
+        self.send(build_ping(key, self.ping_id))
+        self.stats.sent_by_type['ping'] += 1
+        self.stats.expected_replies += 1
+
+    def waiting_for_traffic(self):
+        """Returns True if a traffic response is still expected."""
+
+        return self.traffic_request is not None and \
+            time() - self.traffic_request < TRAFFIC_TIMEOUT
+
+    def send_traffic_request(self, key, valid_key=True):
+        # unknown keys don't get a traffic response
+        if valid_key:
+            self.traffic_request = time()
+            self.stats.expected_replies += 1
+
+        self.send(build_traffic_request(key))
+        self.stats.sent_by_type['traffic'] += 1
+
+    def send_fix(self, pilot, key=None, bad_crc=False):
+        data = pilot.next_fix(key)
+        if bad_crc:
+            data = corrupt(data)
+            self.stats.sent_by_type['bad_crc'] += 1
+        else:
+            self.stats.sent_by_type['fix'] += 1
+
+        self.send(data)
+
+    def datagramReceived(self, data, address):
+        if len(data) < 16:
+            return
+
+        now = time()
+        header = struct.unpack('!IHHQ', data[:16])
+        if header[2] == TYPE_ACK and len(data) >= 20:
+            ping_id = struct.unpack('!H', data[16:18])[0]
+            sent = self.pings.pop(ping_id, None)
+            if sent is not None:
+                self.stats.acks += 1
+                self.stats.ack_latencies.append(now - sent)
+
+        elif header[2] == TYPE_TRAFFIC_RESPONSE and \
+                self.traffic_request is not None:
+            sent, self.traffic_request = self.traffic_request, None
+            self.stats.traffic_responses += 1
+            self.stats.traffic_latencies.append(now - sent)
+
+
+class LoadGenerator(object):
+    """
+    Sends the fixes of ``pilots`` virtual pilots every ``interval`` seconds
+    through a pool of client sockets, mixed with pings, traffic requests
+    and broken packets according to the given ratios.
+    """
+
+    def __init__(self, clients, keys, interval=1., traffic_ratio=0.1,
+                 ping_ratio=0.05, bad_crc_ratio=0., bad_key_ratio=0.):
+        self.clients = clients
+        self.pilots = [VirtualPilot(key) for key in keys]
+        self.interval = interval
+
+        self.traffic_ratio = traffic_ratio
+        self.ping_ratio = ping_ratio
+        self.bad_crc_ratio = bad_crc_ratio
+        self.bad_key_ratio = bad_key_ratio
+
+        self.next = 0
+        self.last_tick = None
+        self.budget = 0.
+
+    def tick(self):
+        """Sends all packets that are due since the last call."""
+
+        now = time()
+        if self.last_tick is not None:
+            self.budget += (now - self.last_tick) * \
+                len(self.pilots) / self.interval
+
+            # don't try to catch up more than one interval
+            self.budget = min(self.budget, len(self.pilots))
+
+        self.last_tick = now
+
+        while self.budget >= 1:
+            self.budget -= 1
+            self.send_next()
+
+    def send_next(self):
+        pilot = self.pilots[self.next]
+        client = self.clients[self.next % len(self.clients)]
+        self.next = (self.next + 1) % len(self.pilots)
+
+        key = pilot.key
+        valid_key = random() >= self.bad_key_ratio
+        if not valid_key:
+            key = randint(1, 0xffffffff)
+
+        r = random()
+        if r < self.traffic_ratio and not client.waiting_for_traffic():
+            client.send_traffic_request(key, valid_key=valid_key)
+        elif self.traffic_ratio <= r < self.traffic_ratio + self.ping_ratio:
+            client.send_ping(key)
+        else:
+            client.send_fix(pilot, key=key,
+                            bad_crc=(random() < self.bad_crc_ratio))
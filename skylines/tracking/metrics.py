@@ -0,0 +1,137 @@
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from time import time
+
+from twisted.python import log
+from twisted.web.resource import Resource
+
+
+class Histogram(object):
+    """
+    Counts observed values in cumulative buckets, e.g. latencies in
+    seconds.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1., 5.)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self):
+        buckets = []
+        total = 0
+        for limit, count in zip(self.buckets, self.counts):
+            total += count
+            buckets.append([limit, total])
+
+        return dict(count=self.count, sum=self.sum, max=self.max,
+                    buckets=buckets)
+
+
+class Metrics(object):
+    """
+    Registry of the counters, histograms and gauges of the tracking daemon.
+
+    Gauges are functions that are evaluated when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self.started = time()
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.gauges = {}
+
+    def increment(self, name, value=1):
+        self.counters[name] += value
+
+    def histogram(self, name, buckets=None):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+
+        return histogram
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self):
+        return dict(
+            uptime=time() - self.started,
+            counters=dict(self.counters),
+            histograms=dict((name, histogram.snapshot())
+                            for name, histogram in self.histograms.items()),
+            gauges=dict((name, func()) for name, func in self.gauges.items()),
+        )
+
+
+class MetricsResource(Resource):
+    """Serves a JSON snapshot of the metrics over HTTP."""
+
+    isLeaf = True
+
+    def __init__(self, metrics):
+        Resource.__init__(self)
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps(self.metrics.snapshot(), indent=2)
+
+
+class SampledLog(object):
+    """
+    Writes at most ``rate`` messages per second to the twisted log and
+    reports how many messages were suppressed. A ``rate`` of None logs
+    everything, a ``rate`` of 0 disables the log.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.second = None
+        self.logged = 0
+        self.suppressed = 0
+
+    def msg(self, message):
+        if self.sample():
+            log.msg(message)
+
+    def err(self, message):
+        if self.sample():
+            log.err(message)
+
+    def sample(self):
+        """Returns True if the next message should be logged."""
+
+        if self.rate is None:
+            return True
+
+        if self.rate == 0:
+            self.suppressed += 1
+            return False
+
+        second = int(time())
+        if second != self.second:
+            if self.suppressed and self.second is not None:
+                log.msg('suppressed {} log messages'.format(self.suppressed))
+
+            self.second = second
+            self.logged = 0
+            self.suppressed = 0
+
+        if self.logged >= self.rate:
+            self.suppressed += 1
+            return False
+
+        self.logged += 1
+        return True
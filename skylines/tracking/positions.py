@@ -0,0 +1,242 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from math import cos, floor, radians
+
+from twisted.python import log
+
+from skylines.lib.geo import geographic_distance, METERS_PER_DEGREE
+from skylines.model import db, User, TrackingFix, TrackingLatest
+
+Position = namedtuple('Position', [
+    'pilot_id', 'time', 'latitude', 'longitude', 'altitude',
+])
+
+
+class LivePositions(object):
+    """
+    Keeps the latest known position of every pilot in memory, so that
+    traffic requests can be answered without querying the database.
+
+    The pilots are additionally indexed in a grid of ``cell_size`` degrees
+    to find the pilots near a location quickly.
+    """
+
+    def __init__(self, max_age=timedelta(hours=2), cell_size=0.1):
+        self.max_age = max_age
+        self.positions = {}
+
+        self.cell_size = cell_size
+        self.columns = int(round(360 / cell_size))
+        self.grid = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def update(self, pilot_id, time, latitude, longitude, altitude,
+               nearby=True):
+        """
+        Stores the position of a pilot. Pilots with ``nearby`` unset are
+        not returned by ``nearby()``, e.g. because of a tracking delay.
+        """
+
+        current = self.positions.get(pilot_id)
+        if current is not None and current.time > time:
+            return
+
+        self.positions[pilot_id] = \
+            Position(pilot_id, time, latitude, longitude, altitude)
+
+        if current is not None:
+            self._remove_from_grid(
+                pilot_id, self.cell(current.latitude, current.longitude))
+
+        if nearby:
+            self.grid.setdefault(self.cell(latitude, longitude), set()) \
+                .add(pilot_id)
+
+    def get(self, pilot_id):
+        position = self.positions.get(pilot_id)
+        if position is None or position.time < self.min_time():
+            return None
+
+        return position
+
+    def select(self, pilot_ids):
+        """
+        Returns the recent positions of the given pilots, ordered by pilot id.
+        """
+
+        min_time = self.min_time()
+
+        result = []
+        for pilot_id in sorted(pilot_ids):
+            position = self.positions.get(pilot_id)
+            if position is not None and position.time >= min_time:
+                result.append(position)
+
+        return result
+
+    def nearby(self, latitude, longitude, radius, limit=None):
+        """
+        Returns the recent positions within ``radius`` meters around the
+        given location, ordered by distance.
+        """
+
+        min_time = self.min_time()
+        center = Position(None, None, latitude, longitude, None)
+
+        # cells that intersect the bounding box of the search circle
+        radius_lat = float(radius) / METERS_PER_DEGREE
+        radius_lon = radius_lat / max(cos(radians(latitude)), 0.01)
+
+        min_y, min_x = self.cell(latitude - radius_lat, longitude - radius_lon)
+        max_y, max_x = self.cell(latitude + radius_lat, longitude + radius_lon)
+        if max_x < min_x:
+            max_x += self.columns
+
+        num_x = max_x - min_x + 1
+        if radius_lon * 2 >= 360:
+            min_x, num_x = 0, self.columns
+
+        result = []
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, min_x + num_x):
+                for pilot_id in self.grid.get((y, x % self.columns), ()):
+                    position = self.positions[pilot_id]
+                    if position.time < min_time:
+                        continue
+
+                    distance = geographic_distance(center, position)
+                    if distance <= radius:
+                        result.append((distance, position))
+
+        result.sort()
+        return [item[1] for item in result[:limit]]
+
+    def expire(self):
+        """Drops all positions that are older than ``max_age``."""
+
+        min_time = self.min_time()
+        for pilot_id, position in self.positions.items():
+            if position.time < min_time:
+                del self.positions[pilot_id]
+                self._remove_from_grid(
+                    pilot_id, self.cell(position.latitude, position.longitude))
+
+    def load(self, since=None):
+        """Reads the latest fixes from the ``tracking_latest`` table."""
+
+        for row in self.fetch(since):
+            self.update(*row)
+
+    def fetch(self, since=None):
+        """
+        Returns the latest fixes from the ``tracking_latest`` table as
+        ``update()`` arguments, optionally only those newer than ``since``.
+
+        This doesn't modify the positions and can be called from another
+        thread.
+        """
+
+        query = db.session.query(TrackingFix, User.tracking_delay) \
+            .join(TrackingLatest, TrackingLatest.fix_id == TrackingFix.id) \
+            .join(User, User.id == TrackingFix.pilot_id) \
+            .filter(TrackingFix.max_age_filter(self.max_age)) \
+            .filter(TrackingFix.altitude != None)
+
+        if since is not None:
+            query = query.filter(TrackingLatest.time > since)
+
+        rows = []
+        for fix, tracking_delay in query:
+            location = fix.location
+            if location is None:
+                continue
+
+            rows.append((fix.pilot_id, fix.time, location.latitude,
+                         location.longitude, fix.altitude,
+                         not tracking_delay))
+
+        return rows
+
+    def min_time(self):
+        return datetime.utcnow() - self.max_age
+
+    def cell(self, latitude, longitude):
+        return (int(floor(latitude / self.cell_size)),
+                int(floor(longitude / self.cell_size)) % self.columns)
+
+    def _remove_from_grid(self, pilot_id, cell):
+        pilot_ids = self.grid.get(cell)
+        if pilot_ids is None:
+            return
+
+        pilot_ids.discard(pilot_id)
+        if not pilot_ids:
+            del self.grid[cell]
+
+
+class PositionLoader(object):
+    """
+    Reads the positions that were stored by other processes into
+    LivePositions. The database is queried in a thread of the reactor's
+    thread pool, and only the fixes since the last load are read.
+
+    ``overlap`` covers the fixes that are written with some delay, e.g.
+    by the ingest buffer of another process.
+    """
+
+    def __init__(self, app, positions, overlap=timedelta(minutes=1)):
+        self.app = app
+        self.positions = positions
+        self.overlap = overlap
+
+        self.last_time = None
+        self.running = False
+
+    def load(self):
+        """
+        Synchronously reads the positions, e.g. at startup. This needs to
+        be called inside of an application context.
+        """
+
+        self.apply(self.positions.fetch(self.since()))
+
+    def __call__(self):
+        """Reads the positions in the background and returns a Deferred."""
+
+        from twisted.internet import threads
+
+        # skip the update if the previous one is still running
+        if self.running:
+            return
+
+        self.running = True
+
+        d = threads.deferToThread(self.fetch, self.since())
+        d.addCallback(self.apply)
+        d.addErrback(log.err, 'failed to load the live positions')
+        d.addBoth(self._done)
+        return d
+
+    def since(self):
+        if self.last_time is None:
+            return None
+
+        return self.last_time - self.overlap
+
+    def fetch(self, since):
+        # the thread needs its own application context and session
+        with self.app.app_context():
+            return self.positions.fetch(since)
+
+    def apply(self, rows):
+        for row in rows:
+            self.positions.update(*row)
+
+            time = row[1]
+            if self.last_time is None or time > self.last_time:
+                self.last_time = time
+
+    def _done(self, result):
+        self.running = False
@@ -3,11 +3,13 @@ from datetime import datetime, time, timedelta
 
 from twisted.python import log
 from twisted.internet.protocol import DatagramProtocol
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.sql.expression import and_, or_
 
-from skylines.model import db, User, TrackingFix, Follower, Elevation
+from skylines.model import User, TrackingFix
+from skylines.tracking.cache import TrackingKeyCache, RelationCache
 from skylines.tracking.crc import check_crc, set_crc
+from skylines.tracking.limits import RateLimiter, DuplicateFilter
+from skylines.tracking.metrics import Metrics, SampledLog
+from skylines.tracking.positions import LivePositions
 
 # More information about this protocol can be found in the XCSoar
 # source code, source file src/Tracking/SkyLines/Protocol.hpp
@@ -20,6 +22,7 @@ TYPE_TRAFFIC_REQUEST = 4
 TYPE_TRAFFIC_RESPONSE = 5
 TYPE_USER_NAME_REQUEST = 6
 TYPE_USER_NAME_RESPONSE = 7
+TYPE_FIXES = 8
 
 FLAG_ACK_BAD_KEY = 0x1
 
@@ -34,18 +37,104 @@ FLAG_ENL = 0x40
 # for TYPE_TRAFFIC_REQUEST
 TRAFFIC_FLAG_FOLLOWEES = 0x1
 TRAFFIC_FLAG_CLUB = 0x2
+TRAFFIC_FLAG_NEARBY = 0x4
+
+# maximum number of traffic items per response
+MAX_TRAFFIC = 32
 
 USER_FLAG_NOT_FOUND = 0x1
 
+# for TYPE_FIXES: the number of fixes and four reserved bytes, followed
+# by up to MAX_FIXES fixes in the format of TYPE_FIX
+MAX_FIXES = 40
+
+# buffered fixes of TYPE_FIXES packets are accepted up to this age, older
+# ones can't be told apart from fixes of the next day
+MAX_BUFFERED_AGE = timedelta(hours=12)
+
+HEADER_STRUCT = struct.Struct('!IHHQ')
+FIX_STRUCT = struct.Struct('!IIiiIHHHhhH')
+FIXES_STRUCT = struct.Struct('!HHI')
+
+PACKET_TYPE_NAMES = {
+    TYPE_PING: 'ping',
+    TYPE_FIX: 'fix',
+    TYPE_FIXES: 'fixes',
+    TYPE_TRAFFIC_REQUEST: 'traffic_request',
+    TYPE_USER_NAME_REQUEST: 'user_name_request',
+}
+
 
 class TrackingServer(DatagramProtocol):
+    def __init__(self, ingest, keys=None, positions=None, relations=None,
+                 nearby_radius=10000, nearby_limit=16, metrics=None,
+                 log=None, pilot_limiter=None, ip_limiter=None,
+                 publisher=None, sessions=None):
+        # fixes are written to the database in bulk by the ingest buffer
+        self.ingest = ingest
+
+        # the collaborators define __len__, so an empty instance is falsy
+        # and they need to be compared to None
+
+        # pilot information by tracking key
+        if keys is None:
+            keys = TrackingKeyCache()
+
+        self.keys = keys
+
+        # latest position of every pilot for the traffic requests
+        if positions is None:
+            positions = LivePositions()
+
+        self.positions = positions
+
+        # followees and club members for the traffic requests
+        if relations is None:
+            relations = RelationCache()
+
+        self.relations = relations
+
+        # search radius in meters and maximum number of pilots
+        # for TRAFFIC_FLAG_NEARBY
+        self.nearby_radius = nearby_radius
+        self.nearby_limit = nearby_limit
+
+        if metrics is None:
+            metrics = Metrics()
+
+        self.metrics = metrics
+
+        # per packet log messages, optionally sampled
+        if log is None:
+            log = SampledLog()
+
+        self.log = log
+
+        # protection against retransmitted and flooded fixes, the window
+        # of the duplicate filter covers two full TYPE_FIXES packets
+        self.duplicates = DuplicateFilter(window=2 * MAX_FIXES)
+        if pilot_limiter is None:
+            pilot_limiter = RateLimiter(0, 0)
+
+        if ip_limiter is None:
+            ip_limiter = RateLimiter(0, 0)
+
+        self.pilot_limiter = pilot_limiter
+        self.ip_limiter = ip_limiter
+
+        # optional FixPublisher for the live streams of the web frontend
+        self.publisher = publisher
+
+        # optional SessionTracker that persists the tracking sessions
+        self.sessions = sessions
+
     def pingReceived(self, host, port, key, payload):
         if len(payload) != 8: return
         id, reserved, reserved2 = struct.unpack('!HHI', payload)
 
         flags = 0
 
-        pilot = User.by_tracking_key(key)
+        pilot = self.keys.get(key)
         if not pilot:
             flags |= FLAG_ACK_BAD_KEY
 
@@ -55,46 +144,104 @@ class TrackingServer(DatagramProtocol):
         self.transport.write(data, (host, port))
 
     def fixReceived(self, host, key, payload):
-        if len(payload) != 32: return
+        if len(payload) != FIX_STRUCT.size: return
+
+        pilot = self._check_fix_packet(host, key)
+        if not pilot:
+            return
+
+        data = FIX_STRUCT.unpack_from(payload)
+
+        if self.duplicates.is_duplicate(pilot.id, data[1]):
+            self.metrics.increment('fixes_duplicate')
+            return
+
+        if not self.pilot_limiter.allow(pilot.id):
+            self.metrics.increment('fixes_rate_limited_pilot')
+            return
+
+        fix = self._handle_fix(host, pilot, data)
+        self.ingest.put(fix)
+
+    def fixesReceived(self, host, key, payload):
+        """
+        The client sends several fixes at once, e.g. the fixes that it has
+        buffered during a loss of mobile coverage.
+        """
 
-        pilot = User.by_tracking_key(key)
+        if len(payload) < FIXES_STRUCT.size: return
+
+        count = FIXES_STRUCT.unpack_from(payload)[0]
+        if not 0 < count <= MAX_FIXES or \
+                len(payload) != FIXES_STRUCT.size + count * FIX_STRUCT.size:
+            self.metrics.increment('packets_invalid')
+            return
+
+        pilot = self._check_fix_packet(host, key)
         if not pilot:
-            log.err("No such pilot: %x" % key)
             return
 
-        data = struct.unpack('!IIiiIHHHhhH', payload)
+        # every fix takes a token, the fixes beyond the available tokens
+        # are dropped
+        allowed = self.pilot_limiter.take(pilot.id, count)
+        if allowed < count:
+            self.metrics.increment('fixes_rate_limited_pilot',
+                                   count - allowed)
+
+        fixes = []
+        end = FIXES_STRUCT.size + allowed * FIX_STRUCT.size
+        for offset in xrange(FIXES_STRUCT.size, end, FIX_STRUCT.size):
+            data = FIX_STRUCT.unpack_from(payload, offset)
+
+            if self.duplicates.is_duplicate(pilot.id, data[1]):
+                self.metrics.increment('fixes_duplicate')
+                continue
+
+            fix = self._handle_fix(host, pilot, data, buffered=True)
+            if fix is not None:
+                fixes.append(fix)
+
+        if fixes:
+            self.ingest.put_many(fixes)
+
+    def _check_fix_packet(self, host, key):
+        """Returns the pilot of a fix packet if it should be accepted."""
+
+        if not self.ip_limiter.allow(host):
+            self.metrics.increment('fixes_rate_limited_ip')
+            return None
+
+        pilot = self.keys.get(key)
+        if not pilot:
+            self.metrics.increment('unknown_keys')
+            self.log.err("No such pilot: %x" % key)
+            return None
+
+        return pilot
+
+    def _handle_fix(self, host, pilot, data, buffered=False):
+        """
+        Parses a fix and updates the live positions and sessions. Returns
+        the TrackingFix, or None if it was dropped.
+
+        ``buffered`` fixes were buffered by the client and may be older.
+        """
 
         fix = TrackingFix()
         fix.ip = host
-        fix.pilot = pilot
+        fix.pilot_id = pilot.id
 
-        # import the time stamp from the packet if it's within a
-        # certain range
-        time_of_day_ms = data[1] % (24 * 3600 * 1000)
-        time_of_day_s = time_of_day_ms / 1000
-        time_of_day = time(time_of_day_s / 3600,
-                           (time_of_day_s / 60) % 60,
-                           time_of_day_s % 60,
-                           (time_of_day_ms % 1000) * 1000)
-        now = datetime.utcnow()
-        now_s = ((now.hour * 60) + now.minute) * 60 + now.second
-        if now_s - 1800 < time_of_day_s < now_s + 180:
-            fix.time = datetime.combine(now.date(), time_of_day)
-        elif now_s < 1800 and time_of_day_s > 23 * 3600:
-            # midnight rollover occurred
-            fix.time = (datetime.combine(now.date(), time_of_day) -
-                        timedelta(days=1))
-        else:
-            log.msg("ignoring time stamp from FIX packet: " + str(time_of_day))
+        fix.time = self._get_time(data[1], buffered)
+        if fix.time is None:
+            return None
 
         flags = data[0]
+        latitude = longitude = None
         if flags & FLAG_LOCATION:
             latitude = data[2] / 1000000.
             longitude = data[3] / 1000000.
             fix.set_location(longitude, latitude)
 
-            fix.elevation = Elevation.get(fix.location_wkt)
-
         if flags & FLAG_TRACK:
             fix.track = data[5]
 
@@ -113,70 +260,114 @@ class TrackingServer(DatagramProtocol):
         if flags & FLAG_ENL:
             fix.engine_noise_level = data[10]
 
-        log.msg("{} {} {} {}".format(
-            fix.time and fix.time.time(), host,
-            unicode(pilot).encode('utf8', 'ignore'), fix.location))
+        # formatting the message is expensive, so sample first
+        if self.log.sample():
+            log.msg("{} {} {} {}".format(
+                fix.time and fix.time.time(), host,
+                pilot.name.encode('utf8', 'ignore'), fix.location))
+
+        if flags & FLAG_LOCATION and flags & FLAG_ALTITUDE:
+            self.positions.update(pilot.id, fix.time, latitude, longitude,
+                                  fix.altitude,
+                                  nearby=not pilot.tracking_delay)
+
+            # delayed pilots must not be shown live
+            if self.publisher and not pilot.tracking_delay:
+                self.publisher.add(pilot.id, fix.time, latitude, longitude,
+                                   fix.altitude, track=fix.track,
+                                   ground_speed=fix.ground_speed,
+                                   vario=fix.vario)
+
+        if self.sessions is not None:
+            self.sessions.add(pilot.id, fix.time, latitude, longitude,
+                              fix.altitude)
+
+        return fix
+
+    def _get_time(self, time_of_day_ms, buffered=False):
+        """
+        Returns the time of a fix from the time of day in the packet.
+
+        The time stamp of a single fix is only imported if it's within a
+        certain range, otherwise the current time is used. Buffered fixes
+        are resolved against the current and the previous day, and None is
+        returned if that is not possible.
+        """
+
+        time_of_day_ms = time_of_day_ms % (24 * 3600 * 1000)
+        time_of_day_s = time_of_day_ms / 1000
+        time_of_day = time(time_of_day_s / 3600,
+                           (time_of_day_s / 60) % 60,
+                           time_of_day_s % 60,
+                           (time_of_day_ms % 1000) * 1000)
+        now = datetime.utcnow()
+
+        if buffered:
+            fix_time = datetime.combine(now.date(), time_of_day)
+            if fix_time > now + timedelta(seconds=180):
+                fix_time -= timedelta(days=1)
 
-        db.session.add(fix)
-        try:
-            db.session.commit()
-        except SQLAlchemyError, e:
-            log.err(e, 'database error')
-            db.session.rollback()
+            if fix_time < now - MAX_BUFFERED_AGE:
+                self.metrics.increment('fixes_ignored_time_stamp')
+                self.log.msg("dropping buffered fix with time stamp: " +
+                             str(time_of_day))
+                return None
+
+            return fix_time
+
+        now_s = ((now.hour * 60) + now.minute) * 60 + now.second
+        if now_s - 1800 < time_of_day_s < now_s + 180:
+            return datetime.combine(now.date(), time_of_day)
+        elif now_s < 1800 and time_of_day_s > 23 * 3600:
+            # midnight rollover occurred
+            return (datetime.combine(now.date(), time_of_day) -
+                    timedelta(days=1))
+        else:
+            self.metrics.increment('fixes_ignored_time_stamp')
+            self.log.msg("ignoring time stamp from FIX packet: " +
+                         str(time_of_day))
+            return now
 
     def trafficRequestReceived(self, host, port, key, payload):
         if len(payload) != 8: return
 
-        pilot = User.by_tracking_key(key)
+        pilot = self.keys.get(key)
         if pilot is None:
-            log.err("No such pilot: %d" % key)
+            self.metrics.increment('unknown_keys')
+            self.log.err("No such pilot: %d" % key)
             return
 
         data = struct.unpack('!II', payload)
-        or_filters = []
+        pilot_ids = set()
 
         flags = data[0]
-        if flags & TRAFFIC_FLAG_FOLLOWEES:
-            subq = db.session \
-                .query(Follower.destination_id) \
-                .filter(Follower.source_id == pilot.id) \
-                .subquery()
+        if not flags & (TRAFFIC_FLAG_FOLLOWEES | TRAFFIC_FLAG_CLUB |
+                        TRAFFIC_FLAG_NEARBY):
+            return
 
-            or_filters.append(TrackingFix.pilot_id.in_(subq))
+        if flags & TRAFFIC_FLAG_FOLLOWEES:
+            pilot_ids.update(self.relations.followees(pilot.id))
 
         if flags & TRAFFIC_FLAG_CLUB:
-            subq = db.session \
-                .query(User.id) \
-                .filter(User.club_id == pilot.club_id) \
-                .subquery()
+            pilot_ids.update(self.relations.club_members(pilot.club_id))
 
-            or_filters.append(TrackingFix.pilot_id.in_(subq))
+        pilot_ids.discard(pilot.id)
 
-        if len(or_filters) == 0:
-            return
+        positions = self.positions.select(pilot_ids)
 
-        query = TrackingFix.query() \
-            .distinct(TrackingFix.pilot_id) \
-            .filter(and_(TrackingFix.time >= datetime.utcnow() - timedelta(hours=2),
-                         TrackingFix.pilot_id != pilot.id,
-                         TrackingFix.location_wkt != None,
-                         TrackingFix.altitude != None,
-                         or_(*or_filters))) \
-            .order_by(TrackingFix.pilot_id, TrackingFix.time.desc()) \
-            .limit(32)
+        if flags & TRAFFIC_FLAG_NEARBY:
+            positions.extend(p for p in self.nearby(pilot)
+                             if p.pilot_id not in pilot_ids)
 
         response = ''
         count = 0
-        for fix in query:
-            location = fix.location
-            if location is None: continue
-
-            t = fix.time
+        for position in positions[:MAX_TRAFFIC]:
+            t = position.time
             t = t.hour * 3600000 + t.minute * 60000 + t.second * 1000 + t.microsecond / 1000
-            response += struct.pack('!IIiihHI', fix.pilot_id, t,
-                                    int(location.latitude * 1000000),
-                                    int(location.longitude * 1000000),
-                                    int(fix.altitude), 0, 0)
+            response += struct.pack('!IIiihHI', position.pilot_id, t,
+                                    int(position.latitude * 1000000),
+                                    int(position.longitude * 1000000),
+                                    int(position.altitude), 0, 0)
             count += 1
 
         response = struct.pack('!HBBI', 0, 0, count, 0) + response
@@ -184,14 +375,32 @@ class TrackingServer(DatagramProtocol):
         response = set_crc(response)
         self.transport.write(response, (host, port))
 
+    def nearby(self, pilot):
+        """
+        Returns the positions of the pilots closest to the given pilot,
+        ordered by distance.
+        """
+
+        own = self.positions.get(pilot.id)
+        if own is None:
+            return []
+
+        positions = self.positions.nearby(own.latitude, own.longitude,
+                                          self.nearby_radius,
+                                          limit=self.nearby_limit + 1)
+
+        return [p for p in positions
+                if p.pilot_id != pilot.id][:self.nearby_limit]
+
     def userNameRequestReceived(self, host, port, key, payload):
         """The client asks for the display name of a user account."""
 
         if len(payload) != 8: return
 
-        pilot = User.by_tracking_key(key)
+        pilot = self.keys.get(key)
         if pilot is None:
-            log.err("No such pilot: %d" % key)
+            self.metrics.increment('unknown_keys')
+            self.log.err("No such pilot: %d" % key)
             return
 
         data = struct.unpack('!II', payload)
@@ -217,14 +426,30 @@ class TrackingServer(DatagramProtocol):
         self.transport.write(response, (host, port))
 
     def datagramReceived(self, data, (host, port)):
-        if len(data) < 16: return
+        self.metrics.increment('packets')
+
+        if len(data) < 16:
+            self.metrics.increment('packets_invalid')
+            return
+
+        header = HEADER_STRUCT.unpack_from(data)
+        if header[0] != MAGIC:
+            self.metrics.increment('packets_invalid')
+            return
+
+        if not check_crc(data):
+            self.metrics.increment('packets_bad_crc')
+            return
 
-        header = struct.unpack('!IHHQ', data[:16])
-        if header[0] != MAGIC: return
-        if not check_crc(data): return
+        self.metrics.increment('packets_' +
+                               PACKET_TYPE_NAMES.get(header[2], 'unknown'))
 
         if header[2] == TYPE_FIX:
             self.fixReceived(host, header[3], data[16:])
+        elif header[2] == TYPE_FIXES:
+            # don't copy the potentially large payload
+            self.fixesReceived(host, header[3],
+                               memoryview(data)[HEADER_STRUCT.size:])
         elif header[2] == TYPE_PING:
             self.pingReceived(host, port, header[3], data[16:])
         elif header[2] == TYPE_TRAFFIC_REQUEST:
@@ -0,0 +1,366 @@
+from collections import namedtuple
+from datetime import datetime
+
+from twisted.python import log
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import text
+
+from skylines.model import db, TrackingSession
+from skylines.model.tracking import SESSION_GAP
+
+
+class OpenSession(object):
+    """The aggregates of a live tracking session that is still running."""
+
+    def __init__(self, pilot_id, time):
+        self.id = None
+        self.pilot_id = pilot_id
+
+        self.start = self.end = time
+        self.num_fixes = 0
+
+        self.min_latitude = self.max_latitude = None
+        self.min_longitude = self.max_longitude = None
+        self.min_altitude = self.max_altitude = None
+
+        # number of fixes that have not been written yet
+        self.pending = 0
+        self.finished = False
+
+    def add(self, time, latitude=None, longitude=None, altitude=None):
+        self.start = min(self.start, time)
+        self.end = max(self.end, time)
+        self.num_fixes += 1
+        self.pending += 1
+
+        if latitude is not None and longitude is not None:
+            self.min_latitude = _min(self.min_latitude, latitude)
+            self.max_latitude = _max(self.max_latitude, latitude)
+            self.min_longitude = _min(self.min_longitude, longitude)
+            self.max_longitude = _max(self.max_longitude, longitude)
+
+        if altitude is not None:
+            self.min_altitude = _min(self.min_altitude, altitude)
+            self.max_altitude = _max(self.max_altitude, altitude)
+
+
+def _min(a, b):
+    return b if a is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else max(a, b)
+
+
+# the aggregates of an OpenSession that are written by SessionTracker
+AGGREGATES = [
+    ('min_latitude', 'LEAST', 'double precision'),
+    ('max_latitude', 'GREATEST', 'double precision'),
+    ('min_longitude', 'LEAST', 'double precision'),
+    ('max_longitude', 'GREATEST', 'double precision'),
+    ('min_altitude', 'LEAST', 'integer'),
+    ('max_altitude', 'GREATEST', 'integer'),
+]
+
+SessionUpdate = namedtuple('SessionUpdate', [
+    'session', 'id', 'pilot_id', 'start', 'end', 'pending', 'finished',
+] + [name for name, _, _ in AGGREGATES])
+
+
+class SessionTracker(object):
+    """
+    Detects the live tracking sessions of the pilots while the fixes
+    arrive, and writes them to the ``tracking_sessions`` table when
+    ``flush()`` is called.
+
+    A session is finished if the pilot has not sent a fix for more than
+    ``gap``. The sessions are updated with relative values, so several
+    processes can safely contribute fixes to the same session.
+
+    The tracking daemon writes the sessions with ``flush_in_thread()``,
+    which needs the Flask ``app``.
+    """
+
+    def __init__(self, gap=SESSION_GAP, app=None):
+        self.gap = gap
+        self.app = app
+
+        self.sessions = {}
+        self.finished = []
+
+        # Deferred of the running flush_in_thread() call
+        self.writing = None
+
+        # counters
+        self.opened = 0
+        self.closed = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, pilot_id, time, latitude=None, longitude=None,
+            altitude=None):
+        session = self.sessions.get(pilot_id)
+        if session is not None and time - session.end > self.gap:
+            self._finish(session)
+            session = None
+
+        if session is None:
+            session = self.sessions[pilot_id] = OpenSession(pilot_id, time)
+            self.opened += 1
+
+        session.add(time, latitude, longitude, altitude)
+
+    def load(self, now=None):
+        """Continues the sessions that were open before a restart."""
+
+        if now is None:
+            now = datetime.utcnow()
+
+        query = TrackingSession.query() \
+            .filter(TrackingSession.lt24_id == None) \
+            .filter(TrackingSession.time_finished == None) \
+            .filter(TrackingSession.time_last_fix >= now - self.gap)
+
+        for row in query:
+            session = OpenSession(row.pilot_id, row.time_first_fix)
+            session.id = row.id
+            session.end = row.time_last_fix
+            session.num_fixes = row.num_fixes or 0
+            self.sessions[row.pilot_id] = session
+
+        db.session.expunge_all()
+
+    def flush(self, now=None):
+        """
+        Finishes the sessions without recent fixes and writes all changed
+        sessions to the database.
+
+        This needs to be called inside of an application context.
+        """
+
+        updates = self.collect(now)
+        if not updates:
+            return
+
+        try:
+            ids = self.write(updates)
+        except SQLAlchemyError, e:
+            log.err(e, 'database error')
+            self.restore(updates)
+        else:
+            self.apply(updates, ids)
+
+    def flush_in_thread(self, now=None):
+        """
+        Like ``flush()``, but writes the sessions in the thread pool of the
+        reactor. Returns a Deferred, or None if there is nothing to write
+        or the previous call is still writing.
+        """
+
+        from twisted.internet import threads
+
+        if self.writing is not None:
+            return None
+
+        updates = self.collect(now)
+        if not updates:
+            return None
+
+        def write():
+            with self.app.app_context():
+                return self.write(updates)
+
+        def failed(failure):
+            log.err(failure, 'database error')
+            self.restore(updates)
+
+        def done(result):
+            self.writing = None
+
+        d = self.writing = threads.deferToThread(write)
+        d.addCallbacks(lambda ids: self.apply(updates, ids), failed)
+        d.addBoth(done)
+        return d
+
+    def stop(self):
+        """
+        Waits for the running write and writes the remaining changes, e.g.
+        before the reactor stops. Returns a Deferred.
+        """
+
+        from twisted.internet import defer
+
+        d = self.writing or defer.succeed(None)
+        d.addCallback(lambda _: self.flush_in_thread())
+        return d
+
+    def collect(self, now=None):
+        """
+        Finishes the sessions without recent fixes and returns the changes
+        to write as SessionUpdate tuples. The changes are copied, so that
+        they can be written by another thread.
+        """
+
+        if now is None:
+            now = datetime.utcnow()
+
+        for session in self.sessions.values():
+            if now - session.end > self.gap:
+                self._finish(session)
+
+        finished, self.finished = self.finished, []
+        changed = [session for session in self.sessions.itervalues()
+                   if session.pending]
+
+        updates = []
+        for session in finished + changed:
+            updates.append(SessionUpdate(
+                session, session.id, session.pilot_id, session.start,
+                session.end, session.pending, session.finished,
+                *[getattr(session, name) for name, _, _ in AGGREGATES]))
+
+            session.pending = 0
+
+        return updates
+
+    def restore(self, updates):
+        """Restores the changes of a failed write for the next one."""
+
+        for update in updates:
+            update.session.pending += update.pending
+            if update.finished:
+                self.finished.append(update.session)
+
+    def apply(self, updates, ids):
+        """Stores the ids of the written sessions."""
+
+        for update, id in zip(updates, ids):
+            if update.session.id is None:
+                update.session.id = id
+
+    def write(self, updates):
+        """
+        Writes the changes to the database and returns the ids of the
+        sessions. Only the SessionUpdate tuples are read, so this can be
+        called from another thread.
+        """
+
+        try:
+            ids = []
+            existing = []
+            for update in updates:
+                id = update.id
+                if id is None:
+                    id = self._find(update)
+                    if id is None:
+                        id = self._insert(update)
+                    else:
+                        existing.append(update._replace(id=id))
+                else:
+                    existing.append(update)
+
+                ids.append(id)
+
+            self._update(existing)
+            self._update_finished([
+                update._replace(id=session_id)
+                for update, session_id in zip(updates, ids)
+                if update.finished])
+
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+        return ids
+
+    def _finish(self, session):
+        del self.sessions[session.pilot_id]
+        session.finished = True
+        self.finished.append(session)
+        self.closed += 1
+
+    def _find(self, update):
+        # another process might have opened the session already
+        return db.session.query(TrackingSession.id) \
+            .filter(TrackingSession.pilot_id == update.pilot_id) \
+            .filter(TrackingSession.lt24_id == None) \
+            .filter(TrackingSession.time_finished == None) \
+            .filter(TrackingSession.time_last_fix >=
+                    update.start - self.gap) \
+            .order_by(TrackingSession.time_last_fix.desc()) \
+            .limit(1).scalar()
+
+    def _insert(self, update):
+        row = TrackingSession(
+            pilot_id=update.pilot_id,
+            time_first_fix=update.start,
+            time_last_fix=update.end,
+            num_fixes=update.pending,
+            time_finished=update.end if update.finished else None,
+            **dict((name, getattr(update, name))
+                   for name, _, _ in AGGREGATES))
+
+        db.session.add(row)
+        db.session.flush()
+
+        id = row.id
+        db.session.expunge(row)
+        return id
+
+    def _update(self, updates):
+        """Adds the changes to the sessions with one UPDATE statement."""
+
+        if not updates:
+            return
+
+        columns = [('id', 'integer'), ('start', 'timestamp'),
+                   ('end', 'timestamp'), ('pending', 'integer')] + \
+            [(name, type) for name, _, type in AGGREGATES]
+
+        values = []
+        params = {}
+        for i, update in enumerate(updates):
+            values.append('(' + ', '.join(
+                'CAST(:{0}_{1} AS {2})'.format(name, i, type)
+                for name, type in columns) + ')')
+
+            for name, _ in columns:
+                params['{}_{}'.format(name, i)] = getattr(update, name)
+
+        # least() and greatest() ignore NULL values, and the fixes of
+        # another process might have reopened the session
+        db.session.execute(text(
+            'UPDATE tracking_sessions AS s SET '
+            'time_first_fix = LEAST(s.time_first_fix, v.start), '
+            'time_last_fix = GREATEST(s.time_last_fix, v."end"), '
+            'num_fixes = COALESCE(s.num_fixes, 0) + v.pending, ' +
+            ''.join('{0} = {1}(s.{0}, v.{0}), '.format(name, aggregate)
+                    for name, aggregate, _ in AGGREGATES) +
+            'time_finished = NULL '
+            'FROM (VALUES ' + ', '.join(values) + ') AS v (' +
+            ', '.join('"{}"'.format(name) for name, _ in columns) + ') '
+            'WHERE s.id = v.id'), params)
+
+    def _update_finished(self, updates):
+        """
+        Finishes the sessions, unless another process has received newer
+        fixes.
+        """
+
+        if not updates:
+            return
+
+        values = []
+        params = {}
+        for i, update in enumerate(updates):
+            values.append('(CAST(:id_{0} AS integer), '
+                          'CAST(:end_{0} AS timestamp))'.format(i))
+            params['id_{}'.format(i)] = update.id
+            params['end_{}'.format(i)] = update.end
+
+        db.session.execute(text(
+            'UPDATE tracking_sessions AS s SET time_finished = v."end" '
+            'FROM (VALUES ' + ', '.join(values) + ') AS v (id, "end") '
+            'WHERE s.id = v.id AND s.time_last_fix <= v."end"'), params)
@@ -0,0 +1,115 @@
+import threading
+from Queue import Queue, Empty, Full
+
+from skylines.lib.formatter.datetime import isoformat_utc
+from skylines.lib.pubsub import Publisher, Subscriber
+
+FIXES_CHANNEL = 'skylines.tracking.fixes'
+
+
+class FixPublisher(object):
+    """
+    Collects the fixes received by the tracking daemon and publishes them
+    in batches on FIXES_CHANNEL when ``flush()`` is called.
+    """
+
+    def __init__(self, url):
+        self.publisher = Publisher(url)
+        self.fixes = []
+
+        self.published = 0
+
+    def add(self, pilot_id, time, latitude, longitude, altitude, **kw):
+        fix = dict(pilot_id=pilot_id, time=isoformat_utc(time),
+                   latitude=latitude, longitude=longitude, altitude=altitude)
+
+        fix.update((key, value) for key, value in kw.iteritems()
+                   if value is not None)
+
+        self.fixes.append(fix)
+
+    def flush(self):
+        if not self.fixes:
+            return
+
+        fixes, self.fixes = self.fixes, []
+        self.publisher.publish(FIXES_CHANNEL, dict(fixes=fixes))
+        self.published += len(fixes)
+
+
+class FixListener(object):
+    """
+    Queue of the published fixes that match the given pilots or bounds
+    (a skylines.model.Bounds instance).
+    """
+
+    def __init__(self, pilot_ids=None, bounds=None, max_size=1000):
+        self.pilot_ids = set(pilot_ids or [])
+        self.bounds = bounds
+        self.queue = Queue(max_size)
+        self.dropped = 0
+
+    def accepts(self, fix):
+        if fix['pilot_id'] in self.pilot_ids:
+            return True
+
+        bounds = self.bounds
+        if bounds is None:
+            return False
+
+        if not (bounds.southwest.latitude <= fix['latitude'] <=
+                bounds.northeast.latitude):
+            return False
+
+        west = bounds.southwest.longitude
+        return (fix['longitude'] - west) % 360 <= bounds.get_width()
+
+    def put(self, fix):
+        try:
+            self.queue.put_nowait(fix)
+        except Full:
+            # the client is too slow
+            self.dropped += 1
+
+    def get(self, timeout):
+        """Returns the next fix, or None after ``timeout`` seconds."""
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class FixStream(object):
+    """
+    Distributes the published fixes to all FixListeners of this process,
+    using a single Redis subscription.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.listeners = set()
+        self.lock = threading.Lock()
+        self.subscriber = None
+
+    def add(self, listener):
+        with self.lock:
+            self.listeners.add(listener)
+
+            if self.subscriber is None:
+                self.subscriber = Subscriber(
+                    self.url, [FIXES_CHANNEL], self.dispatch)
+                self.subscriber.start()
+
+    def remove(self, listener):
+        with self.lock:
+            self.listeners.discard(listener)
+
+    def dispatch(self, channel, message):
+        with self.lock:
+            listeners = list(self.listeners)
+
+        for fix in message['fixes']:
+            for listener in listeners:
+                if listener.accepts(fix):
+                    listener.put(fix)
@@ -0,0 +1,106 @@
+import os
+import sys
+import errno
+import signal
+import socket
+import traceback
+from time import sleep
+
+from twisted.python import log
+
+# not exposed by the Python 2 socket module, but available since Linux 3.9
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+
+def bind_udp(port, interface='', reuse_port=False):
+    """
+    Returns a non-blocking UDP socket bound to the given port.
+
+    With ``reuse_port`` several processes can bind to the same port and
+    the kernel distributes the incoming datagrams between them.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+
+    sock.bind((interface, port))
+    sock.setblocking(False)
+    return sock
+
+
+class Supervisor(object):
+    """
+    Forks ``num_workers`` processes that each call ``target(index)`` and
+    restarts them when they exit unexpectedly.
+
+    SIGTERM and SIGINT are forwarded to the workers, and the supervisor
+    returns after all of them have exited.
+    """
+
+    RESTART_DELAY = 1
+
+    def __init__(self, num_workers, target):
+        self.num_workers = num_workers
+        self.target = target
+
+        self.workers = {}
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for index in range(self.num_workers):
+            self.spawn(index)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                elif e.errno == errno.ECHILD:
+                    break
+
+                raise
+
+            index = self.workers.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+
+            log.msg('worker {} (pid {}) exited with status {}, restarting'
+                    .format(index, pid, status))
+
+            sleep(self.RESTART_DELAY)
+            if not self.stopping:
+                self.spawn(index)
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+            status = 0
+            try:
+                self.target(index)
+            except:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        log.msg('started worker {} (pid {})'.format(index, pid))
+        self.workers[pid] = index
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+        for pid in self.workers.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
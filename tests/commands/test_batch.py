@@ -0,0 +1,86 @@
+import pytest
+
+from skylines.commands.batch import BatchCommand
+from skylines.model import db, User
+
+
+class DelayPilots(BatchCommand):
+    """ Changes the column that selects the processed records """
+
+    model = User
+
+    def do(self, user):
+        user.tracking_delay = 1
+        return True
+
+
+def create_users(count):
+    for i in range(count):
+        user = User()
+        user.first_name = u'Pilot {}'.format(i)
+        user.password = u'test'
+        db.session.add(user)
+
+    db.session.commit()
+
+
+def query():
+    return db.session.query(User).filter(User.tracking_delay == 0)
+
+
+@pytest.yield_fixture(scope="function")
+def user_ids(bootstraped_db):
+    create_users(23)
+    yield sorted(id for id, in db.session.query(User.id))
+
+
+class TestBatchCommand:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, user_ids):
+        self.ids = user_ids
+        self.command = DelayPilots()
+
+    def test_iter_batches(self):
+        """ BatchCommand reads every record once, even if it changes """
+
+        ids = []
+        sizes = []
+        for batch in self.command.iter_batches(query(), 10):
+            ids.extend(batch)
+            sizes.append(len(batch))
+
+            # the processed records don't match the query anymore
+            self.command.apply_and_commit(self.command.do,
+                                          self.command.get_batch(batch))
+
+        assert ids == self.ids
+        assert sizes == [10, 10, len(self.ids) - 20]
+
+    def test_run_batches(self):
+        """ BatchCommand processes all records """
+
+        self.command.run_batches(query(), batch_size=10)
+
+        assert query().count() == 0
+
+    def test_dry_run(self, capsys):
+        """ BatchCommand only counts the records in a dry run """
+
+        self.command.run_batches(query(), batch_size=10, dry_run=True)
+
+        out, err = capsys.readouterr()
+        assert out == '{} records would be processed\n'.format(len(self.ids))
+        assert query().count() == len(self.ids)
+
+    def test_parallel(self):
+        """ BatchCommand processes the records in worker processes """
+
+        self.command.run_batches(query(), batch_size=5, jobs=2)
+
+        db.session.expire_all()
+        assert query().count() == 0
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
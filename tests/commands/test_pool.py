@@ -0,0 +1,29 @@
+import pytest
+
+from skylines.commands.pool import create_pool
+from skylines.model import User
+
+
+def _count_users(_):
+    return User.query().count()
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_create_pool():
+    """ Pool workers run in the application context with own connections """
+
+    num_users = User.query().count()
+
+    pool = create_pool(2)
+    try:
+        assert pool.map(_count_users, range(4)) == [num_users] * 4
+    finally:
+        pool.close()
+        pool.join()
+
+    # the connections of the parent process still work
+    assert User.query().count() == num_users
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
@@ -0,0 +1,42 @@
+import pytest
+from datetime import datetime, timedelta
+
+from skylines.commands.tracking.export import Export
+from skylines.model import db, User, TrackingFix, TrackingArchive
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_get_user_ids():
+    """ Export finds the users with live fixes or archived sessions """
+
+    pilot = User.by_tracking_key(123456)
+    other = User.by_email_address(u'manager@somedomain.com')
+
+    start = datetime(2014, 4, 1, 12, 0, 0)
+    fixes = [TrackingFix(time=start + timedelta(seconds=i), pilot=pilot)
+             for i in range(3)]
+    db.session.add_all(fixes)
+
+    db.session.add(TrackingArchive.from_fixes(other.id, fixes))
+    db.session.commit()
+
+    try:
+        assert Export().get_user_ids() == sorted([pilot.id, other.id])
+    finally:
+        TrackingArchive.query().delete()
+        TrackingFix.query().delete()
+        db.session.commit()
+
+
+def test_group_by_logger_id():
+    """ Export groups the users that share a logger id """
+
+    export = Export()
+    assert export.get_logger_id(30) == export.get_logger_id(41)
+    assert export.get_logger_id(1) != export.get_logger_id(30)
+
+    assert export.group_by_logger_id([1, 30, 41]) == [[1], [30, 41]]
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
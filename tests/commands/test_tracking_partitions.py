@@ -0,0 +1,58 @@
+import pytest
+from mock import patch
+from datetime import date, datetime
+
+from flask import current_app
+from skylines.commands.tracking.partitions import DropPartitions
+from skylines.model import db, User, TrackingFix
+
+
+@pytest.yield_fixture(scope="function")
+def partition(bootstraped_db):
+    day = date(2014, 4, 1)
+    name = TrackingFix.create_partition(day)
+
+    pilot = User.by_tracking_key(123456)
+    db.session.add(TrackingFix(time=datetime(2014, 4, 1, 12), pilot=pilot))
+    db.session.commit()
+
+    yield day, name
+
+    db.session.rollback()
+    TrackingFix.query().delete()
+    if day in TrackingFix.partitions():
+        TrackingFix.drop_partition(day)
+
+    db.session.commit()
+
+
+def test_drop_archived(partition, tmpdir):
+    """ DropPartitions archives the partitions before dropping them """
+
+    day, name = partition
+
+    path = str(tmpdir.join('archive'))
+    with patch.dict(current_app.config,
+                    SKYLINES_TRACKING_ARCHIVE_PATH=path):
+        DropPartitions().run(keep_days=30, archive=None, force=False,
+                             dry_run=False)
+
+    assert day not in TrackingFix.partitions()
+    assert tmpdir.join('archive', name + '.csv.gz').check()
+
+
+def test_keep_unarchived(partition):
+    """ DropPartitions keeps partitions with fixes without an archive """
+
+    day, name = partition
+
+    with patch.dict(current_app.config,
+                    SKYLINES_TRACKING_ARCHIVE_PATH=None):
+        DropPartitions().run(keep_days=30, archive=None, force=False,
+                             dry_run=False)
+
+    assert day in TrackingFix.partitions()
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
@@ -0,0 +1,59 @@
+import pytest
+from mock import patch
+
+from skylines.commands.tracking.server import Server
+from skylines.tracking.positions import LivePositions, PositionLoader
+
+OPTIONS = dict(
+    queue_size=100, batch_size=10, flush_interval=1.0, key_ttl=300,
+    stats_port=None, log_rate=None, pilot_rate=2., pilot_burst=10,
+    ip_rate=50., ip_burst=200, session_interval=10.,
+)
+
+
+def create_server(**kw):
+    with patch('twisted.internet.task.LoopingCall') as looping_call, \
+            patch('twisted.internet.reactor.addSystemEventTrigger'):
+        protocol = Server().create_server(**dict(OPTIONS, **kw))
+
+    protocol.ingest.stop()
+
+    tasks = [call[0][0] for call in looping_call.call_args_list]
+    return protocol, tasks
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_create_server():
+    """ Tracking daemon schedules its tasks on the server's collaborators """
+
+    protocol, tasks = create_server()
+
+    # the positions are empty at startup
+    assert isinstance(protocol.positions, LivePositions)
+    assert len(protocol.positions) == 0
+
+    expire = [task for task in tasks
+              if getattr(task, '__name__', None) == 'expire']
+    assert len(expire) == 1
+    assert expire[0].__self__ is protocol.positions
+
+    assert protocol.metrics.gauges['live_positions']() == 0
+
+    assert protocol.pilot_limiter.rate == 2.
+    assert protocol.pilot_limiter.burst == 10
+    assert protocol.ip_limiter.rate == 50.
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_position_loader():
+    """ Tracking daemon reads the positions of other processes """
+
+    protocol, tasks = create_server()
+
+    loaders = [task for task in tasks if isinstance(task, PositionLoader)]
+    assert len(loaders) == 1
+    assert loaders[0].positions is protocol.positions
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime, timedelta
+
+from skylines.commands.tracking.stats import Stats
+from skylines.model import db, User, TrackingFix, TrackingSession
+from skylines.tracking.sessions import SessionTracker
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_recorded_sessions():
+    """ Stats reads the sessions recorded by the tracking daemon """
+
+    pilot = User.by_tracking_key(123456)
+    start = datetime(2014, 4, 1, 10, 0, 0)
+
+    tracker = SessionTracker(gap=timedelta(hours=3))
+    for i in range(3):
+        tracker.add(pilot.id, start + timedelta(seconds=2 * i), 50., 7., 500)
+
+    tracker.flush(now=start + timedelta(seconds=4))
+
+    try:
+        stats = Stats().gather_statistics(pilot.id, recorded=True)
+        assert len(stats) == 1
+        assert stats[0]['pilot'] == dict(id=pilot.id, name=pilot.name)
+        assert stats[0]['num_fixes'] == 3
+
+        session = stats[0]['sessions'][0]
+        assert session['start'] == start
+        assert session['end'] == start + timedelta(seconds=4)
+        assert session['avg_dt'] == 2
+        assert 'min_dt' not in session
+    finally:
+        TrackingSession.query().delete()
+        db.session.commit()
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_sessions_from_fixes():
+    """ Stats finds the sessions in the fixes by default """
+
+    pilot = User.by_tracking_key(123456)
+    start = datetime(2014, 4, 1, 10, 0, 0)
+
+    # fixes without a recorded session, e.g. of LiveTrack24
+    for i in range(3):
+        db.session.add(TrackingFix(time=start + timedelta(seconds=2 * i),
+                                   pilot=pilot))
+
+    db.session.commit()
+
+    try:
+        stats = Stats().gather_statistics(pilot.id)
+        assert len(stats) == 1
+        assert stats[0]['num_fixes'] == 3
+
+        session = stats[0]['sessions'][0]
+        assert session['start'] == start
+        assert session['min_dt'] == 2
+    finally:
+        TrackingFix.query().delete()
+        db.session.commit()
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
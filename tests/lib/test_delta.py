@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from skylines.lib import delta
+
+
+def test_roundtrip():
+    columns = [
+        [0, 1000, 2000, 3500, 1000000],
+        [52700000, 52700100, None, 52699900, -2 ** 40],
+        [None, None, None, None, None],
+    ]
+
+    assert delta.decode(delta.encode(columns)) == columns
+
+
+def test_empty():
+    assert delta.decode(delta.encode([])) == []
+    assert delta.decode(delta.encode([[], []])) == [[], []]
+
+
+def test_compact():
+    # one fix per second for an hour
+    times = range(0, 3600000, 1000)
+    assert len(delta.encode([times])) < 100
+
+
+def test_different_lengths():
+    with pytest.raises(ValueError):
+        delta.encode([[1, 2], [1]])
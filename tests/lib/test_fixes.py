@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from skylines.lib.xcsoar_.fixes import write_fixes, read_fixes
+from skylines.lib.xcsoar_.flightpath import FlightPathFix
+
+MD5 = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+def test_roundtrip(tmpdir):
+    """ The cached fixes match the original fixes """
+
+    path = str(tmpdir.join('flight.igc.fixes'))
+
+    fixes = [
+        FlightPathFix(datetime(2014, 4, 1, 12, 0, 5), 43205,
+                      dict(latitude=51.40375, longitude=-6.41275),
+                      1234, 1200, 10, 180.5, 25.25, None, None, 12),
+        FlightPathFix(datetime(2014, 4, 1, 12, 0, 6), 43206, None, 1240),
+    ]
+
+    write_fixes(path, MD5, fixes)
+
+    cached = read_fixes(path, MD5)
+    assert len(cached) == 2
+
+    assert cached[0].datetime == fixes[0].datetime
+    assert cached[0].seconds_of_day == 43205
+    assert cached[0].location == dict(latitude=51.40375, longitude=-6.41275)
+    assert cached[0][3:] == fixes[0][3:]
+
+    assert cached[1].location is None
+    assert cached[1].altitude == 1240
+    assert cached[1].enl is None
+
+
+def test_outdated(tmpdir):
+    """ Cached fixes of other versions of the IGC file are ignored """
+
+    path = str(tmpdir.join('flight.igc.fixes'))
+    assert read_fixes(path, MD5) is None
+
+    write_fixes(path, MD5, [])
+    assert read_fixes(path, MD5) == []
+    assert read_fixes(path, '0' * 32) is None
@@ -0,0 +1,43 @@
+import pytest
+from mock import Mock, patch
+
+from skylines.lib.pubsub import Subscriber
+
+
+class Stop(Exception):
+    pass
+
+
+def test_subscriber_errors():
+    """ Subscriber continues after broken messages and failing callbacks """
+
+    def callback(channel, message):
+        received.append(message['id'])
+
+    received = []
+
+    pubsub = Mock()
+    pubsub.listen.return_value = iter([
+        dict(type='subscribe', channel='test', data=1),
+        dict(type='message', channel='test', data='{"id": 1}'),
+        dict(type='message', channel='test', data='{broken'),
+        dict(type='message', channel='test', data='{"other": 2}'),
+        dict(type='message', channel='test', data='{"id": 3}'),
+    ])
+
+    redis = Mock()
+    redis.pubsub.return_value = pubsub
+
+    subscriber = Subscriber('redis://localhost', ['test'], callback)
+
+    # the second connection attempt ends the test
+    with patch('skylines.lib.pubsub._connect', side_effect=[redis, Stop()]):
+        with pytest.raises(Stop):
+            subscriber.run()
+
+    assert received == [1, 3]
+    pubsub.subscribe.assert_called_once_with('test')
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
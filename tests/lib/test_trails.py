@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from datetime import datetime, timedelta
+from mock import Mock, patch
+
+from skylines.model import db, User, TrackingFix
+from skylines.lib.trails import Trail, TrailCache
+
+
+def create_fix(time, altitude=1000):
+    fix = TrackingFix(time=time, altitude=altitude)
+    fix.set_location(7.52, 52.7)
+    return fix
+
+
+def test_add():
+    """ Trail converts the fixes to FlightPathFix tuples """
+
+    trail = Trail(1)
+
+    start = datetime(2014, 4, 1, 23, 59, 58)
+    for i in range(3):
+        trail.add(create_fix(start + timedelta(seconds=i)))
+
+    assert trail.times == [86398, 86399, 86400]
+    assert trail.fixes[0].location == {'latitude': 52.7, 'longitude': 7.52}
+
+    assert len(trail.since()) == 3
+    assert [fix.seconds_of_day for fix in trail.since(86399)] == [86399, 86400]
+    assert trail.since(90000) == []
+
+
+def test_add_late():
+    """ Trail inserts late fixes at the position of their time """
+
+    trail = Trail(1)
+
+    start = datetime(2014, 4, 1, 12, 0, 0)
+    for i in [0, 1, 4, 2, 3]:
+        trail.add(create_fix(start + timedelta(seconds=i), altitude=1000 + i))
+
+    assert trail.times == [43200, 43201, 43202, 43203, 43204]
+    assert [fix.altitude for fix in trail.fixes] == range(1000, 1005)
+
+
+def test_cached_results():
+    """ Trail caches the results until new fixes arrive """
+
+    trail = Trail(1)
+    func = Mock(return_value='encoded')
+
+    assert trail.get(None, func) is None
+    assert not func.called
+
+    start = datetime(2014, 4, 1, 12, 0, 0)
+    trail.add(create_fix(start))
+
+    assert trail.get(None, func) == 'encoded'
+    assert trail.get(None, func) == 'encoded'
+    assert func.call_count == 1
+
+    # new fixes invalidate the results
+    trail.add(create_fix(start + timedelta(seconds=1)))
+    trail.get(None, func)
+    assert func.call_count == 2
+
+
+def test_cache_updates():
+    """ TrailCache updates the trails every update_interval seconds """
+
+    pilot = Mock(id=1, tracking_delay=0)
+    trails = TrailCache(update_interval=60)
+
+    with patch.object(Trail, 'update', autospec=True) as update:
+        def set_updated(trail):
+            trail.updated = 1000
+
+        update.side_effect = set_updated
+
+        with patch('skylines.lib.trails.time', return_value=1000):
+            trails.get(pilot, False, None, Mock())
+            trails.get(pilot, False, None, Mock())
+
+        assert update.call_count == 1
+
+        with patch('skylines.lib.trails.time', return_value=1100):
+            trails.get(pilot, False, None, Mock())
+
+        assert update.call_count == 2
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+def test_late_fixes():
+    """ Trail loads fixes that are written after newer fixes """
+
+    pilot = User.by_tracking_key(123456)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    def add_fix(time, altitude):
+        fix = create_fix(time, altitude)
+        fix.pilot = pilot
+        db.session.add(fix)
+        db.session.commit()
+
+    try:
+        add_fix(now - timedelta(seconds=10), 1000)
+        add_fix(now, 1002)
+
+        trail = Trail(pilot.id)
+        trail.update()
+        assert [fix.altitude for fix in trail.fixes] == [1000, 1002]
+
+        # e.g. buffered by the client during a loss of coverage
+        add_fix(now - timedelta(seconds=5), 1001)
+
+        trail.update()
+        assert [fix.altitude for fix in trail.fixes] == [1000, 1001, 1002]
+
+        trail.update()
+        assert len(trail.fixes) == 3
+    finally:
+        TrackingFix.query().delete()
+        db.session.commit()
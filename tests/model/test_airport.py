@@ -0,0 +1,32 @@
+import pytest
+
+from skylines.model import db, Airport, Location
+
+
+@pytest.mark.usefixtures("db")
+class TestAirport:
+
+    def add_airport(self, name, latitude, longitude):
+        airport = Airport(name=name, country_code='de')
+        airport.location = Location(latitude=latitude, longitude=longitude)
+        db.session.add(airport)
+        return airport
+
+    def test_by_locations(self):
+        """ Airport.by_locations() finds the nearest airport per location """
+
+        meiersberg = self.add_airport('Meiersberg', 51.2983, 6.9522)
+        aachen = self.add_airport('Aachen Merzbrueck', 50.8231, 6.1858)
+        db.session.flush()
+
+        locations = [
+            Location(latitude=51.3, longitude=6.95),
+            Location(latitude=50.8, longitude=6.2),
+            Location(latitude=51.29, longitude=6.96),
+        ]
+
+        assert Airport.by_locations(locations) == \
+            [meiersberg, aachen, meiersberg]
+
+    def test_by_locations_empty(self):
+        assert Airport.by_locations([]) == []
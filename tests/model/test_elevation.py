@@ -0,0 +1,49 @@
+from mock import patch
+
+from skylines.model.elevation import ElevationCache
+
+
+class TestElevationCache:
+
+    def test_same_cell(self):
+        """ ElevationCache only looks up each raster cell once """
+
+        cache = ElevationCache()
+
+        with patch.object(cache, 'lookup', return_value=512) as lookup:
+            assert cache.get(50.0, 7.0) == 512
+            assert cache.get(50.0001, 7.0001) == 512
+            assert lookup.call_count == 1
+
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_different_cells(self):
+        """ ElevationCache looks up neighbouring cells separately """
+
+        cache = ElevationCache()
+
+        with patch.object(cache, 'lookup', return_value=None) as lookup:
+            assert cache.get(50.0, 7.0) is None
+            assert cache.get(50.001, 7.0) is None
+            assert cache.get(50.0, 7.0) is None
+            assert lookup.call_count == 2
+
+    def test_lru(self):
+        """ ElevationCache evicts the least recently used cells """
+
+        cache = ElevationCache(max_size=2)
+
+        with patch.object(cache, 'lookup', return_value=100) as lookup:
+            cache.get(50.0, 7.0)
+            cache.get(51.0, 7.0)
+            cache.get(50.0, 7.0)
+            cache.get(52.0, 7.0)
+            assert len(cache) == 2
+            assert lookup.call_count == 3
+
+            cache.get(50.0, 7.0)
+            assert lookup.call_count == 3
+
+            cache.get(51.0, 7.0)
+            assert lookup.call_count == 4
@@ -0,0 +1,78 @@
+import os
+import shutil
+import pytest
+from datetime import datetime, date, timedelta
+
+from skylines.lib import files
+from skylines.model import db, User, Flight, FlightPathLevel, IGCFile
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'data')
+
+
+def test_path_window():
+    """ The flight paths start and end two minutes around the flight """
+
+    flight = Flight(takeoff_time=datetime(2014, 4, 1, 10, 0, 0),
+                    landing_time=datetime(2014, 4, 1, 15, 0, 0))
+
+    assert flight.get_path_window() == \
+        (datetime(2014, 4, 1, 9, 58, 0), datetime(2014, 4, 1, 15, 2, 0))
+
+
+def test_path_window_invalid():
+    """ The flight paths are not limited for invalid flight times """
+
+    flight = Flight(takeoff_time=datetime(2014, 4, 1, 15, 0, 0),
+                    landing_time=datetime(2014, 4, 1, 10, 0, 0))
+
+    assert flight.get_path_window() == (datetime.min, datetime.max)
+
+
+@pytest.yield_fixture(scope="function")
+def flight(bootstraped_db):
+    filename = 'path-levels.igc'
+    path = files.filename_to_path(filename)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    shutil.copy(os.path.join(DATA_PATH, 'simple.igc'), path)
+
+    pilot = User.by_tracking_key(123456)
+
+    igc_file = IGCFile(owner=pilot, filename=filename, md5='path-levels')
+    igc_file.update_igc_headers()
+
+    flight = Flight(pilot=pilot, igc_file=igc_file,
+                    date_local=date(2011, 6, 18),
+                    takeoff_time=datetime(2011, 6, 18, 9, 8, 0),
+                    landing_time=datetime(2011, 6, 18, 9, 15, 0))
+
+    yield flight
+
+    os.remove(path)
+
+
+def test_update_path_levels(flight):
+    """ The flight path levels are found until the flight times change """
+
+    assert flight.update_flight_path()
+    db.session.add(flight)
+    db.session.flush()
+
+    for threshold, max_points in FlightPathLevel.LEVELS:
+        level = FlightPathLevel.get(flight, threshold, max_points)
+        assert level is not None
+        assert level.encode()['locations']
+
+    assert not FlightPathLevel.is_outdated(flight)
+
+    # e.g. the takeoff was detected at another time by the analysis
+    flight.takeoff_time += timedelta(minutes=1)
+    assert FlightPathLevel.get(flight, *FlightPathLevel.LEVELS[0]) is None
+    assert FlightPathLevel.is_outdated(flight)
+
+    flight.update_path_levels()
+    db.session.flush()
+
+    assert FlightPathLevel.get(flight, *FlightPathLevel.LEVELS[0])
+    assert not FlightPathLevel.is_outdated(flight)
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from skylines.model import TrackingFix, TrackingArchive
+from skylines.model.tracking import split_sessions
+
+
+def create_fix(time, latitude=None, longitude=None, altitude=None):
+    fix = TrackingFix(time=time, altitude=altitude, ground_speed=12.5,
+                      track=270)
+
+    if latitude is not None:
+        fix.set_location(longitude, latitude)
+
+    return fix
+
+
+class TestTrackingArchive:
+
+    def test_roundtrip(self):
+        """ TrackingArchive restores the archived fixes """
+
+        start = datetime(2014, 4, 1, 12, 0, 0, 250000)
+        fixes = [
+            create_fix(start, 52.7, 7.52, 1000),
+            create_fix(start + timedelta(seconds=1), 52.700123, 7.520456, 1005),
+            create_fix(start + timedelta(seconds=2)),
+        ]
+
+        archive = TrackingArchive.from_fixes(1, fixes)
+        assert archive.start_time == fixes[0].time
+        assert archive.end_time == fixes[-1].time
+        assert archive.num_fixes == 3
+
+        archived = archive.fixes
+        assert len(archived) == 3
+
+        for fix, archived_fix in zip(fixes, archived):
+            assert archived_fix.time == fix.time
+            assert archived_fix.altitude == fix.altitude
+            assert archived_fix.ground_speed == fix.ground_speed
+            assert archived_fix.track == fix.track
+            assert archived_fix.vario is None
+
+        assert archived[1].location.latitude == 52.700123
+        assert archived[1].location.longitude == 7.520456
+        assert archived[2].location is None
+
+
+def test_split_sessions():
+    start = datetime(2014, 4, 1, 12, 0, 0)
+    fixes = [
+        create_fix(start),
+        create_fix(start + timedelta(hours=1)),
+        create_fix(start + timedelta(hours=5)),
+    ]
+
+    sessions = list(split_sessions(fixes))
+    assert [len(session) for session in sessions] == [2, 1]
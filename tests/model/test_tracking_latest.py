@@ -0,0 +1,59 @@
+import pytest
+from mock import patch
+from datetime import datetime, timedelta
+
+from skylines.model import User, TrackingLatest
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestTrackingLatest:
+
+    def get_latest(self):
+        return dict((latest.pilot_id, (latest.fix_id, latest.time))
+                    for latest in TrackingLatest.query())
+
+    def test_update(self):
+        """ TrackingLatest.update() keeps the newest fix of every pilot """
+
+        pilot = User.by_tracking_key(123456)
+        other = User.by_email_address(u'manager@somedomain.com')
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        TrackingLatest.update([(pilot.id, 1, start),
+                               (pilot.id, 2, start + timedelta(seconds=1))])
+        assert self.get_latest() == {
+            pilot.id: (2, start + timedelta(seconds=1))}
+
+        # older fixes don't replace newer ones
+        TrackingLatest.update([(pilot.id, 3, start),
+                               (other.id, 4, start)])
+        assert self.get_latest() == {
+            pilot.id: (2, start + timedelta(seconds=1)),
+            other.id: (4, start)}
+
+    def test_concurrent_insert(self):
+        """ TrackingLatest.update() updates rows inserted concurrently """
+
+        pilot = User.by_tracking_key(123456)
+        other = User.by_email_address(u'manager@somedomain.com')
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        TrackingLatest.update([(pilot.id, 1, start)])
+
+        # the INSERT fails as if another writer had inserted the row of
+        # the pilot after the UPDATE
+        insert = 'INSERT INTO tracking_latest (pilot_id, fix_id, time) ' \
+                 'SELECT v.pilot_id, v.fix_id, v.time ' \
+                 'FROM ({values}) AS v (pilot_id, fix_id, time)'
+
+        with patch.object(TrackingLatest, 'INSERT_SQL', insert):
+            TrackingLatest.update([(pilot.id, 2, start),
+                                   (other.id, 3, start)])
+
+        assert self.get_latest() == {
+            pilot.id: (2, start),
+            other.id: (3, start)}
+
+
+if __name__ == "__main__":
+    pytest.main(__file__)
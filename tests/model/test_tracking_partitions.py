@@ -0,0 +1,62 @@
+import pytest
+from datetime import date, datetime, timedelta
+
+from skylines.model import db, User, TrackingFix
+
+
+class TestTrackingPartitions:
+
+    @pytest.yield_fixture(autouse=True)
+    def partition(self, bootstraped_db):
+        self.day = date(2014, 4, 1)
+        self.name = TrackingFix.create_partition(self.day)
+        db.session.commit()
+
+        yield
+
+        db.session.rollback()
+        TrackingFix.query().delete()
+        TrackingFix.drop_partition(self.day)
+        db.session.commit()
+
+    def add_fix(self, time):
+        pilot = User.by_tracking_key(123456)
+        db.session.add(TrackingFix(time=time, pilot=pilot))
+        db.session.commit()
+
+    def count(self, sql):
+        return db.session.execute(sql).scalar()
+
+    def test_move_to_partition(self):
+        """ Fixes in the tracking_fixes table are moved into partitions """
+
+        time = datetime(2014, 4, 1, 10, 0, 0)
+
+        # the ORM writes into the tracking_fixes table itself
+        self.add_fix(time)
+        self.add_fix(time + timedelta(days=1))
+
+        assert TrackingFix.has_fixes(self.day)
+        assert TrackingFix.unpartitioned_days() == \
+            [self.day, self.day + timedelta(days=1)]
+        assert TrackingFix.unpartitioned_days(before=self.day + timedelta(
+            days=1)) == [self.day]
+
+        assert TrackingFix.move_to_partition(self.day) == 1
+        db.session.commit()
+
+        assert self.count('SELECT COUNT(*) FROM ' + self.name) == 1
+        assert TrackingFix.unpartitioned_days() == \
+            [self.day + timedelta(days=1)]
+
+        # the parent table still includes the fixes of its partitions
+        assert TrackingFix.query().count() == 2
+
+    def test_has_fixes(self):
+        """ Days without fixes have been archived """
+
+        assert not TrackingFix.has_fixes(self.day)
+
+        self.add_fix(datetime(2014, 4, 1, 23, 59, 59))
+        assert TrackingFix.has_fixes(self.day)
+        assert not TrackingFix.has_fixes(self.day + timedelta(days=1))
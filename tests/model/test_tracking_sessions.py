@@ -0,0 +1,75 @@
+import pytest
+from datetime import datetime, timedelta
+
+from skylines.model import db, User, TrackingFix
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestTrackingSessions:
+
+    def teardown_method(self, method):
+        TrackingFix.query().delete()
+        db.session.commit()
+
+    def add_fixes(self, pilot, start, seconds):
+        for s in seconds:
+            fix = TrackingFix(time=start + timedelta(seconds=s), pilot=pilot)
+            db.session.add(fix)
+
+        db.session.commit()
+
+    def test_get_sessions(self):
+        """ TrackingFix.get_sessions() splits the fixes at large gaps """
+
+        pilot = User.by_tracking_key(123456)
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        # two sessions with a four hour gap
+        self.add_fixes(pilot, start, [0, 2, 7, 4 * 3600, 4 * 3600 + 5])
+
+        sessions = TrackingFix.get_sessions(pilot.id).all()
+        assert len(sessions) == 2
+
+        assert sessions[0].pilot_id == pilot.id
+        assert sessions[0].start == start
+        assert sessions[0].end == start + timedelta(seconds=7)
+        assert sessions[0].num_fixes == 3
+        assert sessions[0].min_dt == 2
+        assert sessions[0].max_dt == 5
+
+        assert sessions[1].start == start + timedelta(hours=4)
+        assert sessions[1].num_fixes == 2
+        assert sessions[1].min_dt == sessions[1].max_dt == 5
+
+    def test_single_fix_session(self):
+        """ TrackingFix.get_sessions() handles sessions with one fix """
+
+        pilot = User.by_tracking_key(123456)
+        self.add_fixes(pilot, datetime(2014, 4, 1, 10, 0, 0), [0])
+
+        sessions = TrackingFix.get_sessions().all()
+        assert len(sessions) == 1
+        assert sessions[0].num_fixes == 1
+        assert sessions[0].min_dt is None
+
+    def test_get_numbered_fixes(self):
+        """ TrackingFix.get_numbered_fixes() numbers the sessions per pilot """
+
+        pilot = User.by_tracking_key(123456)
+        other = User.by_email_address(u'manager@somedomain.com')
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        self.add_fixes(pilot, start, [0, 2, 4 * 3600])
+        self.add_fixes(other, start, [1, 3])
+
+        fixes = TrackingFix.get_numbered_fixes(
+            columns=[TrackingFix.altitude])
+
+        rows = db.session.query(fixes.c.pilot_id, fixes.c.session,
+                                fixes.c.altitude) \
+            .order_by(fixes.c.pilot_id, fixes.c.time).all()
+
+        assert [(row.pilot_id, row.session) for row in rows] == sorted([
+            (pilot.id, 1), (pilot.id, 1), (pilot.id, 2),
+            (other.id, 1), (other.id, 1),
+        ])
@@ -0,0 +1,238 @@
+import pytest
+from mock import patch, Mock
+
+from skylines.model import db, User, Follower
+from skylines.tracking.cache import (
+    TTLCache, TrackingKeyCache, SessionCache, RelationCache,
+    handle_invalidation,
+)
+
+
+class TestTTLCache:
+
+    def test_get_and_set(self):
+        """ TTLCache returns stored values """
+
+        cache = TTLCache(60)
+        assert cache.get('a') is None
+        assert cache.get('a', 42) == 42
+
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert len(cache) == 1
+
+    def test_expiration(self):
+        """ TTLCache drops expired values """
+
+        cache = TTLCache(60)
+
+        with patch('skylines.tracking.cache.time', return_value=1000):
+            cache.set('a', 1)
+            cache.set('b', 2, ttl=5)
+
+        with patch('skylines.tracking.cache.time', return_value=1010):
+            assert cache.get('a') == 1
+            assert cache.get('b') is None
+
+        with patch('skylines.tracking.cache.time', return_value=1100):
+            assert cache.get('a') is None
+
+        assert len(cache) == 0
+
+    def test_max_size(self):
+        """ TTLCache evicts the oldest values if it is full """
+
+        cache = TTLCache(60, max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        assert len(cache) == 2
+        assert cache.get('a') is None
+        assert cache.get('c') == 3
+
+    def test_invalidate(self):
+        """ TTLCache values can be invalidated """
+
+        cache = TTLCache(60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        cache.invalidate('a')
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+
+        cache.invalidate()
+        assert len(cache) == 0
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestTrackingKeyCache:
+
+    def test_known_key(self):
+        """ TrackingKeyCache only queries known keys once """
+
+        keys = TrackingKeyCache()
+
+        pilot = keys.get(123456)
+        assert pilot.id == User.by_tracking_key(123456).id
+        assert pilot.name == u'Example User'
+        assert pilot.tracking_delay == 0
+
+        with patch.object(keys, 'load') as load:
+            assert keys.get(123456) == pilot
+            assert not load.called
+
+        assert keys.misses == 1
+        assert keys.hits == 1
+
+    def test_unlocked_load(self):
+        """ TrackingKeyCache doesn't lock the cache while loading keys """
+
+        keys = TrackingKeyCache()
+
+        def load(key):
+            assert not keys.cache.lock.locked()
+            return None
+
+        with patch.object(keys, 'load', side_effect=load) as load_mock:
+            assert keys.get(654321) is None
+            assert load_mock.called
+
+    def test_unknown_key(self):
+        """ TrackingKeyCache caches unknown keys """
+
+        keys = TrackingKeyCache()
+        assert keys.get(654321) is None
+
+        with patch.object(keys, 'load') as load:
+            assert keys.get(654321) is None
+            assert not load.called
+
+    def test_invalidate(self):
+        """ TrackingKeyCache reloads invalidated keys """
+
+        keys = TrackingKeyCache()
+        assert keys.get(123456) is not None
+
+        keys.invalidate(123456)
+
+        with patch.object(keys, 'load', return_value=None) as load:
+            assert keys.get(123456) is None
+            assert load.called
+
+
+class TestSessionCache:
+
+    def test_open_session(self):
+        """ SessionCache only queries open sessions once """
+
+        sessions = SessionCache()
+
+        with patch.object(sessions, 'load', return_value=5) as load:
+            assert sessions.get(0x80000001) == 5
+            assert sessions.get(0x80000001) == 5
+            assert load.call_count == 1
+
+        assert sessions.misses == 1
+        assert sessions.hits == 1
+
+    def test_unknown_session(self):
+        """ SessionCache does not cache unknown sessions """
+
+        sessions = SessionCache()
+
+        with patch.object(sessions, 'load', return_value=None) as load:
+            assert sessions.get(0x80000001) is None
+            assert sessions.get(0x80000001) is None
+            assert load.call_count == 2
+
+    def test_add_and_invalidate(self):
+        """ SessionCache knows added sessions until they are invalidated """
+
+        sessions = SessionCache()
+        sessions.add(0x80000001, 5)
+
+        with patch.object(sessions, 'load', return_value=None) as load:
+            assert sessions.get(0x80000001) == 5
+            assert not load.called
+
+            sessions.invalidate(0x80000001)
+            assert sessions.get(0x80000001) is None
+            assert load.called
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestRelationCache:
+
+    def test_followees(self):
+        """ RelationCache caches the followees until invalidated """
+
+        pilot = User.by_tracking_key(123456)
+        friend = User.by_email_address(u'manager@somedomain.com')
+
+        relations = RelationCache()
+        assert relations.followees(pilot.id) == frozenset()
+
+        Follower.follow(pilot, friend)
+        db.session.commit()
+
+        assert relations.followees(pilot.id) == frozenset()
+
+        relations.invalidate_followees(pilot.id)
+        assert relations.followees(pilot.id) == frozenset([friend.id])
+
+        assert relations.misses == 2
+        assert relations.hits == 1
+
+    def test_no_club(self):
+        """ RelationCache has no club members without a club """
+
+        relations = RelationCache()
+
+        with patch.object(relations, 'load_club_members') as load:
+            assert relations.club_members(None) == frozenset()
+            assert not load.called
+
+
+class TestInvalidation:
+
+    def test_handle_invalidation(self):
+        """ Invalidation messages are applied to the matching caches """
+
+        keys = Mock()
+        relations = Mock()
+
+        handle_invalidation(dict(tracking_key=123), keys, relations)
+        keys.invalidate.assert_called_once_with(123)
+        assert not relations.invalidate_followees.called
+
+        handle_invalidation(dict(followees=5), keys, relations)
+        relations.invalidate_followees.assert_called_once_with(5)
+
+        handle_invalidation(dict(club=7), keys, relations)
+        relations.invalidate_club.assert_called_once_with(7)
+
+    def test_handle_invalidation_keys(self):
+        """ Invalidation messages can be applied to the keys only """
+
+        keys = Mock()
+
+        handle_invalidation(dict(tracking_key=123), keys)
+        keys.invalidate.assert_called_once_with(123)
+
+        handle_invalidation(dict(followees=5), keys)
+        assert keys.invalidate.call_count == 1
+
+    def test_handle_invalidation_sessions(self):
+        """ Invalidation messages drop finished LiveTrack24 sessions """
+
+        keys = Mock()
+        sessions = Mock()
+
+        handle_invalidation(dict(lt24_session=42), keys, sessions=sessions)
+        sessions.invalidate.assert_called_once_with(42)
+        assert not keys.invalidate.called
+
+        handle_invalidation(dict(lt24_session=43), keys)
+        assert sessions.invalidate.call_count == 1
@@ -0,0 +1,104 @@
+from mock import patch
+
+from skylines.tracking.limits import RateLimiter, DuplicateFilter
+
+
+class TestRateLimiter:
+
+    def test_burst(self):
+        """ RateLimiter allows bursts up to the bucket size """
+
+        limiter = RateLimiter(1, 3)
+
+        with patch('skylines.tracking.limits.time', return_value=1000):
+            assert [limiter.allow('a') for i in range(5)] == \
+                [True, True, True, False, False]
+
+            # other keys have their own bucket
+            assert limiter.allow('b')
+
+    def test_refill(self):
+        """ RateLimiter refills the buckets over time """
+
+        limiter = RateLimiter(2, 2)
+
+        with patch('skylines.tracking.limits.time', return_value=1000):
+            assert limiter.allow('a')
+            assert limiter.allow('a')
+            assert not limiter.allow('a')
+
+        with patch('skylines.tracking.limits.time', return_value=1000.5):
+            assert limiter.allow('a')
+            assert not limiter.allow('a')
+
+        with patch('skylines.tracking.limits.time', return_value=1100):
+            assert limiter.allow('a')
+            assert limiter.allow('a')
+            assert not limiter.allow('a')
+
+    def test_take(self):
+        """ RateLimiter takes several tokens up to the available ones """
+
+        limiter = RateLimiter(1, 5)
+
+        with patch('skylines.tracking.limits.time', return_value=1000):
+            assert limiter.take('a', 3) == 3
+            assert limiter.take('a', 3) == 2
+            assert limiter.take('a', 3) == 0
+            assert not limiter.allow('a')
+
+        with patch('skylines.tracking.limits.time', return_value=1001.5):
+            assert limiter.take('a', 3) == 1
+
+    def test_disabled(self):
+        """ RateLimiter without a rate allows everything """
+
+        limiter = RateLimiter(0, 0)
+        assert all(limiter.allow('a') for i in range(100))
+        assert limiter.take('a', 40) == 40
+        assert len(limiter) == 0
+
+    def test_max_size(self):
+        """ RateLimiter drops the least recently used buckets """
+
+        limiter = RateLimiter(1, 1, max_size=2)
+        limiter.allow('a')
+        limiter.allow('b')
+        limiter.allow('c')
+
+        assert len(limiter) == 2
+        assert 'a' not in limiter.buckets
+
+
+class TestDuplicateFilter:
+
+    def test_duplicates(self):
+        """ DuplicateFilter detects repeated time stamps per pilot """
+
+        duplicates = DuplicateFilter()
+        assert not duplicates.is_duplicate(1, 1000)
+        assert not duplicates.is_duplicate(1, 2000)
+        assert not duplicates.is_duplicate(2, 1000)
+
+        assert duplicates.is_duplicate(1, 1000)
+        assert duplicates.is_duplicate(2, 1000)
+
+    def test_window(self):
+        """ DuplicateFilter only remembers the last time stamps """
+
+        duplicates = DuplicateFilter(window=2)
+        duplicates.is_duplicate(1, 1000)
+        duplicates.is_duplicate(1, 2000)
+        duplicates.is_duplicate(1, 3000)
+
+        assert not duplicates.is_duplicate(1, 1000)
+        assert duplicates.is_duplicate(1, 3000)
+
+    def test_retransmitted_packet(self):
+        """ DuplicateFilter detects a full retransmitted TYPE_FIXES packet """
+
+        duplicates = DuplicateFilter()
+        assert not any(duplicates.is_duplicate(1, i * 1000)
+                       for i in range(40))
+
+        assert all(duplicates.is_duplicate(1, i * 1000) for i in range(40))
@@ -0,0 +1,107 @@
+import struct
+from mock import Mock
+
+from skylines.tracking import server, loadtest
+from skylines.tracking.crc import check_crc, set_crc
+from skylines.tracking.loadtest import (
+    build_fix, corrupt, percentiles, LoadStatistics, LoadClient,
+)
+
+
+def test_build_fix():
+    """ Load test fixes can be parsed by the tracking server """
+
+    data = build_fix(123456, 1000, 52.7, 7.52, 1234)
+    assert check_crc(data)
+
+    header = struct.unpack('!IHHQ', data[:16])
+    assert header[0] == server.MAGIC
+    assert header[2] == server.TYPE_FIX
+    assert header[3] == 123456
+
+    fix = struct.unpack('!IIiiIHHHhhH', data[16:])
+    assert fix[1] == 1000
+    assert fix[2] == 52700000
+    assert fix[3] == 7520000
+    assert fix[8] == 1234
+
+
+def test_corrupt():
+    """ Corrupted packets fail the CRC check """
+
+    data = build_fix(123456, 1000, 52.7, 7.52, 1234)
+    assert not check_crc(corrupt(data))
+
+
+def test_percentiles():
+    """ Percentiles are picked from the sorted values """
+
+    result = percentiles(range(100, 0, -1))
+    assert result[50] == 51
+    assert result[90] == 91
+    assert result[99] == 100
+
+    assert percentiles([])[50] is None
+
+
+def test_traffic_responses():
+    """ Load test clients wait for the response to their traffic request """
+
+    stats = LoadStatistics()
+    client = LoadClient(stats, ('127.0.0.1', 5597))
+    client.transport = Mock()
+
+    client.send_traffic_request(3, valid_key=False)
+    assert not client.waiting_for_traffic()
+
+    client.send_traffic_request(1)
+    assert client.waiting_for_traffic()
+    assert stats.expected_replies == 1
+
+    data = struct.pack('!IHHQHBBI', server.MAGIC, 0,
+                       server.TYPE_TRAFFIC_RESPONSE, 0, 0, 0, 0, 0)
+    client.datagramReceived(set_crc(data), None)
+
+    assert stats.traffic_responses == 1
+    assert not client.waiting_for_traffic()
+
+    # responses without a request are ignored
+    client.datagramReceived(set_crc(data), None)
+    assert stats.traffic_responses == 1
+
+
+def test_traffic_timeout():
+    """ Load test clients consider traffic requests lost after a while """
+
+    stats = LoadStatistics()
+    client = LoadClient(stats, ('127.0.0.1', 5597))
+    client.transport = Mock()
+
+    client.send_traffic_request(1)
+    client.traffic_request -= loadtest.TRAFFIC_TIMEOUT
+    assert not client.waiting_for_traffic()
+
+
+def test_daemon_metrics():
+    """ Load test statistics report the fix counters of the daemon """
+
+    def snapshot(received, written, rate_limited):
+        return dict(
+            counters=dict(fixes_rate_limited_ip=rate_limited,
+                          fixes_duplicate=1),
+            gauges=dict(ingest=dict(received=received, written=written,
+                                    dropped=0, failed=0)),
+        )
+
+    stats = LoadStatistics()
+    assert stats.summary()['daemon'] is None
+
+    stats.add_daemon_metrics(snapshot(10, 10, 0), snapshot(110, 100, 50))
+    stats.add_daemon_metrics(dict(counters={}, gauges={}),
+                             snapshot(20, 20, 0))
+
+    daemon = stats.summary()['daemon']
+    assert daemon['received'] == 120
+    assert daemon['written'] == 110
+    assert daemon['rate_limited'] == 50
+    assert daemon['duplicate'] == 1
@@ -0,0 +1,90 @@
+import struct
+from mock import Mock, patch
+
+from skylines.tracking import server
+from skylines.tracking.crc import set_crc
+from skylines.tracking.metrics import Histogram, Metrics, SampledLog
+
+
+class TestHistogram:
+
+    def test_observe(self):
+        """ Histogram counts values in cumulative buckets """
+
+        histogram = Histogram(buckets=(1, 10))
+        histogram.observe(0.5)
+        histogram.observe(5)
+        histogram.observe(50)
+
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 3
+        assert snapshot['sum'] == 55.5
+        assert snapshot['max'] == 50
+        assert snapshot['buckets'] == [[1, 1], [10, 2]]
+
+
+class TestMetrics:
+
+    def test_snapshot(self):
+        """ Metrics snapshots contain counters, histograms and gauges """
+
+        metrics = Metrics()
+        metrics.increment('packets')
+        metrics.increment('packets', 2)
+        metrics.histogram('latency').observe(0.1)
+        metrics.gauge('queue_depth', lambda: 42)
+
+        snapshot = metrics.snapshot()
+        assert snapshot['counters'] == dict(packets=3)
+        assert snapshot['histograms']['latency']['count'] == 1
+        assert snapshot['gauges'] == dict(queue_depth=42)
+
+    def test_tracking_server(self):
+        """ Tracking server counts packets by type and CRC failures """
+
+        metrics = Metrics()
+        protocol = server.TrackingServer(Mock(), keys=Mock(), metrics=metrics)
+        protocol.transport = Mock()
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_PING,
+                              0, 1, 0, 0)
+        message = set_crc(message)
+        bad_message = message[:4] + '\0\0' + message[6:]
+
+        protocol.datagramReceived(message, ('127.0.0.1', 5597))
+        protocol.datagramReceived(bad_message, ('127.0.0.1', 5597))
+        protocol.datagramReceived('short', ('127.0.0.1', 5597))
+
+        assert metrics.counters['packets'] == 3
+        assert metrics.counters['packets_ping'] == 1
+        assert metrics.counters['packets_bad_crc'] == 1
+        assert metrics.counters['packets_invalid'] == 1
+
+
+class TestSampledLog:
+
+    def test_unlimited(self):
+        """ SampledLog logs everything without a rate """
+
+        sampled = SampledLog()
+        assert all(sampled.sample() for i in range(100))
+
+    def test_disabled(self):
+        """ SampledLog logs nothing with a rate of zero """
+
+        sampled = SampledLog(0)
+        assert not any(sampled.sample() for i in range(100))
+
+    def test_rate(self):
+        """ SampledLog logs at most ``rate`` messages per second """
+
+        sampled = SampledLog(2)
+
+        with patch('skylines.tracking.metrics.time', return_value=1000):
+            assert [sampled.sample() for i in range(4)] == \
+                [True, True, False, False]
+
+        with patch('skylines.tracking.metrics.time', return_value=1001), \
+                patch('skylines.tracking.metrics.log') as log:
+            assert sampled.sample()
+            log.msg.assert_called_once_with('suppressed 2 log messages')
@@ -0,0 +1,135 @@
+import pytest
+from datetime import datetime, timedelta
+
+from flask import current_app
+from skylines.model import db, User, TrackingFix, TrackingLatest
+from skylines.tracking.positions import LivePositions, PositionLoader
+
+
+class TestLivePositions:
+
+    def setup(self):
+        self.now = datetime.utcnow()
+        self.positions = LivePositions(max_age=timedelta(hours=2))
+
+    def test_update(self):
+        """ LivePositions keeps the latest position of a pilot """
+
+        self.positions.update(1, self.now - timedelta(minutes=2), 50., 7., 500)
+        self.positions.update(1, self.now - timedelta(minutes=1), 50.1, 7.1, 600)
+        self.positions.update(1, self.now - timedelta(minutes=5), 50.2, 7.2, 700)
+
+        position = self.positions.get(1)
+        assert position.latitude == 50.1
+        assert position.longitude == 7.1
+        assert position.altitude == 600
+
+        assert self.positions.get(2) is None
+
+    def test_select(self):
+        """ LivePositions selects recent positions ordered by pilot """
+
+        self.positions.update(3, self.now, 50., 7., 500)
+        self.positions.update(1, self.now, 51., 8., 500)
+        self.positions.update(2, self.now - timedelta(hours=3), 52., 9., 500)
+
+        selected = self.positions.select([1, 2, 3, 4])
+        assert [p.pilot_id for p in selected] == [1, 3]
+
+    def test_expire(self):
+        """ LivePositions drops old positions """
+
+        self.positions.update(1, self.now, 50., 7., 500)
+        self.positions.update(2, self.now - timedelta(hours=3), 52., 9., 500)
+
+        self.positions.expire()
+
+        assert len(self.positions) == 1
+        assert self.positions.get(1) is not None
+
+    def test_nearby(self):
+        """ LivePositions finds the closest pilots around a location """
+
+        self.positions.update(1, self.now, 50.0, 7.0, 500)
+        self.positions.update(2, self.now, 50.05, 7.05, 500)
+        self.positions.update(3, self.now, 50.01, 6.99, 500)
+        self.positions.update(4, self.now, 51.0, 7.0, 500)
+        self.positions.update(5, self.now - timedelta(hours=3), 50., 7., 500)
+        self.positions.update(6, self.now, 50.0, 7.0, 500, nearby=False)
+
+        nearby = self.positions.nearby(50.0, 7.0, 10000)
+        assert [p.pilot_id for p in nearby] == [1, 3, 2]
+
+        nearby = self.positions.nearby(50.0, 7.0, 10000, limit=2)
+        assert [p.pilot_id for p in nearby] == [1, 3]
+
+    def test_nearby_moving(self):
+        """ LivePositions moves pilots between grid cells """
+
+        self.positions.update(1, self.now - timedelta(minutes=1), 50., 7., 500)
+        self.positions.update(1, self.now, 52., 9., 500)
+
+        assert self.positions.nearby(50., 7., 10000) == []
+        assert [p.pilot_id for p in self.positions.nearby(52., 9., 10000)] == [1]
+
+    def test_nearby_date_line(self):
+        """ LivePositions finds pilots across the date line """
+
+        self.positions.update(1, self.now, -17., 179.99, 500)
+        self.positions.update(2, self.now, -17., -179.99, 500)
+
+        nearby = self.positions.nearby(-17., 179.99, 10000)
+        assert [p.pilot_id for p in nearby] == [1, 2]
+
+
+def add_fix(pilot, time, altitude):
+    fix = TrackingFix(pilot_id=pilot.id, time=time, altitude=altitude)
+    fix.set_location(7.52, 52.7)
+    db.session.add(fix)
+    db.session.flush()
+
+    TrackingLatest.update([(pilot.id, fix.id, fix.time)])
+    db.session.commit()
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestPositionLoader:
+
+    def setup(self):
+        self.positions = LivePositions()
+        self.loader = PositionLoader(current_app._get_current_object(),
+                                     self.positions,
+                                     overlap=timedelta(minutes=1))
+
+    def test_load(self):
+        """ Position loader reads the positions from the database """
+
+        pilot = User.by_tracking_key(123456)
+        time = datetime.utcnow() - timedelta(minutes=10)
+        add_fix(pilot, time, 1000)
+
+        self.loader.load()
+
+        assert self.positions.get(pilot.id).altitude == 1000
+        assert self.loader.last_time == time
+
+    def test_incremental(self):
+        """ Position loader only reads the fixes since the last load """
+
+        pilot = User.by_tracking_key(123456)
+        now = datetime.utcnow()
+        add_fix(pilot, now - timedelta(minutes=10), 1000)
+
+        self.loader.load()
+        assert self.loader.since() == now - timedelta(minutes=11)
+
+        assert self.positions.fetch(self.loader.since()) == []
+
+        add_fix(pilot, now, 1200)
+
+        rows = self.positions.fetch(self.loader.since())
+        assert [row[4] for row in rows] == [1200]
+
+        self.loader.apply(rows)
+        assert self.positions.get(pilot.id).altitude == 1200
+        assert self.loader.last_time == now
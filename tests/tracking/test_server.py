@@ -2,10 +2,14 @@ import pytest
 from unittest import TestCase
 from mock import Mock, patch
 
-from skylines.model import db, TrackingFix
+from flask import current_app
+from skylines.model import db, User, Follower, TrackingFix, TrackingLatest
 
 import struct
 from skylines.tracking import server
+from skylines.tracking.ingest import FixIngestBuffer
+from skylines.tracking.limits import RateLimiter
+from skylines.tracking.positions import PositionLoader
 from skylines.tracking.crc import set_crc, check_crc
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
@@ -16,11 +20,12 @@ class TrackingServerTest(TestCase):
     HOST_PORT = ('127.0.0.1', 5597)
 
     def setUp(self):
-        server.TrackingServer.__init__ = Mock(return_value=None)
-        self.server = server.TrackingServer()
+        self.ingest = FixIngestBuffer(current_app._get_current_object())
+        self.server = server.TrackingServer(self.ingest)
 
     def tearDown(self):
         # Clear the database
+        TrackingLatest.query().delete()
         TrackingFix.query().delete()
 
     def test_ping(self):
@@ -161,9 +166,11 @@ class TrackingServerTest(TestCase):
 
         # Send fake ping message
         self.server.datagramReceived(message, self.HOST_PORT)
+        self.ingest.flush()
 
         # Check if the message was properly received
         assert TrackingFix.query().count() == 0
+        assert self.ingest.received == 0
 
     def test_empty_fix(self):
         """ Tracking server accepts empty fixes """
@@ -182,6 +189,8 @@ class TrackingServerTest(TestCase):
             # Send fake ping message
             self.server.datagramReceived(message, self.HOST_PORT)
 
+        self.ingest.flush()
+
         # Check if the message was properly received and written to the database
         fixes = TrackingFix.query().all()
 
@@ -223,6 +232,8 @@ class TrackingServerTest(TestCase):
             # Send fake ping message
             self.server.datagramReceived(message, self.HOST_PORT)
 
+        self.ingest.flush()
+
         # Check if the message was properly received and written to the database
         fixes = TrackingFix.query().all()
 
@@ -251,10 +262,374 @@ class TrackingServerTest(TestCase):
 
             # Send fake ping message
             self.server.datagramReceived(message, self.HOST_PORT)
+            self.ingest.flush()
 
         # Check if the message was properly received
         assert TrackingFix.query().count() == 0
         assert commitmock.called
+        assert self.ingest.failed == 1
+
+    def test_batched_fixes(self):
+        """ Tracking server writes queued fixes in batches """
+
+        self.ingest.batch_size = 2
+
+        for i in range(5):
+            message = self.create_fix_message(
+                123456, i * 1000, latitude=52.7, longitude=7.52 + i / 100.)
+
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        # Nothing is written before the buffer is flushed
+        assert TrackingFix.query().count() == 0
+        assert self.ingest.queue_depth == 5
+
+        self.ingest.flush()
+
+        assert TrackingFix.query().count() == 5
+        assert self.ingest.queue_depth == 0
+        assert self.ingest.written == 5
+        assert self.ingest.flushes == 3
+
+    def test_full_queue(self):
+        """ Tracking server drops fixes if the ingest queue is full """
+
+        self.ingest = FixIngestBuffer(current_app._get_current_object(),
+                                      max_size=2)
+        self.server.ingest = self.ingest
+
+        for i in range(3):
+            message = self.create_fix_message(123456, i * 1000)
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        assert self.ingest.received == 2
+        assert self.ingest.dropped == 1
+
+        self.ingest.flush()
+
+        assert TrackingFix.query().count() == 2
+
+    def test_latest_fix(self):
+        """ Tracking server updates the latest fixes """
+
+        pilot = User.by_tracking_key(123456)
+
+        for i in range(3):
+            message = self.create_fix_message(
+                123456, i * 1000, latitude=52.7 + i / 10., longitude=7.52,
+                altitude=1000 + i)
+
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        position = self.server.positions.get(pilot.id)
+        assert position.altitude == 1002
+
+        self.ingest.flush()
+
+        latest = TrackingLatest.get(pilot.id)
+        assert latest is not None
+
+        fix = TrackingFix.get(latest.fix_id)
+        assert fix.altitude == 1002
+
+        assert [f.id for f in TrackingFix.get_latest()] == [fix.id]
+
+    def test_partitioned_fixes(self):
+        """ Tracking server writes fixes into the daily partitions """
+
+        day = datetime.utcnow().date()
+        name = TrackingFix.create_partition(day)
+        db.session.commit()
+
+        try:
+            message = self.create_fix_message(123456, 0)
+            self.server.datagramReceived(message, self.HOST_PORT)
+            self.ingest.flush()
+
+            assert TrackingFix.query().count() == 1
+
+            count = db.session.execute(
+                'SELECT COUNT(*) FROM ' + name).scalar()
+            assert count == 1
+        finally:
+            db.session.rollback()
+            TrackingFix.drop_partition(day)
+            db.session.commit()
+
+    def test_duplicate_fixes(self):
+        """ Tracking server drops retransmitted fixes """
+
+        message = self.create_fix_message(123456, 1000)
+        for i in range(3):
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        assert self.ingest.received == 1
+        assert self.server.metrics.counters['fixes_duplicate'] == 2
+
+    def test_rate_limit(self):
+        """ Tracking server limits the fixes per pilot """
+
+        self.server.pilot_limiter = RateLimiter(1, 2)
+
+        for i in range(5):
+            message = self.create_fix_message(123456, i * 1000)
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        assert self.ingest.received == 2
+        assert self.server.metrics.counters['fixes_rate_limited_pilot'] == 3
+
+    def test_rate_limit_constructor(self):
+        """ Tracking server uses the rate limiters it was created with """
+
+        self.server = server.TrackingServer(
+            self.ingest, pilot_limiter=RateLimiter(1, 2),
+            ip_limiter=RateLimiter(1, 3))
+
+        for i in range(5):
+            message = self.create_fix_message(123456, i * 1000)
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        assert self.ingest.received == 2
+        assert self.server.metrics.counters['fixes_rate_limited_pilot'] == 1
+        assert self.server.metrics.counters['fixes_rate_limited_ip'] == 2
+
+    def receive_at(self, message, utcnow):
+        """ Passes the message to the server at the given time """
+
+        with patch('skylines.tracking.server.datetime') as datetime_mock:
+            datetime_mock.combine.side_effect = \
+                lambda *args, **kw: datetime.combine(*args, **kw)
+
+            datetime_mock.utcnow.return_value = utcnow
+
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+    def test_multiple_fixes(self):
+        """ Tracking server accepts several fixes in one packet """
+
+        # every fix takes a token, including the retransmitted one
+        self.server.pilot_limiter = RateLimiter(1, 11)
+
+        payloads = [self.create_fix_message(
+            123456, i * 1000, latitude=52.7, longitude=7.52 + i / 100.,
+            altitude=1000 + i)[16:] for i in range(10)]
+
+        # the last fix is a retransmission
+        payloads.append(payloads[-1])
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_FIXES,
+                              123456, len(payloads), 0, 0)
+        message = set_crc(message + ''.join(payloads))
+
+        self.receive_at(message, datetime(2013, 1, 1, 1, 0, 0))
+        self.ingest.flush()
+
+        fixes = TrackingFix.query().order_by(TrackingFix.time).all()
+        assert len(fixes) == 10
+        assert [fix.altitude for fix in fixes] == range(1000, 1010)
+
+        assert self.server.metrics.counters['packets_fixes'] == 1
+        assert self.server.metrics.counters['fixes_duplicate'] == 1
+        assert self.server.positions.get(self.server.keys.get(123456).id) \
+            .altitude == 1009
+
+    def test_multiple_fixes_rate_limit(self):
+        """ Tracking server drops the fixes of a packet beyond the limit """
+
+        self.server.pilot_limiter = RateLimiter(1, 4)
+
+        payloads = [self.create_fix_message(
+            123456, i * 1000, latitude=52.7, longitude=7.52,
+            altitude=1000 + i)[16:] for i in range(10)]
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_FIXES,
+                              123456, len(payloads), 0, 0)
+        message = set_crc(message + ''.join(payloads))
+
+        self.receive_at(message, datetime(2013, 1, 1, 1, 0, 0))
+        self.ingest.flush()
+
+        fixes = TrackingFix.query().order_by(TrackingFix.time).all()
+        assert [fix.altitude for fix in fixes] == range(1000, 1004)
+
+        assert self.server.metrics.counters['fixes_rate_limited_pilot'] == 6
+
+    def test_retransmitted_fixes(self):
+        """ Tracking server drops a retransmitted TYPE_FIXES packet """
+
+        payloads = [self.create_fix_message(
+            123456, i * 1000, latitude=52.7, longitude=7.52,
+            altitude=1000)[16:] for i in range(server.MAX_FIXES)]
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_FIXES,
+                              123456, len(payloads), 0, 0)
+        message = set_crc(message + ''.join(payloads))
+
+        self.receive_at(message, datetime(2013, 1, 1, 1, 0, 0))
+        assert self.ingest.received == server.MAX_FIXES
+
+        self.receive_at(message, datetime(2013, 1, 1, 1, 0, 0))
+        assert self.ingest.received == server.MAX_FIXES
+        assert self.ingest.queue_depth == 1
+        assert self.server.metrics.counters['fixes_duplicate'] == \
+            server.MAX_FIXES
+
+        self.ingest.flush()
+
+    def test_buffered_fixes(self):
+        """ Tracking server resolves the times of buffered fixes """
+
+        utcnow_return_value = datetime(year=2013, month=1, day=2,
+                                       hour=1, minute=0, second=0)
+
+        times = [23 * 3600, 3540, 12 * 3600 + 1800]
+        payloads = [self.create_fix_message(
+            123456, t * 1000, latitude=52.7, longitude=7.52,
+            altitude=1000)[16:] for t in times]
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_FIXES,
+                              123456, len(payloads), 0, 0)
+        message = set_crc(message + ''.join(payloads))
+
+        with patch('skylines.tracking.server.datetime') as datetime_mock:
+            datetime_mock.combine.side_effect = \
+                lambda *args, **kw: datetime.combine(*args, **kw)
+
+            datetime_mock.utcnow.return_value = utcnow_return_value
+
+            self.server.datagramReceived(message, self.HOST_PORT)
+
+        # the fixes are enqueued as one unit
+        assert self.ingest.queue_depth == 1
+        assert self.ingest.received == 2
+
+        self.ingest.flush()
+
+        fixes = TrackingFix.query().order_by(TrackingFix.time).all()
+        assert [fix.time for fix in fixes] == [
+            datetime(2013, 1, 1, 23, 0, 0),
+            datetime(2013, 1, 2, 0, 59, 0),
+        ]
+
+        # the last fix is too old
+        assert self.server.metrics.counters['fixes_ignored_time_stamp'] == 1
+
+    def test_invalid_multiple_fixes(self):
+        """ Tracking server declines packets with a wrong number of fixes """
+
+        payload = self.create_fix_message(123456, 1000)[16:]
+
+        message = struct.pack('!IHHQHHI', server.MAGIC, 0, server.TYPE_FIXES,
+                              123456, 2, 0, 0)
+        message = set_crc(message + payload)
+
+        self.server.datagramReceived(message, self.HOST_PORT)
+
+        assert self.ingest.received == 0
+        assert self.server.metrics.counters['packets_invalid'] == 1
+
+    def test_traffic_request(self):
+        """ Tracking server answers traffic requests for followees """
+
+        pilot = User.by_tracking_key(123456)
+        friend = User.by_email_address(u'manager@somedomain.com')
+
+        Follower.follow(pilot, friend)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        self.server.positions.update(friend.id, now, 52.7, 7.52, 1234)
+
+        message = struct.pack('!IHHQII', server.MAGIC, 0,
+                              server.TYPE_TRAFFIC_REQUEST, 123456,
+                              server.TRAFFIC_FLAG_FOLLOWEES, 0)
+        message = set_crc(message)
+
+        self.server.transport = Mock()
+        self.server.datagramReceived(message, self.HOST_PORT)
+
+        data, host_port = self.server.transport.write.call_args[0]
+        assert check_crc(data)
+
+        header = struct.unpack('!IHHQ', data[:16])
+        assert header[2] == server.TYPE_TRAFFIC_RESPONSE
+
+        _, _, count, _ = struct.unpack('!HBBI', data[16:24])
+        assert count == 1
+
+        traffic = struct.unpack('!IIiihHI', data[24:])
+        assert traffic[0] == friend.id
+        assert traffic[2] == 52700000
+        assert traffic[3] == 7520000
+        assert traffic[4] == 1234
+
+    def test_database_traffic_request(self):
+        """ Tracking server answers traffic requests for LiveTrack24 pilots """
+
+        pilot = User.by_tracking_key(123456)
+        friend = User.by_email_address(u'manager@somedomain.com')
+
+        Follower.follow(pilot, friend)
+        db.session.commit()
+
+        # LiveTrack24 fixes are written by the web frontend
+        fix = TrackingFix(pilot_id=friend.id, time=datetime.utcnow(),
+                          altitude=1234)
+        fix.set_location(7.52, 52.7)
+        db.session.add(fix)
+        db.session.flush()
+
+        TrackingLatest.update([(friend.id, fix.id, fix.time)])
+        db.session.commit()
+
+        PositionLoader(current_app._get_current_object(),
+                       self.server.positions).load()
+
+        message = struct.pack('!IHHQII', server.MAGIC, 0,
+                              server.TYPE_TRAFFIC_REQUEST, 123456,
+                              server.TRAFFIC_FLAG_FOLLOWEES, 0)
+        message = set_crc(message)
+
+        self.server.transport = Mock()
+        self.server.datagramReceived(message, self.HOST_PORT)
+
+        data, host_port = self.server.transport.write.call_args[0]
+
+        _, _, count, _ = struct.unpack('!HBBI', data[16:24])
+        assert count == 1
+
+        traffic = struct.unpack('!IIiihHI', data[24:])
+        assert traffic[0] == friend.id
+        assert traffic[4] == 1234
+
+    def test_nearby_traffic_request(self):
+        """ Tracking server answers traffic requests for nearby pilots """
+
+        pilot = User.by_tracking_key(123456)
+        other = User.by_email_address(u'manager@somedomain.com')
+
+        now = datetime.utcnow()
+        self.server.positions.update(pilot.id, now, 52.7, 7.52, 1000)
+        self.server.positions.update(other.id, now, 52.71, 7.53, 1234)
+
+        message = struct.pack('!IHHQII', server.MAGIC, 0,
+                              server.TYPE_TRAFFIC_REQUEST, 123456,
+                              server.TRAFFIC_FLAG_NEARBY, 0)
+        message = set_crc(message)
+
+        self.server.transport = Mock()
+        self.server.datagramReceived(message, self.HOST_PORT)
+
+        data, host_port = self.server.transport.write.call_args[0]
+        assert check_crc(data)
+
+        _, _, count, _ = struct.unpack('!HBBI', data[16:24])
+        assert count == 1
+
+        traffic = struct.unpack('!IIiihHI', data[24:])
+        assert traffic[0] == other.id
+        assert traffic[4] == 1234
+
 
 if __name__ == "__main__":
     pytest.main(__file__)
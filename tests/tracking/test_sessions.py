@@ -0,0 +1,128 @@
+import pytest
+from datetime import datetime, timedelta
+
+from skylines.model import db, User, TrackingSession
+from skylines.tracking.sessions import SessionTracker
+
+
+class TestSessionTracker:
+
+    def setup(self):
+        self.start = datetime(2014, 4, 1, 10, 0, 0)
+        self.tracker = SessionTracker(gap=timedelta(hours=3))
+
+    def test_aggregates(self):
+        """ SessionTracker collects the aggregates of the fixes """
+
+        self.tracker.add(1, self.start, 50., 7., 500)
+        self.tracker.add(1, self.start + timedelta(seconds=1), 50.1, 6.9, 600)
+        self.tracker.add(1, self.start + timedelta(seconds=2))
+
+        assert len(self.tracker) == 1
+
+        session = self.tracker.sessions[1]
+        assert session.start == self.start
+        assert session.end == self.start + timedelta(seconds=2)
+        assert session.num_fixes == 3
+        assert session.pending == 3
+        assert (session.min_latitude, session.max_latitude) == (50., 50.1)
+        assert (session.min_longitude, session.max_longitude) == (6.9, 7.)
+        assert (session.min_altitude, session.max_altitude) == (500, 600)
+
+    def test_gap(self):
+        """ SessionTracker starts a new session after a large gap """
+
+        self.tracker.add(1, self.start)
+        self.tracker.add(1, self.start + timedelta(hours=4))
+
+        assert len(self.tracker) == 1
+        assert len(self.tracker.finished) == 1
+        assert self.tracker.finished[0].end == self.start
+        assert self.tracker.sessions[1].start == \
+            self.start + timedelta(hours=4)
+
+        assert self.tracker.opened == 2
+        assert self.tracker.closed == 1
+
+    def test_restore(self):
+        """ SessionTracker keeps the changes of failed writes """
+
+        self.tracker.add(1, self.start)
+        self.tracker.add(1, self.start + timedelta(hours=4))
+
+        updates = self.tracker.collect(now=self.start + timedelta(hours=4))
+        assert [(u.pending, u.finished) for u in updates] == \
+            [(1, True), (1, False)]
+        assert self.tracker.sessions[1].pending == 0
+        assert self.tracker.finished == []
+
+        self.tracker.restore(updates)
+        assert self.tracker.sessions[1].pending == 1
+        assert len(self.tracker.finished) == 1
+
+
+@pytest.mark.usefixtures("bootstraped_db")
+class TestSessionTrackerDatabase:
+
+    def teardown_method(self, method):
+        TrackingSession.query().delete()
+        db.session.commit()
+
+    def test_flush(self):
+        """ SessionTracker writes and finishes the sessions """
+
+        pilot_id = User.by_tracking_key(123456).id
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        tracker = SessionTracker(gap=timedelta(hours=3))
+        tracker.add(pilot_id, start, 50., 7., 500)
+        tracker.flush(now=start)
+
+        tracker.add(pilot_id, start + timedelta(seconds=5), 50.2, 7., 800)
+        tracker.flush(now=start + timedelta(seconds=5))
+
+        session = TrackingSession.query(pilot_id=pilot_id).one()
+        assert session.time_first_fix == start
+        assert session.time_last_fix == start + timedelta(seconds=5)
+        assert session.num_fixes == 2
+        assert session.max_latitude == 50.2
+        assert session.max_altitude == 800
+        assert session.time_finished is None
+
+        tracker.flush(now=start + timedelta(hours=4))
+        assert len(tracker) == 0
+
+        db.session.expire_all()
+        session = TrackingSession.query(pilot_id=pilot_id).one()
+        assert session.time_finished == start + timedelta(seconds=5)
+
+    def test_flush_shared(self):
+        """ SessionTracker adds to the sessions of other processes """
+
+        pilot_id = User.by_tracking_key(123456).id
+        start = datetime(2014, 4, 1, 10, 0, 0)
+
+        first = SessionTracker(gap=timedelta(hours=3))
+        first.add(pilot_id, start, 50., 7., 500)
+        first.add(pilot_id, start + timedelta(seconds=1), 50., 7., 500)
+        first.flush(now=start + timedelta(seconds=1))
+
+        second = SessionTracker(gap=timedelta(hours=3))
+        second.add(pilot_id, start + timedelta(seconds=2), 49., 7., 400)
+        second.flush(now=start + timedelta(seconds=2))
+
+        assert second.sessions[pilot_id].id == first.sessions[pilot_id].id
+
+        db.session.expire_all()
+        session = TrackingSession.query(pilot_id=pilot_id).one()
+        assert session.num_fixes == 3
+        assert session.time_first_fix == start
+        assert session.time_last_fix == start + timedelta(seconds=2)
+        assert (session.min_latitude, session.max_latitude) == (49., 50.)
+        assert (session.min_altitude, session.max_altitude) == (400, 500)
+
+        # the first process didn't see the newer fix of the second one
+        first.flush(now=start + timedelta(hours=3, seconds=1, minutes=1))
+        db.session.expire_all()
+        assert TrackingSession.query(pilot_id=pilot_id).one() \
+            .time_finished is None
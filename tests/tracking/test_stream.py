@@ -0,0 +1,137 @@
+import struct
+from datetime import datetime
+from mock import Mock, patch
+
+from skylines.model import Bounds, Location
+from skylines.tracking import server
+from skylines.tracking.cache import PilotInfo
+from skylines.tracking.crc import set_crc
+from skylines.tracking.stream import FixPublisher, FixListener, FixStream
+
+
+def create_fix(pilot_id, latitude=52.7, longitude=7.52):
+    return dict(pilot_id=pilot_id, latitude=latitude, longitude=longitude)
+
+
+class TestFixPublisher:
+
+    @patch('skylines.tracking.stream.Publisher')
+    def test_flush(self, Publisher):
+        """ FixPublisher publishes the collected fixes in one message """
+
+        publisher = FixPublisher('redis://localhost')
+        publisher.flush()
+        assert not publisher.publisher.publish.called
+
+        time = datetime(2014, 4, 1, 12, 0, 0)
+        publisher.add(1, time, 52.7, 7.52, 1000, track=90, vario=None)
+        publisher.add(2, time, 52.8, 7.53, 1100)
+        publisher.flush()
+
+        channel, message = publisher.publisher.publish.call_args[0]
+        assert len(message['fixes']) == 2
+        assert message['fixes'][0] == dict(
+            pilot_id=1, time='2014-04-01T12:00:00Z', latitude=52.7,
+            longitude=7.52, altitude=1000, track=90)
+
+        assert publisher.fixes == []
+        assert publisher.published == 2
+
+
+class TestFixListener:
+
+    def test_pilots(self):
+        """ FixListener accepts the fixes of the selected pilots """
+
+        listener = FixListener(pilot_ids=[1, 2])
+        assert listener.accepts(create_fix(1))
+        assert not listener.accepts(create_fix(3))
+
+    def test_bounds(self):
+        """ FixListener accepts the fixes inside of the bounds """
+
+        bounds = Bounds(Location(latitude=50, longitude=5),
+                        Location(latitude=55, longitude=10))
+
+        listener = FixListener(bounds=bounds)
+        assert listener.accepts(create_fix(1, 52.7, 7.52))
+        assert not listener.accepts(create_fix(1, 49.0, 7.52))
+        assert not listener.accepts(create_fix(1, 52.7, 11.0))
+
+    def test_bounds_date_line(self):
+        """ FixListener supports bounds across the date line """
+
+        bounds = Bounds(Location(latitude=-20, longitude=170),
+                        Location(latitude=-10, longitude=-170))
+
+        listener = FixListener(bounds=bounds)
+        assert listener.accepts(create_fix(1, -17, 179))
+        assert listener.accepts(create_fix(1, -17, -179))
+        assert not listener.accepts(create_fix(1, -17, 0))
+
+    def test_full_queue(self):
+        """ FixListener drops fixes for slow clients """
+
+        listener = FixListener(pilot_ids=[1], max_size=1)
+        listener.put(create_fix(1))
+        listener.put(create_fix(1))
+
+        assert listener.dropped == 1
+        assert listener.get(timeout=0) is not None
+        assert listener.get(timeout=0) is None
+
+
+class TestFixStream:
+
+    @patch('skylines.tracking.stream.Subscriber')
+    def test_dispatch(self, Subscriber):
+        """ FixStream distributes fixes to the matching listeners """
+
+        stream = FixStream('redis://localhost')
+
+        first = FixListener(pilot_ids=[1])
+        second = FixListener(pilot_ids=[2])
+        stream.add(first)
+        stream.add(second)
+
+        # only one subscription per process
+        assert Subscriber.call_count == 1
+
+        stream.dispatch('channel', dict(fixes=[create_fix(1)]))
+        assert first.get(timeout=0)['pilot_id'] == 1
+        assert second.get(timeout=0) is None
+
+        stream.remove(first)
+        stream.dispatch('channel', dict(fixes=[create_fix(1)]))
+        assert first.get(timeout=0) is None
+
+
+class TestTrackingServer:
+
+    def send_fix(self, tracking_delay):
+        publisher = Mock()
+        keys = Mock()
+        keys.get.return_value = PilotInfo(1, None, tracking_delay, u'Pilot')
+
+        protocol = server.TrackingServer(Mock(), keys=keys,
+                                         publisher=publisher)
+
+        flags = server.FLAG_LOCATION | server.FLAG_ALTITUDE
+        message = struct.pack('!IHHQIIiiIHHHhhH', server.MAGIC, 0,
+                              server.TYPE_FIX, 123456, flags, 0,
+                              52700000, 7520000, 0, 0, 0, 0, 1000, 0, 0)
+
+        protocol.datagramReceived(set_crc(message), ('127.0.0.1', 5597))
+        return publisher
+
+    def test_publish(self):
+        """ Tracking server publishes the fixes of live pilots """
+
+        publisher = self.send_fix(tracking_delay=0)
+        assert publisher.add.call_args[0][0] == 1
+
+    def test_delayed_pilot(self):
+        """ Tracking server doesn't publish the fixes of delayed pilots """
+
+        publisher = self.send_fix(tracking_delay=10)
+        assert not publisher.add.called
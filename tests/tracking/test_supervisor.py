@@ -0,0 +1,14 @@
+from skylines.tracking.supervisor import bind_udp
+
+
+def test_bind_udp_reuse_port():
+    """ Several sockets can share a port with reuse_port """
+
+    sock1 = bind_udp(0, interface='127.0.0.1', reuse_port=True)
+    port = sock1.getsockname()[1]
+
+    sock2 = bind_udp(port, interface='127.0.0.1', reuse_port=True)
+    assert sock2.getsockname()[1] == port
+
+    sock1.close()
+    sock2.close()